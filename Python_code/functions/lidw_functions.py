@@ -25,9 +25,14 @@ import wget
 import warnings
 from pprint import pprint
 import zipfile
+import multiprocessing
+from multiprocessing import shared_memory
 
 from math import sin, cos, sqrt, atan2, radians
 import random
+import hashlib
+import logging
+import time
 from functools import partial
 
 import matplotlib.cm as cm
@@ -38,12 +43,19 @@ from matplotlib.colors import ListedColormap, LinearSegmentedColormap
 from osgeo import gdal, ogr, osr
 import pyproj
 from pyproj import transformer
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree, Delaunay
+import shapely
 from shapely.geometry import Point, Polygon, MultiPoint, MultiPolygon, shape, mapping
 from shapely.ops import voronoi_diagram, nearest_points, transform
 import fiona
 import rasterio
 import rasterio.mask
+import rasterio.windows
+import rasterio.shutil
 from rasterio.features import rasterize
+from rasterio.io import MemoryFile
 from rasterio.warp import calculate_default_transform, reproject, Resampling
 import geopandas as gpd
 import xlsxwriter
@@ -506,17 +518,9 @@ def extract_ghs_country_population_raster(x):
 
         out_image, out_transform = rasterio.mask.mask(src, polygons[0], crop=True, filled=True, nodata=-9999.0)
         out_meta = src.meta
-        out_meta.update({"driver": "GTiff",
-                             "height": out_image.shape[1],
-                             "width": out_image.shape[2],
-                             "nodata": -9999.0,
-                             #"dtype": float,
-                             "dtypes": float,
-                             "transform": out_transform})
 
-    # Define the output path for the settlement raster TIFF
-    with rasterio.open(output, "w", **out_meta) as dest:
-        dest.write(out_image)
+    # Write the population raster of the country in the data type of the global raster
+    write_geotiff(output, out_image, out_transform, nodata=-9999.0, dtype=out_meta['dtype'], crs=out_meta['crs'])
 
 # def ghsl_year(year: str):
     # Convert the input year from a string to an integer and compare it with 2015
@@ -903,6 +907,101 @@ def dhs_clusters_inside_subnational_divisions(path, locations, urban_rural):
 #       THE FUNCTIONS FOR WORKING WITH SHAPES AND RASTERS
 #---------------------------------------------------------------------------------------------------
 
+# Compression of the GeoTIFF rasters written by the package ('deflate', 'zstd' or 'lzw')
+raster_compression = 'deflate'
+
+
+def geotiff_profile(width, height, transform, dtype=rasterio.float32, nodata=-9999.0, crs='+proj=latlong', count=1,
+                    block_size=256, compress=None):
+    """
+    Returns the rasterio profile of a tiled, compressed GeoTIFF.
+
+    Args:
+        width (int): Number of columns.
+        height (int): Number of rows.
+        transform (Affine): Affine transform of the raster.
+        dtype (str): Data type of the raster.
+        nodata (float): Nodata value of the raster.
+        crs (str): Coordinate reference system of the raster.
+        count (int): Number of bands.
+        block_size (int): Size of the tiles (a multiple of 16).
+        compress (str): Compression, raster_compression when None.
+
+    Returns:
+        profile (dict): Profile to pass to rasterio.open in write mode.
+    """
+    dtype = np.dtype(dtype).name
+
+    # Floating point data compress better with the floating point predictor
+    predictor = 3 if np.issubdtype(np.dtype(dtype), np.floating) else 2
+
+    return dict(driver='GTiff', dtype=dtype, count=count, width=width, height=height, nodata=nodata, crs=crs,
+                transform=transform, tiled=True, blockxsize=block_size, blockysize=block_size,
+                compress=compress or raster_compression, predictor=predictor, BIGTIFF='IF_SAFER')
+
+
+def copy_cloud_optimized_geotiff(source, path, resampling='average', block_size=256, compress=None):
+    """
+    Copies a raster to a Cloud-Optimized GeoTIFF with internal overviews.
+
+    The copy is streamed by GDAL tile by tile, so it does not hold the raster in memory.
+
+    Args:
+        source (str): Path to the raster, or an open rasterio dataset.
+        path (str): Path to the Cloud-Optimized GeoTIFF.
+        resampling (str): Resampling of the overviews ('average' for estimates, 'nearest' for classes).
+        block_size (int): Size of the tiles.
+        compress (str): Compression, raster_compression when None.
+    """
+    rasterio.shutil.copy(source, path, driver='COG', COMPRESS=(compress or raster_compression).upper(),
+                         PREDICTOR='YES', BLOCKSIZE=block_size, OVERVIEW_RESAMPLING=resampling.upper(),
+                         BIGTIFF='IF_SAFER')
+
+
+def cloud_optimize_geotiff(path, resampling='average', block_size=256, compress=None):
+    """
+    Rewrites a GeoTIFF as a Cloud-Optimized GeoTIFF with internal overviews.
+
+    Args:
+        path (str): Path to the GeoTIFF, which is replaced.
+        resampling (str): Resampling of the overviews ('average' for estimates, 'nearest' for classes).
+        block_size (int): Size of the tiles.
+        compress (str): Compression, raster_compression when None.
+    """
+    temporary = path[:-4] + '.cog.tif'
+    copy_cloud_optimized_geotiff(path, temporary, resampling, block_size, compress)
+    os.replace(temporary, path)
+
+
+def write_geotiff(path, array, transform, nodata=-9999.0, dtype=rasterio.float32, crs='+proj=latlong',
+                  resampling='average', compress=None):
+    """
+    Writes an array as a compressed Cloud-Optimized GeoTIFF with internal overviews.
+
+    Args:
+        path (str): Path to the GeoTIFF.
+        array (numpy.ndarray): Array of shape (rows, cols) or (bands, rows, cols), cast to dtype.
+        transform (Affine): Affine transform of the raster.
+        nodata (float): Nodata value of the raster.
+        dtype (str): Data type of the raster.
+        crs (str): Coordinate reference system of the raster.
+        resampling (str): Resampling of the overviews ('average' for estimates, 'nearest' for classes).
+        compress (str): Compression, raster_compression when None.
+    """
+    array = np.asarray(array)
+    if array.ndim == 2:
+        array = array[None]
+
+    # Hold the array in an uncompressed in-memory GeoTIFF with the declared data type, and write the COG
+    # from it in a single pass
+    profile = geotiff_profile(array.shape[2], array.shape[1], transform, dtype, nodata, crs, array.shape[0])
+    profile.update(compress='none', predictor=1)
+    with MemoryFile() as memfile:
+        with memfile.open(**profile) as mem:
+            mem.write(array.astype(profile['dtype'], copy=False))
+            copy_cloud_optimized_geotiff(mem, path, resampling, compress=compress)
+
+
 def reproject_tif(input_tif_path, output_tif_path):
 
     dst_crs = 'EPSG:4326'
@@ -911,13 +1010,7 @@ def reproject_tif(input_tif_path, output_tif_path):
         transform, width, height = calculate_default_transform(
             src.crs, dst_crs, src.width, src.height, *src.bounds)
 
-        kwargs = src.meta.copy()
-        kwargs.update({
-            'crs': dst_crs,
-            'transform': transform,
-            'width': width,
-            'height': height
-        })
+        kwargs = geotiff_profile(width, height, transform, src.dtypes[0], src.nodata, dst_crs, src.count)
 
         with rasterio.open(output_tif_path, 'w', **kwargs) as dst:
             for i in range(1, src.count + 1):
@@ -930,6 +1023,9 @@ def reproject_tif(input_tif_path, output_tif_path):
                     dst_crs=dst_crs,
                     resampling=Resampling.nearest)
 
+    # Add the overviews and the cloud-optimized layout
+    cloud_optimize_geotiff(output_tif_path, 'nearest')
+
 def find_nearest_smod_year(target_year):
     available_years = [1995, 2000, 2005, 2010, 2015, 2020, 2025]
     return min(available_years, key=lambda x: abs(x - int(target_year)))
@@ -1014,8 +1110,8 @@ def polygonize_settlements(country: str, year: str):
                 output = data_root + country + '/' + CODE + settl_year + '.tif'
 
                 # Create the settlement raster TIFF and write the reclassified data to it
-                with rasterio.open(output, "w", **out_meta) as dest:
-                    dest.write(out_image)
+                write_geotiff(output, out_image, out_transform, nodata=out_meta['nodata'], dtype=out_meta['dtype'],
+                              crs=out_meta['crs'], resampling='nearest')
 
             # Open the created raster file and create a corresponding shapefile with polygonized settlements
             raster = gdal.Open(output)
@@ -1220,33 +1316,134 @@ def list_of_shapes(path_to_shapefile):
 
 
 
+#       THE FUNCTIONS FOR DISTANCES
+#---------------------------------------------------------------------------------------------------
+
+# Earth's radius in kilometers, the same convention as distance()
+earth_radius_km = 6373.0
+
+
+def haversine(lon1, lat1, lon2, lat2, dtype=np.float64):
+    """
+    Haversine distance in kilometers between arrays of locations, with numpy broadcasting.
+
+    Args:
+        lon1 (numpy.ndarray): Longitudes of the first locations in degrees.
+        lat1 (numpy.ndarray): Latitudes of the first locations in degrees.
+        lon2 (numpy.ndarray): Longitudes of the second locations in degrees.
+        lat2 (numpy.ndarray): Latitudes of the second locations in degrees.
+        dtype (numpy.dtype): Floating point type of the computation (numpy.float64 or numpy.float32).
+
+    Returns:
+        distance_km (numpy.ndarray): Distances with the broadcast shape of the inputs.
+    """
+    # Convert the coordinates from degrees to radians
+    lon1, lat1 = np.radians(np.asarray(lon1, dtype=dtype)), np.radians(np.asarray(lat1, dtype=dtype))
+    lon2, lat2 = np.radians(np.asarray(lon2, dtype=dtype)), np.radians(np.asarray(lat2, dtype=dtype))
+
+    # Square of half the chord length between the locations
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+
+    # Angular distance multiplied by the Earth's radius
+    return dtype(earth_radius_km) * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def pairwise_distances(locations1, locations2=None, dtype=np.float64):
+    """
+    Matrix of haversine distances between two lists of locations.
+
+    Args:
+        locations1 (list): List of (longitude, latitude) locations.
+        locations2 (list): List of (longitude, latitude) locations, locations1 when None.
+        dtype (numpy.dtype): Floating point type of the computation.
+
+    Returns:
+        distance_km (numpy.ndarray): Array of shape (len(locations1), len(locations2)).
+    """
+    locations1 = np.reshape(np.asarray(locations1, dtype=dtype), (-1, 2))
+    locations2 = locations1 if locations2 is None else np.reshape(np.asarray(locations2, dtype=dtype), (-1, 2))
+
+    return haversine(locations1[:, 0, None], locations1[:, 1, None], locations2[None, :, 0], locations2[None, :, 1],
+                     dtype=dtype)
+
+
+def distances_from(location, locations, dtype=np.float64):
+    """
+    Haversine distances from one location to a list of locations.
+
+    Args:
+        location (tuple): (longitude, latitude) location.
+        locations (list): List of (longitude, latitude) locations.
+        dtype (numpy.dtype): Floating point type of the computation.
+
+    Returns:
+        distance_km (numpy.ndarray): Array of shape (len(locations),).
+    """
+    locations = np.reshape(np.asarray(locations, dtype=dtype), (-1, 2))
+
+    return haversine(location[0], location[1], locations[:, 0], locations[:, 1], dtype=dtype)
+
+
+def gather_distances(x, y, locations, index, dtype=np.float64):
+    """
+    Haversine distances from points to their own lists of neighbour locations.
+
+    Args:
+        x (numpy.ndarray): Longitudes of the points (for example pixel centres).
+        y (numpy.ndarray): Latitudes of the points.
+        locations (list): List of (longitude, latitude) locations.
+        index (numpy.ndarray): Array of shape (points, neighbours) with the location indices of every point.
+        dtype (numpy.dtype): Floating point type of the computation.
+
+    Returns:
+        distance_km (numpy.ndarray): Array with the shape of index.
+    """
+    locations = np.reshape(np.asarray(locations, dtype=dtype), (-1, 2))
+
+    return haversine(np.asarray(x)[:, None], np.asarray(y)[:, None], locations[index, 0], locations[index, 1],
+                     dtype=dtype)
+
+
+
+
 #       THE FUNCTIONS FOR NETWORK CONSTRUCTION
 #---------------------------------------------------------------------------------------------------
 
+def voronoi_cells_to_sites(cells, locations):
+    """
+    Matches Voronoi cells to the locations they contain with one bulk spatial query.
+
+    Args:
+        cells (list): List of Voronoi polygons.
+        locations (list): List of locations (coordinates).
+
+    Returns:
+        site (numpy.ndarray): Index of the first location within each cell, -1 for cells without a location.
+    """
+    # Query all locations at once with the same predicate as point.within(polygon)
+    tree = shapely.STRtree(cells)
+    point_idx, cell_idx = tree.query(shapely.points(np.reshape(np.asarray(locations, dtype=float), (-1, 2))), predicate='within')
+
+    # Keep the first location of each cell, as the scalar loop stopped at the first match
+    site = np.full(len(cells), len(locations), dtype=np.int64)
+    np.minimum.at(site, cell_idx, point_idx)
+    site[site == len(locations)] = -1
+
+    return site
+
+
 def voronoi_raw_regions(locations):
     # Create a MultiPoint object from the new locations
     points = MultiPoint(locations)
 
     # Compute the Voronoi diagram for the points
-    polygons = voronoi_diagram(points)
-
-    # Create a list to store the regions
-    regions = []
+    polygons = list(voronoi_diagram(points).geoms)
 
-    # Iterate over the Voronoi polygons
-    for polygon in polygons.geoms:
+    # Match each Voronoi polygon with the location it contains
+    site = voronoi_cells_to_sites(polygons, locations)
 
-
-        # Iterate over the original locations
-        for i, l in enumerate(locations):
-            # Create a Point object from the location
-            point = Point(l)
-
-            # Check if the point is within the current Voronoi polygon
-            if point.within(polygon):
-                # Store the region information as a tuple of the polygon, location, and index
-                regions.append([polygon, l, i])
-                break
+    # Store the region information as a tuple of the polygon, location, and index
+    regions = [[polygon, locations[i], i] for polygon, i in zip(polygons, site.tolist()) if i >= 0]
 
     # Return the list of regions
     return regions
@@ -1254,10 +1451,28 @@ def voronoi_raw_regions(locations):
 
 
 
-def voronoi_regions(locations, country_shape):
+def voronoi_regions(locations, country_shape, simplify_tolerance=None):
+    """
+    Computes the Voronoi regions of the cluster locations, clipped to the country polygon.
+
+    Args:
+        locations (list): List of cluster locations (coordinates).
+        country_shape (GeoDataFrame): Country shape.
+        simplify_tolerance (float): Optional tolerance (in degrees) used to simplify the country polygon before clipping.
+
+    Returns:
+        regions (list): List of [intersection, location, index] for each location.
+    """
     # Extract the polygon representing the country
     country_polygon = country_shape['geometry'][0]
 
+    # Optionally simplify the country border, which speeds up the clipping of large countries
+    if simplify_tolerance is not None:
+        country_polygon = country_polygon.simplify(simplify_tolerance, preserve_topology=True)
+
+    # Prepare the country polygon for the containment tests
+    shapely.prepare(country_polygon)
+
     # Append the country bounds to the locations list
     new_locations = append_country_bounds_to_locations(locations, country_shape)
 
@@ -1265,26 +1480,26 @@ def voronoi_regions(locations, country_shape):
     points = MultiPoint(new_locations)
 
     # Compute the Voronoi diagram for the points
-    polygons = voronoi_diagram(points)
+    polygons = np.array(list(voronoi_diagram(points).geoms), dtype=object)
 
-    # Create a list to store the regions
-    regions = [None for _ in locations]
+    # Match each Voronoi polygon with the original location it contains
+    site = voronoi_cells_to_sites(polygons, locations)
+    polygons = polygons[site >= 0]
+    site = site[site >= 0]
 
-    # Iterate over the Voronoi polygons
-    for polygon in polygons.geoms:
-        # Find the intersection between the country polygon and the current Voronoi polygon
-        intersect = country_polygon.intersection(polygon)
+    # Cells inside the country are kept whole, cells outside are empty, only the others are intersected
+    intersect = np.array([Polygon() for _ in polygons], dtype=object)
+    inside = shapely.contains_properly(country_polygon, polygons)
+    border = shapely.intersects(country_polygon, polygons) & ~inside
+    intersect[inside] = polygons[inside]
+    intersect[border] = shapely.intersection(country_polygon, polygons[border])
 
-        # Iterate over the original locations
-        for i, l in enumerate(locations):
-            # Create a Point object from the location
-            point = Point(l)
+    # Create a list to store the regions
+    regions = [None for _ in locations]
 
-            # Check if the point is within the current Voronoi polygon
-            if point.within(polygon):
-                # Store the region information as a tuple of the intersection, location, and index
-                regions[i] = [intersect, l, i]
-                break
+    # Store the region information as a tuple of the intersection, location, and index
+    for polygon, i in zip(intersect, site.tolist()):
+        regions[i] = [polygon, locations[i], i]
 
     # Return the list of regions
     return regions
@@ -1320,6 +1535,144 @@ def dhs_clusters_network(regions, self_loop=False):
     return net
 
 
+def triangle_edges(simplices, num_sites):
+    """
+    Lists the edges of a set of triangles with the triangles on each side.
+
+    Args:
+        simplices (numpy.ndarray): Array of shape (triangles, 3) with the site indices of the triangles.
+        num_sites (int): Number of sites.
+
+    Returns:
+        a (numpy.ndarray): Smaller site index of every edge.
+        b (numpy.ndarray): Larger site index of every edge.
+        t1 (numpy.ndarray): Index of a triangle containing the edge.
+        t2 (numpy.ndarray): Index of the other triangle containing the edge, -1 when there is none.
+    """
+    a = np.concatenate([simplices[:, 1], simplices[:, 2], simplices[:, 0]])
+    b = np.concatenate([simplices[:, 2], simplices[:, 0], simplices[:, 1]])
+    t = np.tile(np.arange(len(simplices)), 3)
+
+    # Sort the sides by edge, the two sides of an edge are then next to each other
+    a, b = np.minimum(a, b), np.maximum(a, b)
+    order = np.argsort(a * num_sites + b, kind='stable')
+    _, first, counts = np.unique((a * num_sites + b)[order], return_index=True, return_counts=True)
+    second = np.minimum(first + 1, len(order) - 1)
+
+    return (a[order[first]], b[order[first]], t[order[first]],
+            np.where(counts > 1, t[order[second]], -1))
+
+
+def voronoi_edges_touching(sites, simplices, a, b, t1, t2, country_polygon):
+    """
+    Tests which Voronoi edges, dual to Delaunay edges, touch the country polygon.
+
+    Args:
+        sites (numpy.ndarray): Coordinates of the sites of the triangulation.
+        simplices (numpy.ndarray): Array of shape (triangles, 3) with the site indices of the triangles.
+        a (numpy.ndarray): First site of every Delaunay edge.
+        b (numpy.ndarray): Second site of every Delaunay edge.
+        t1 (numpy.ndarray): Index of a triangle containing the edge.
+        t2 (numpy.ndarray): Index of the other triangle containing the edge, -1 on the hull of the triangulation.
+        country_polygon (Polygon): Prepared country polygon.
+
+    Returns:
+        touch (numpy.ndarray): Boolean mask of the edges whose Voronoi edge touches the country polygon.
+    """
+    # Circumcentres of the triangles are the vertices of the Voronoi diagram
+    p0, p1, p2 = sites[simplices[:, 0]], sites[simplices[:, 1]], sites[simplices[:, 2]]
+    d = 2 * ((p1[:, 0] - p0[:, 0]) * (p2[:, 1] - p0[:, 1]) - (p2[:, 0] - p0[:, 0]) * (p1[:, 1] - p0[:, 1]))
+    s1 = np.sum((p1 - p0) ** 2, axis=1)
+    s2 = np.sum((p2 - p0) ** 2, axis=1)
+    centre = p0 + np.column_stack([(p2[:, 1] - p0[:, 1]) * s1 - (p1[:, 1] - p0[:, 1]) * s2,
+                                   (p1[:, 0] - p0[:, 0]) * s2 - (p2[:, 0] - p0[:, 0]) * s1]) / d[:, None]
+
+    # The shared Voronoi edge joins the circumcentres of the two triangles on each side of the Delaunay edge
+    start = centre[t1]
+    end = centre[np.where(t2 >= 0, t2, 0)]
+
+    # Edges on the hull of the triangulation are rays, pointing away from the opposite vertex
+    hull = t2 < 0
+    if np.any(hull):
+        mid = (sites[a[hull]] + sites[b[hull]]) / 2
+        normal = np.column_stack([sites[b[hull], 1] - sites[a[hull], 1], sites[a[hull], 0] - sites[b[hull], 0]])
+        opposite = np.sum(simplices[t1[hull]], axis=1) - a[hull] - b[hull]
+        normal *= np.where(np.sum((mid - sites[opposite]) * normal, axis=1) < 0, -1, 1)[:, None]
+        extent = np.ptp(sites, axis=0).max() * 10
+        end[hull] = start[hull] + normal / np.linalg.norm(normal, axis=1)[:, None] * extent
+
+    # The Voronoi edges as segments (or long segments along the rays)
+    segments = shapely.linestrings(np.stack([start, end], axis=1))
+
+    return shapely.intersects(country_polygon, segments)
+
+
+def delaunay_clusters_network(locations, country_shape=None, bounds=None, self_loop=False, clip=True):
+    """
+    Builds the network of neighbouring Voronoi regions from a Delaunay triangulation of the cluster sites.
+
+    Two Voronoi cells share an edge exactly when their sites are joined by a Delaunay edge, so the
+    network of dhs_clusters_network is obtained in O(n log n) instead of testing every pair of polygons.
+    The four bounding points of append_country_bounds_to_locations (or the given bounds) are included
+    in the triangulation, as they are in voronoi_regions. When the regions are clipped to the country
+    polygon, two clusters are only linked if their shared Voronoi edge touches the country polygon,
+    which is when the clipped regions intersect. Cells that only meet at a single vertex (four or more
+    co-circular sites) are not linked.
+
+    Args:
+        locations (list): List of cluster locations (coordinates).
+        country_shape (GeoDataFrame): Country shape, used for the bounding points and the clipping polygon.
+        bounds (list): Bounding points to use instead of those of the country shape.
+        self_loop (bool): Whether each cluster is connected to itself in the network.
+        clip (bool): Whether the regions are clipped to the country polygon.
+
+    Returns:
+        net (list): Network representation as a list of lists, with the neighbours of each cluster in increasing order.
+    """
+    n = len(locations)
+
+    # Add the bounding points that close the Voronoi cells of the border clusters
+    if bounds is not None:
+        sites = np.append(np.reshape(locations, (-1, 2)), bounds, axis=0)
+    else:
+        sites = append_country_bounds_to_locations(np.reshape(locations, (-1, 2)), country_shape)
+
+    # Triangulate the sites
+    tri = Delaunay(sites)
+    simplices = tri.simplices
+
+    # Every side of a triangle is a Delaunay edge; the neighbour opposite to vertex k shares the side (k+1, k+2)
+    a = np.concatenate([simplices[:, 1], simplices[:, 2], simplices[:, 0]])
+    b = np.concatenate([simplices[:, 2], simplices[:, 0], simplices[:, 1]])
+    t1 = np.tile(np.arange(len(simplices)), 3)
+    t2 = np.concatenate([tri.neighbors[:, 0], tri.neighbors[:, 1], tri.neighbors[:, 2]])
+
+    # Keep each edge once, and only the edges between clusters
+    a, b = np.minimum(a, b), np.maximum(a, b)
+    _, first = np.unique(a * len(sites) + b, return_index=True)
+    first = first[b[first] < n]
+    a, b, t1, t2 = a[first], b[first], t1[first], t2[first]
+
+    if clip and country_shape is not None and len(a) > 0:
+        # Keep the edges whose shared Voronoi edge touches the country polygon
+        country_polygon = country_shape['geometry'][0]
+        shapely.prepare(country_polygon)
+        touch = voronoi_edges_touching(sites, simplices, a, b, t1, t2, country_polygon)
+        a, b = a[touch], b[touch]
+
+    # Create the network, with or without self-loops
+    net = [[i] if self_loop == True else [] for i in range(n)]
+
+    # Add every edge in both directions, in increasing order of the neighbour index
+    order = np.lexsort((np.concatenate([b, a]), np.concatenate([a, b])))
+    source, target = np.concatenate([a, b])[order], np.concatenate([b, a])[order]
+    for i, j in zip(source.tolist(), target.tolist()):
+        net[i].append(j)
+
+    # Return the network representation
+    return net
+
+
 def dhs_settlements_network(path, settlement_dhs, net):
     """
     Constructs a network of settlements based on their DHS clusters and a given network representation.
@@ -1380,6 +1733,9 @@ def dhs_settlements_networkx(path, settlement_dhs, settlement_id, net):
         # Initialize an empty weighted graph using NetworkX
         G = nx.Graph()
 
+        # Edges of the graph and the nearest points of their settlements
+        edges, nearest = [], []
+
         # Check for common DHS clusters between settlements and add edges with weights based on distances
         for i in range(len(settlement_dhs)):
             A = set(settlement_dhs[i])
@@ -1395,9 +1751,9 @@ def dhs_settlements_networkx(path, settlement_dhs, settlement_id, net):
                     li = nps[0].coords[0]
                     lj = nps[1].coords[0]
 
-                    # Calculate the distance between the nearest points and add an edge to the graph with the distance as weight
-                    d = distance(li, lj)
-                    G.add_edge(i, j, weight=d)
+                    # Keep the edge and its nearest points, the distances are computed at once
+                    edges.append((i, j))
+                    nearest.append((li, lj))
 
         # Check for common neighbors based on the network representation and add edges with weights based on distances
         for i in range(len(settlement_dhs)):
@@ -1418,9 +1774,14 @@ def dhs_settlements_networkx(path, settlement_dhs, settlement_id, net):
                     li = nps[0].coords[0]
                     lj = nps[1].coords[0]
 
-                    # Calculate the distance between the nearest points and add an edge to the graph with the distance as weight
-                    d = distance(li, lj)
-                    G.add_edge(i, j, weight=d)
+                    # Keep the edge and its nearest points, the distances are computed at once
+                    edges.append((i, j))
+                    nearest.append((li, lj))
+
+        # Calculate the distances between the nearest points and add the edges with the distances as weights
+        nearest = np.reshape(np.asarray(nearest, dtype=float), (-1, 2, 2))
+        d = haversine(nearest[:, 0, 0], nearest[:, 0, 1], nearest[:, 1, 0], nearest[:, 1, 1])
+        G.add_weighted_edges_from((i, j, w) for (i, j), w in zip(edges, d.tolist()))
 
     return G
 
@@ -1522,293 +1883,2926 @@ def nodes_position(dhs_settlement_id, settlement_representative_point):
     return position
 
 
-def local_inverse_distance_weighting_interpolation(x):
-    # Unpack the tuple 'x' containing 'country', 'year', and 'indicator'
-    country, year, indicator = x
+def raster_pixel_centers(transform, rows, cols):
+    """
+    Computes the coordinates of the pixel centres for arrays of raster indices.
 
-    # Print the provided country, year, and indicator values
-    print(country, year, indicator)
+    Args:
+        transform (Affine): Affine transform of the raster.
+        rows (numpy.ndarray): Row indices of the pixels.
+        cols (numpy.ndarray): Column indices of the pixels.
 
-    # Obtain the country's alpha-3 code from the function get_country_alpha3_code(country)
-    code, CODE = get_country_alpha3_code(country)
+    Returns:
+        x (numpy.ndarray): Longitudes of the pixel centres.
+        y (numpy.ndarray): Latitudes of the pixel centres.
+    """
+    # Unpack the coefficients of the affine transform
+    a, b, c, d, e, f = transform[:6]
 
-    # Get the path to the indicator CSV file and the shapefile for the country
-    path_to_indicator_file = dhs_csv_file(country, year)
-    path_to_shapefile = country_shapefile(country)
+    # Shift the indices to the pixel centres, as raster.xy(i, j) does
+    cols = np.asarray(cols) + 0.5
+    rows = np.asarray(rows) + 0.5
 
-    # Read the indicator CSV file into a pandas DataFrame
-    df = pd.read_csv(path_to_indicator_file)
+    # Apply the affine transform in the same order of operations as Affine * (col, row)
+    x = cols * a + rows * b + c
+    y = cols * d + rows * e + f
 
-    # Keep only relevant columns from the DataFrame (including 'cluster', the indicator, longitude, and latitude)
-    df = df[['cluster', indicator, 'LNG', 'LAT']]
+    return x, y
 
-    # Remove spurious data from the DataFrame using a custom function removing_spurious_data(df)
-    df = removing_spurious_data(df)
 
-    # Drop rows with missing values in the DataFrame
-    df = df.dropna()
+def voronoi_site_locator(locations, country_shape=None, bounds=None, clip=True):
+    """
+    Builds a nearest-site locator that answers Voronoi region lookups without polygon tests.
 
-    # Extract the indicator percentages from the DataFrame as a list
-    indicator_percentages = df[indicator].tolist()
+    A point lies in the Voronoi cell of the site it is closest to, so the region of a point is
+    found with a KD-tree query over the cluster locations plus the four bounding points added by
+    append_country_bounds_to_locations. The Voronoi diagram of voronoi_diagram is planar in
+    longitude/latitude, so the search uses the same planar (Euclidean) metric.
 
-    # Check if there are indicator percentages available in the DataFrame
-    if len(indicator_percentages) > 0:
-        # Read the country shapefile into a GeoDataFrame
-        country_shape = gpd.read_file(path_to_shapefile)
+    Args:
+        locations (list): List of cluster locations (coordinates).
+        country_shape (GeoDataFrame): Country shape, used for the bounding points and the clipping polygon.
+        bounds (list): Bounding points to use instead of those of the country shape.
+        clip (bool): Whether regions are clipped to the country polygon, as in voronoi_regions.
 
-        # Get the locations of DHS clusters from the DataFrame as a list of (longitude, latitude) tuples
-        locations = dhs_cluster_locations(df)
+    Returns:
+        locator (dict): Dictionary with the KD-tree, the sites and the clipping polygon.
+    """
+    # Add the bounding points that close the Voronoi cells of the border clusters
+    if bounds is not None:
+        sites = np.append(np.reshape(locations, (-1, 2)), bounds, axis=0)
+    elif country_shape is not None:
+        sites = append_country_bounds_to_locations(np.reshape(locations, (-1, 2)), country_shape)
+    else:
+        sites = np.reshape(np.asarray(locations, dtype=float), (-1, 2))
 
-        # Create Voronoi polygons based on the cluster locations and the country shape
-        regions = voronoi_regions(locations, country_shape)
+    # Prepare the country polygon for fast point-in-polygon tests
+    polygon = None
+    if clip and country_shape is not None:
+        polygon = country_shape['geometry'][0]
+        shapely.prepare(polygon)
 
-        # Create a network representation of regions based on intersection polygons (including self-loops)
-        net = dhs_clusters_network(regions, self_loop=True)
+    return {'tree': cKDTree(sites), 'sites': sites, 'num_locations': len(locations), 'polygon': polygon}
 
-        # Get the path to the population raster for the country and year
-        path_to_population_raster = population_raster(country,year)
 
-        # Read the population raster using rasterio
-        raster = rasterio.open(path_to_population_raster)
-        band = raster.read(1)
+def locate_voronoi_sites(locator, x, y):
+    """
+    Finds the Voronoi region of many points in a single batched query.
 
-        # Get height, width, and nodata value from the raster
-        height = raster.height
-        width = raster.width
-        nodata = raster.nodata
-
-        # Get the known pixels' indices (DHS cluster locations) in the raster
-        known_pixels = [raster.index(x, y) for x, y in locations]
-
-        # Create an empty grid to store the indicator values
-        grid = np.full((height, width), -9999.0, dtype=float)
-
-        # Fill the grid with the known indicator percentages at the corresponding locations
-        for e, p in zip(known_pixels, indicator_percentages):
-            grid[e[0], e[1]] = p
-
-        # Perform local inverse distance weighting interpolation for unknown indicator values
-        for i in range(height):
-            for j in range(width):
-                if grid[i, j] < 0.0 and band[i, j] > 0.0:
-                    loc = raster.xy(i, j)
-                    point = Point(loc)
-                    # Find the regions that have influence on the current pixel (point) and calculate weights
-                    for k in range(len(regions)):
-                        polygon = regions[k][0]
-                        if point.within(polygon):
-                            weight = [1.0 / distance(loc, regions[a][1]) for a in net[k]]
-                            predict = [indicator_percentages[regions[a][2]] * w / sum(weight)
-                                       for a, w in zip(net[k], weight)]
-                            grid[i, j] = sum(predict)
-                            break
-
-        # Define the subfolder to save the interpolated TIFF file
-        subfolder = f"{result_root}{country}/{year}/tiff/"
-        if not os.path.exists(subfolder):
-            os.makedirs(subfolder)
+    The result matches point.within(region) for the regions of voronoi_regions: points on the
+    border between two cells (equidistant from two distinct sites), points in the cells of the
+    bounding points, and points on or outside the border of the country polygon belong to no region.
 
-        # Define the output path for the interpolated TIFF file
-        output_path = f"{subfolder}{code}_{year}_idw_{indicator[4:]}.tif"
-
-        # Create a new raster using rasterio to save the interpolated values as a TIFF file
-        with rasterio.open(
-            output_path, 'w',
-            driver='GTiff',
-            dtype=rasterio.float32,
-            count=1,
-            width=width,
-            height=height,
-            nodata=-9999.0,
-            #nodatavals=raster.nodatavals,
-            crs='+proj=latlong',
-            transform=raster.transform  # Affine.translation(left, top) * Affine.scale(scale)
-        ) as dst:
-            dst.write(grid, indexes=1)
+    Args:
+        locator (dict): Locator as returned by voronoi_site_locator.
+        x (numpy.ndarray): Longitudes of the points.
+        y (numpy.ndarray): Latitudes of the points.
 
+    Returns:
+        region (numpy.ndarray): Index of the cluster whose region contains each point, -1 for points outside all regions.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    sites = locator['sites']
 
-def settlement_intersect_with_region(path_to_settlement_shapefile, regions):
-    # Open the settlement shapefile using fiona
-    with fiona.open(path_to_settlement_shapefile, "r") as shapefile:
-        # Extract coordinates of settlement shapes
-        shapes = [feature["geometry"]["coordinates"][0] for feature in shapefile]
+    if len(x) == 0:
+        return np.zeros(0, dtype=np.int64)
 
-        # Initialize lists to store intersections
-        settlement_intersections = [[] for _ in shapes]
-        region_intersections = [[] for _ in regions]
+    # Query the two nearest sites to detect points on a cell border
+    k = min(2, len(sites))
+    d, idx = locator['tree'].query(np.column_stack([x, y]), k=k)
+    d, idx = np.reshape(d, (len(x), k)), np.reshape(idx, (len(x), k))
+    region = idx[:, 0].astype(np.int64)
 
-        # Iterate through settlements
-        for i, settlement in enumerate(shapes):
-            settlement = Polygon(settlement)
+    if k == 2:
+        # Sites with identical coordinates share one cell, which belongs to the first of them
+        same_site = np.all(sites[idx[:, 0]] == sites[idx[:, 1]], axis=1)
+        region = np.where(same_site & (d[:, 0] == d[:, 1]), np.minimum(idx[:, 0], idx[:, 1]), region)
 
-            # Iterate through regions
-            for j, region in enumerate(regions):
-                region = region[0]
-                # Check for intersection between settlement and region
-                if settlement.intersects(region):
-                    settlement_intersections[i].append(j)
-                    region_intersections[j].append(i)
+        # Points equidistant from two distinct sites lie on a cell border
+        region[(d[:, 0] == d[:, 1]) & ~same_site] = -1
 
-    return settlement_intersections, region_intersections
+    # Points in the cells of the bounding points are outside all regions
+    region[region >= locator['num_locations']] = -1
 
+    # Points on or outside the border of the country polygon are outside the clipped regions
+    if locator['polygon'] is not None:
+        region[~shapely.contains_xy(locator['polygon'], x, y)] = -1
 
-def dhs_estimation_for_settlements(numerator, denominator, dhs_settlement_clusters, dhs_settlement_id):
-    # Initialize a dictionary to store DHS estimations
-    dhs_estimation_dict = {}
+    return region
 
-    # Iterate through DHS settlement IDs
-    for i, id in enumerate(dhs_settlement_id):
-        # Get clusters within the current settlement
-        clusters_within_settlement = dhs_settlement_clusters[i]
 
-        # Calculate numerator and denominator sums for the settlement
-        n_dhs = np.sum([numerator[c] for c in clusters_within_settlement])
-        d_dhs = np.sum([denominator[c] for c in clusters_within_settlement])
+def idw_kernel(d, power=1.0):
+    # Inverse distance weights, power 1 is the LIDW weight 1/distance
+    return 1.0 / d ** power
 
-        # Calculate the DHS estimation (avoid division by zero)
-        tmp = np.nan
-        if d_dhs > 0:
-            tmp = n_dhs / d_dhs
 
-        # Store the estimation in the dictionary
-        dhs_estimation_dict[id] = tmp
+def gaussian_kernel(d, bandwidth=10.0):
+    # Gaussian weights with a bandwidth in kilometers, relative to the nearest neighbour of every row: the factor
+    # cancels in the normalised weights and keeps the weights of far points from all underflowing to zero
+    d = np.asarray(d, dtype=float)
+    nearest = np.min(d, axis=-1, keepdims=True) if d.size > 0 else d
+    return np.exp(-0.5 * ((d / bandwidth) ** 2 - (nearest / bandwidth) ** 2))
 
-    return dhs_estimation_dict
 
+def kernel_weights(d, kernel=None):
+    """
+    Unnormalised interpolation weights of the neighbours in every row of a distance array.
 
-def lidw_estimation_for_settlements(country, year, indicator, settlement_polygons, dhs_settlement_id, touched=True):
-    # Initialize a dictionary to store LIDW estimations
-    lidw_estimation_dict = {}
+    Rows whose kernel weights have no positive, finite sum fall back to the 1/distance weights, so that
+    their normalised weights are never 0/0.
 
-    # Iterate through DHS settlement IDs
-    for i, id in enumerate(dhs_settlement_id):
-        # Get the polygon shape for the current settlement
-        shapei = Polygon(settlement_polygons[id])
+    Args:
+        d (numpy.ndarray): Distances (km) of the neighbours along the last axis (inf for padding).
+        kernel (function): Interpolation kernel as returned by lidw_kernel; 1/distance when None.
 
-        # Get the path to the indicator raster for the given country, year, and indicator
-        path_to_indicator_raster = indicator_raster(country, year, indicator)
+    Returns:
+        weight (numpy.ndarray): Array of the shape of d with the weights.
+    """
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        inverse = 1.0 / d
+        if kernel is None:
+            return inverse
 
-        # Calculate the average raster value within the settlement polygon
-        lidw_estimation_dict[id] = average_raster_within_shape(path_to_indicator_raster, shapei, touched=touched)
+        weight = kernel(d)
+        total = np.sum(weight, axis=-1, keepdims=True)
 
-    return lidw_estimation_dict
+    return np.where(np.isfinite(total) & (total > 0), weight, inverse)
 
-#       THE FUNCTIONS FOR VALIDATION
-#---------------------------------------------------------------------------------------------------
 
+# Interpolation kernels and the name of their parameter
+lidw_kernels = {'idw': (idw_kernel, 'power'), 'gaussian': (gaussian_kernel, 'bandwidth')}
 
-def validation_network_level(x):
-    # Unpack the input tuple
-    country, year, indicator = x
 
-    print(x, '    starts')
+def lidw_kernel(name, parameter):
+    """
+    Returns an interpolation kernel mapping an array of distances (km) to unnormalised weights.
 
-    # Get alpha3 country code
-    code, CODE = get_country_alpha3_code(country)
+    Args:
+        name (str): Name of the kernel in lidw_kernels ('idw' or 'gaussian').
+        parameter (float): Parameter of the kernel (power of 'idw', bandwidth in km of 'gaussian').
 
-    # Paths to data files
-    path_to_dhs_file = dhs_csv_file(country, year)
-    path_to_shapefile = country_shapefile(country)
+    Returns:
+        kernel (functools.partial): Kernel function, which can be pickled to worker processes.
+    """
+    func, parameter_name = lidw_kernels[name]
 
-    # Read DHS data CSV file
-    df = pd.read_csv(path_to_dhs_file)
+    return partial(func, **{parameter_name: parameter})
 
-    # Select relevant columns and remove NaN rows
-    df = df[['cluster', indicator, 'LNG', 'LAT']]
-    df = removing_spurious_data(df)
-    df = df.dropna()
 
-    # Extract indicator values and cluster locations
-    indicator_percentages = df[indicator].tolist()
-    locations = dhs_cluster_locations(df)
+def lidw_kernel_key(kernel):
+    # Stable text identifying a kernel, empty for the default 1/distance weights
+    if kernel is None:
+        return ''
+    if isinstance(kernel, partial):
+        return f"{kernel.func.__name__}{sorted(kernel.keywords.items())}"
 
-    # Read country shapefile
-    country_shape = gpd.read_file(path_to_shapefile)
+    return kernel.__name__
 
-    # Extract boundaries from country shapefile
-    min_lng, min_lat, max_lng, max_lat = country_shape.total_bounds
-    boundaries = [(max_lng + 1, max_lat + 1), (min_lng - 1, max_lat + 1), (max_lng + 1, min_lat - 1), (min_lng - 1, min_lat - 1)]
+
+def lidw_variant_key(kernel=None, order=1):
+    # Text identifying a non-default kernel or neighbourhood order, empty for the default LIDW weights
+    return lidw_kernel_key(kernel) + (f":order{order}" if order > 1 else '')
+
+
+def network_neighbourhood(net, order=1):
+    """
+    Extends a network (including self-loops) to the neighbourhoods of a given order.
+
+    The neighbourhood of order 2 of a region holds its neighbours and their neighbours. Every
+    neighbourhood lists the region itself first and then the other regions in increasing order.
+
+    Args:
+        net (list): Network representation as a list of lists (including self-loops).
+        order (int): Order of the neighbourhoods.
+
+    Returns:
+        net (list): Network of the neighbourhoods of the given order.
+    """
+    if order <= 1:
+        return net
+
+    neighbourhood = [set(n) for n in net]
+    for _ in range(order - 1):
+        neighbourhood = [set().union(*[net[j] for j in n]) for n in neighbourhood]
+
+    return [[i] + sorted(n - {i}) for i, n in enumerate(neighbourhood)]
+
+
+def neighbour_table(net):
+    """
+    Converts a network list of lists into a rectangular array padded with -1.
+
+    Args:
+        net (list): Network representation as a list of lists, or a table that is returned as is.
+
+    Returns:
+        table (numpy.ndarray): Array of shape (len(net), max degree) with the neighbour indices of each node.
+    """
+    if isinstance(net, np.ndarray):
+        return net
+
+    # Find the largest neighbourhood in the network
+    degree = max([len(n) for n in net]) if len(net) > 0 else 0
+
+    # Fill the table row by row and pad the remaining cells with -1
+    table = np.full((len(net), degree), -1, dtype=np.int64)
+    for i, n in enumerate(net):
+        table[i, :len(n)] = n
+
+    return table
+
+
+def lidw_point_weights(x, y, locations, net, locator, kernel=None, region=None, dtype=np.float64):
+    """
+    Computes the local inverse distance weights of many points as array operations.
+
+    Args:
+        x (numpy.ndarray): Longitudes of the points.
+        y (numpy.ndarray): Latitudes of the points.
+        locations (list): List of cluster locations (coordinates).
+        net (list): Network of regions (including self-loops), or its neighbour_table.
+        locator (dict): Region locator as returned by voronoi_site_locator.
+        kernel (function): Interpolation kernel as returned by lidw_kernel; 1/distance when None.
+        region (numpy.ndarray): Regions of the points (-1 outside all regions), found with the locator when None.
+        dtype (numpy.dtype): Floating point type of the distances and weights.
+
+    Returns:
+        inside (numpy.ndarray): Boolean mask of the points that fall inside a region.
+        index (numpy.ndarray): Cluster indices of the neighbours of each inside point (padded with 0).
+        weight (numpy.ndarray): Normalised weights of the neighbours of each inside point (padded with 0).
+    """
+    # Find the region each point falls in
+    if region is None:
+        region = locate_voronoi_sites(locator, x, y)
+    inside = region >= 0
+
+    if not np.any(inside) or len(net) == 0:
+        return inside, np.zeros((np.sum(inside), 0), dtype=np.int64), np.zeros((np.sum(inside), 0), dtype=dtype)
+
+    # Gather the neighbour regions of every point (padded with -1)
+    nbr = neighbour_table(net)[region[inside]]
+    valid = nbr >= 0
+    nbr = np.where(valid, nbr, 0)
+
+    # Haversine distance between the points and the neighbour clusters (infinite for the padding)
+    d = gather_distances(np.asarray(x)[inside], np.asarray(y)[inside], locations, nbr, dtype)
+    d = np.where(valid, d, np.inf)
+
+    # Normalised inverse distance (or kernel) weights, zero for the padding
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        weight = np.where(valid, kernel_weights(d, kernel), 0.0)
+        weight = weight / np.sum(weight, axis=1)[:, None]
+
+    return inside, nbr, weight
+
+
+def lidw_pixel_weights(transform, rows, cols, locations, net, locator, kernel=None, region=None, dtype=np.float64):
+    """
+    Computes the local inverse distance weights of many pixels as array operations.
+
+    The weights depend only on the geometry, so they can be reused for every indicator
+    that shares the same set of DHS clusters.
+
+    Args:
+        transform (Affine): Affine transform of the raster.
+        rows (numpy.ndarray): Row indices of the pixels to interpolate.
+        cols (numpy.ndarray): Column indices of the pixels to interpolate.
+        locations (list): List of cluster locations (coordinates).
+        net (list): Network of regions (including self-loops), or its neighbour_table.
+        locator (dict): Region locator as returned by voronoi_site_locator.
+        kernel (function): Interpolation kernel as returned by lidw_kernel; 1/distance when None.
+        region (numpy.ndarray): Regions of the pixels (-1 outside all regions), found with the locator when None.
+        dtype (numpy.dtype): Floating point type of the distances and weights.
+
+    Returns:
+        inside (numpy.ndarray): Boolean mask of the pixels that fall inside a region.
+        index (numpy.ndarray): Cluster indices of the neighbours of each inside pixel (padded with 0).
+        weight (numpy.ndarray): Normalised weights of the neighbours of each inside pixel (padded with 0).
+    """
+    # Compute the pixel centres and weigh them as points
+    x, y = raster_pixel_centers(transform, rows, cols)
+
+    return lidw_point_weights(x, y, locations, net, locator, kernel, region, dtype)
+
+
+def lidw_apply_weights(inside, index, weight, indicator_percentages, std=False, dtype=float):
+    """
+    Combines the cluster values with precomputed pixel weights.
+
+    Args:
+        inside (numpy.ndarray): Boolean mask of the pixels that fall inside a region.
+        index (numpy.ndarray): Cluster indices of the neighbours of each inside pixel.
+        weight (numpy.ndarray): Normalised weights of the neighbours of each inside pixel.
+        indicator_percentages (list): Indicator values of the DHS clusters.
+        std (bool): Whether to also return the weighted standard deviation of the neighbour values.
+        dtype (numpy.dtype): Floating point type of the accumulation and of the results.
+
+    Returns:
+        predict (numpy.ndarray): Interpolated values, -9999.0 for pixels outside all regions.
+        spread (numpy.ndarray): Weighted standard deviations, -9999.0 for pixels outside all regions (only if std).
+    """
+    predict = np.full(len(inside), -9999.0, dtype=dtype)
+
+    # Weighted average of the neighbour values
+    values = np.asarray(indicator_percentages, dtype=dtype)
+    neighbour_values = values[index]
+    predict[inside] = np.sum(neighbour_values * weight, axis=1)
+
+    if not std:
+        return predict
+
+    # Weighted standard deviation sqrt(v2 - v1 * v1) from the same neighbour values (rounding can make it slightly negative)
+    spread = np.full(len(inside), -9999.0, dtype=dtype)
+    v1 = predict[inside]
+    v2 = np.sum(neighbour_values * neighbour_values * weight, axis=1)
+    spread[inside] = np.sqrt(np.maximum(v2 - v1 * v1, 0.0))
+
+    return predict, spread
+
+
+def valid_cluster_groups(df, indicators):
+    """
+    Groups indicators that have missing values in exactly the same DHS clusters.
+
+    Args:
+        df (DataFrame): DHS cluster data with the 'cluster', 'LNG', 'LAT' and indicator columns.
+        indicators (list): List of indicator column names.
+
+    Returns:
+        groups (list): List of (mask, indicators) pairs, where mask selects the rows that are valid for all indicators of the group.
+    """
+    groups = {}
+
+    for indicator in indicators:
+        # Rows kept by dropna() on the columns used for this indicator
+        mask = df[['cluster', indicator, 'LNG', 'LAT']].notna().all(axis=1).to_numpy()
+
+        # Indicators with the same valid rows share the same geometry
+        key = mask.tobytes()
+        if key not in groups:
+            groups[key] = (mask, [])
+        groups[key][1].append(indicator)
+
+    return list(groups.values())
+
+
+def cluster_set_hash(df):
+    """
+    Returns a short hash identifying a set of DHS clusters (numbers and coordinates).
+
+    Args:
+        df (DataFrame): DHS cluster data with the 'cluster', 'LNG' and 'LAT' columns.
+
+    Returns:
+        key (str): Hexadecimal hash of the cluster set.
+    """
+    h = hashlib.sha1()
+    for column in ['cluster', 'LNG', 'LAT']:
+        h.update(np.ascontiguousarray(df[column].to_numpy(dtype=float)).tobytes())
+
+    return h.hexdigest()[:16]
+
+
+def lidw_operator_path(country, year, df, path_to_population_raster, path_to_mask_shapefile=None, variant=''):
+    """
+    Returns the path of the cached LIDW weight operator for a country, year, cluster set and population raster.
+
+    Args:
+        country (str): Country name.
+        year (str): Survey year.
+        df (DataFrame): DHS cluster data used for the interpolation.
+        path_to_population_raster (str): Path to the population raster.
+        path_to_mask_shapefile (str): Path to the shapefile masking the interpolated pixels, if any.
+        variant (str): Text identifying a non-default kernel or neighbourhood order.
+
+    Returns:
+        path (str): Path to the .npz file of the operator.
+    """
+    # Obtain the country code
+    code, CODE = get_country_alpha3_code(country)
+
+    # Identify the population raster by its path, size and modification time
+    stat = os.stat(path_to_population_raster)
+    raster_key = f"{os.path.abspath(path_to_population_raster)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    # A masked operator is also identified by its mask shapefile
+    if path_to_mask_shapefile is not None:
+        stat = os.stat(path_to_mask_shapefile)
+        raster_key += f":{os.path.abspath(path_to_mask_shapefile)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    # Combine the cluster set and the raster into a single key
+    if variant:
+        raster_key += f":{variant}"
+    key = hashlib.sha1(f"{country}:{year}:{cluster_set_hash(df)}:{raster_key}".encode()).hexdigest()[:16]
+
+    return f"{data_root}{country}/{year}/lidw/{code}_{year}_lidw_operator_{key}.npz"
+
+
+def settlement_mask_shapes(path_to_settlements_shapefile):
+    """
+    Reads the settlement polygons that make up the pixel masks of settlement_pixel_mask and settlement_window_mask.
+
+    Args:
+        path_to_settlements_shapefile (str): Path to the settlements shapefile.
+
+    Returns:
+        shapes (numpy.ndarray): Array of the settlement geometries.
+    """
+    with fiona.open(path_to_settlements_shapefile, "r") as shapefile:
+        geometries = [shape(feature["geometry"]) for feature in shapefile]
+
+    shapes = np.empty(len(geometries), dtype=object)
+    shapes[:] = geometries
+
+    return shapes
+
+
+def settlement_window_mask(transform, window, shapes):
+    """
+    Rasterizes the settlements on one window of the population raster.
+
+    Pixels touched by a settlement are included, as in average_raster_within_shape, so the windows
+    of a raster put together give the mask of settlement_pixel_mask.
+
+    Args:
+        transform (Affine): Affine transform of the population raster.
+        window (Window): Window of the raster.
+        shapes (numpy.ndarray): Settlement geometries, as returned by settlement_mask_shapes.
+
+    Returns:
+        mask (numpy.ndarray): Boolean array with the shape of the window, True on settlement pixels.
+    """
+    h, w = int(window.height), int(window.width)
+    col_off, row_off = int(window.col_off), int(window.row_off)
+
+    # Only the settlements whose bounds reach the window (with a margin of one pixel) are burnt
+    x0, y0 = transform * (col_off - 1, row_off - 1)
+    x1, y1 = transform * (col_off + w + 1, row_off + h + 1)
+    bounds = shapely.bounds(shapes) if len(shapes) > 0 else np.zeros((0, 4))
+    near = ((bounds[:, 0] <= max(x0, x1)) & (bounds[:, 2] >= min(x0, x1)) &
+            (bounds[:, 1] <= max(y0, y1)) & (bounds[:, 3] >= min(y0, y1)))
+
+    if not np.any(near):
+        return np.zeros((h, w), dtype=bool)
+
+    # Burn the settlements on the grid of the window
+    mask = rasterize([(geometry, 1) for geometry in shapes[near]], out_shape=(h, w),
+                     transform=rasterio.windows.transform(window, transform), fill=0, all_touched=True,
+                     dtype=np.uint8)
+
+    return mask.astype(bool)
+
+
+def settlement_pixel_mask(raster, path_to_settlements_shapefile):
+    """
+    Rasterizes the settlements to a mask of the pixels that are averaged within settlement polygons.
+
+    Pixels touched by a settlement are included, as in average_raster_within_shape.
+
+    Args:
+        raster (DatasetReader): Open population raster.
+        path_to_settlements_shapefile (str): Path to the settlements shapefile.
+
+    Returns:
+        mask (numpy.ndarray): Boolean array with the shape of the raster, True on settlement pixels.
+    """
+    # Burn all settlements at once on the grid of the population raster
+    return settlement_window_mask(raster.transform, rasterio.windows.Window(0, 0, raster.width, raster.height),
+                                  settlement_mask_shapes(path_to_settlements_shapefile))
+
+
+def settlement_mask_shapefile(country, year):
+    # The settlements of the nearest GHSL year are the ones aggregated by settlements_indicators_to_csv
+    path_to_settlements_shapefile = settlements_shapefile(country, str(nearest_settlement_year(year)))
+    if path_to_settlements_shapefile is None:
+        raise FileNotFoundError(f"Settlement shapefile not found for {country}, year {year}")
+
+    return path_to_settlements_shapefile
+
+
+def build_lidw_operator(raster, band, locations, net, locator, pixel_mask=None, kernel=None):
+    """
+    Builds the sparse (pixels x clusters) operator that maps cluster values to the LIDW raster.
+
+    Every populated pixel inside a region gets a row with its normalised inverse distance weights;
+    pixels holding a DHS cluster get a single weight of one for that cluster.
+
+    Args:
+        raster (DatasetReader): Open population raster.
+        band (numpy.ndarray): Population values of the raster.
+        locations (list): List of cluster locations (coordinates).
+        net (list): Network of regions as returned by dhs_clusters_network (including self-loops).
+        locator (dict): Region locator as returned by voronoi_site_locator.
+        pixel_mask (numpy.ndarray): Boolean mask of the pixels to interpolate; all populated pixels when None.
+        kernel (function): Interpolation kernel as returned by lidw_kernel; 1/distance when None.
+
+    Returns:
+        operator (dict): Dictionary with the CSR 'matrix', the 'rows' and 'cols' of its pixels, the 'region'
+            (cluster index) of each pixel and the raster 'shape'.
+    """
+    height, width = raster.height, raster.width
+
+    # The known pixels keep the value of their DHS cluster (the last cluster wins on shared pixels)
+    known = np.full((height, width), -1, dtype=np.int64)
+    for c, (x, y) in enumerate(locations):
+        i, j = raster.index(x, y)
+        known[i, j] = c
+
+    # Pixels outside the mask stay without an estimate
+    if pixel_mask is not None:
+        known[~pixel_mask] = -1
+        band = np.where(pixel_mask, band, 0.0)
+
+    # Pixels interpolated from their neighbourhood, with the region each of them falls in
+    rows, cols = np.nonzero((known < 0) & (band > 0.0))
+    region = locate_voronoi_sites(locator, *raster_pixel_centers(raster.transform, rows, cols))
+    inside, index, weight = lidw_pixel_weights(raster.transform, rows, cols, locations, net, locator, kernel, region)
+    rows, cols, region = rows[inside], cols[inside], region[inside]
+
+    # Rows of the interpolated pixels, without the padding of the neighbour table
+    valid = weight != 0.0
+    counts = np.sum(valid, axis=1)
+    indices = index[valid]
+    data = weight[valid]
+
+    # Rows of the known pixels, whose region is the one of their cluster
+    known_rows, known_cols = np.nonzero(known >= 0)
+    known_index = known[known_rows, known_cols]
+
+    # Assemble the CSR matrix directly, keeping the order of the neighbours within each row
+    indptr = np.concatenate([[0], np.cumsum(np.concatenate([counts, np.ones(len(known_index), dtype=np.int64)]))])
+    matrix = sparse.csr_matrix((np.concatenate([data, np.ones(len(known_index))]),
+                                np.concatenate([indices, known_index]),
+                                indptr), shape=(len(rows) + len(known_rows), len(locations)))
+
+    return {'matrix': matrix,
+            'rows': np.concatenate([rows, known_rows]),
+            'cols': np.concatenate([cols, known_cols]),
+            'region': np.concatenate([region, known_index]),
+            'shape': (height, width)}
+
+
+def save_lidw_operator(path, operator):
+    # Create the folder of the operator if it does not exist
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # Store the CSR arrays and the pixel indices in a single compressed file
+    matrix = operator['matrix']
+    np.savez_compressed(path, data=matrix.data, indices=matrix.indices, indptr=matrix.indptr,
+                        matrix_shape=matrix.shape, rows=operator['rows'], cols=operator['cols'],
+                        region=operator['region'], shape=operator['shape'])
+
+
+def load_lidw_operator(path):
+    # Read the arrays stored by save_lidw_operator (operators cached before the regions were stored have none)
+    with np.load(path) as f:
+        matrix = sparse.csr_matrix((f['data'], f['indices'], f['indptr']), shape=tuple(f['matrix_shape']))
+
+        return {'matrix': matrix, 'rows': f['rows'], 'cols': f['cols'],
+                'region': f['region'] if 'region' in f.files else None, 'shape': tuple(f['shape'])}
+
+
+def apply_lidw_operator(operator, indicator_percentages, nodata=-9999.0, std=False):
+    """
+    Produces an indicator grid from the LIDW operator with one sparse matrix-vector product.
+
+    Args:
+        operator (dict): Operator as returned by build_lidw_operator or load_lidw_operator.
+        indicator_percentages (list): Indicator values of the DHS clusters.
+        nodata (float): Value of the pixels without an estimate.
+        std (bool): Whether to also return the grid of weighted standard deviations of the neighbour values.
+
+    Returns:
+        grid (numpy.ndarray): Indicator grid with the shape of the population raster.
+        std_grid (numpy.ndarray): Grid of weighted standard deviations (only if std).
+    """
+    values = np.asarray(indicator_percentages, dtype=float)
+    grid = np.full(operator['shape'], nodata, dtype=float)
+
+    if not std:
+        grid[operator['rows'], operator['cols']] = operator['matrix'] @ values
+        return grid
+
+    # The first and second weighted moments come from the same sparse product
+    moments = operator['matrix'] @ np.column_stack([values, values * values])
+    v1, v2 = moments[:, 0], moments[:, 1]
+    grid[operator['rows'], operator['cols']] = v1
+
+    # Weighted standard deviation sqrt(v2 - v1 * v1), zero on the pixels holding a DHS cluster
+    std_grid = np.full(operator['shape'], nodata, dtype=float)
+    std_grid[operator['rows'], operator['cols']] = np.sqrt(np.maximum(v2 - v1 * v1, 0.0))
+
+    return grid, std_grid
+
+
+def lidw_operator(country, year, df, country_shape=None, use_cache=True, settlements_only=False, kernel=None,
+                  order=1):
+    """
+    Returns the LIDW operator of a set of DHS clusters, from the cache when it exists.
+
+    Args:
+        country (str): Country name.
+        year (str): Survey year.
+        df (DataFrame): DHS cluster data (without missing values) with the 'cluster', 'LNG' and 'LAT' columns.
+        country_shape (GeoDataFrame): Country shape, read from the country shapefile when not given.
+        use_cache (bool): Whether to read and write the cached operator.
+        settlements_only (bool): Whether to interpolate only the pixels of the settlements.
+        kernel (function): Interpolation kernel as returned by lidw_kernel; 1/distance when None.
+        order (int): Order of the neighbourhoods of the regions.
+
+    Returns:
+        operator (dict): Operator as returned by build_lidw_operator.
+    """
+    # Get the path to the population raster for the country and year
+    path_to_population_raster = population_raster(country, year)
+    path_to_mask_shapefile = settlement_mask_shapefile(country, year) if settlements_only else None
+    path = lidw_operator_path(country, year, df, path_to_population_raster, path_to_mask_shapefile,
+                              lidw_variant_key(kernel, order))
+
+    # Reuse the cached operator when it was already computed for this cluster set
+    if use_cache and os.path.exists(path):
+        return load_lidw_operator(path)
+
+    if country_shape is None:
+        country_shape = gpd.read_file(country_shapefile(country))
+
+    # Get the locations of DHS clusters from the DataFrame as a list of (longitude, latitude) tuples
+    locations = dhs_cluster_locations(df)
+
+    # Create the network of neighbouring Voronoi regions from the Delaunay triangulation (including self-loops)
+    net = network_neighbourhood(delaunay_clusters_network(locations, country_shape, self_loop=True), order)
+
+    # Build the operator from the population raster
+    with rasterio.open(path_to_population_raster) as raster:
+        pixel_mask = settlement_pixel_mask(raster, path_to_mask_shapefile) if settlements_only else None
+        operator = build_lidw_operator(raster, raster.read(1), locations, net,
+                                       voronoi_site_locator(locations, country_shape), pixel_mask, kernel)
+
+    if use_cache:
+        save_lidw_operator(path, operator)
+
+    return operator
+
+
+def changed_cluster_neighbourhoods(old_df, new_df, country_shape, order=1):
+    """
+    Finds the clusters whose pixels can get other LIDW weights when a cluster set is corrected.
+
+    Moving, removing or adding a cluster only changes the Voronoi cells of that cluster and of its
+    neighbours in the full (unclipped) Delaunay triangulation, before and after the change; the clipped
+    network can miss some of them in concave countries. With neighbourhoods of a higher order, the clusters
+    within order - 1 steps of those cells in the network are affected as well. Clusters are matched by their
+    'cluster' number.
+
+    Args:
+        old_df (DataFrame): Previous DHS cluster data with the 'cluster', 'LNG' and 'LAT' columns.
+        new_df (DataFrame): Corrected DHS cluster data with the 'cluster', 'LNG' and 'LAT' columns.
+        country_shape (GeoDataFrame): Country shape.
+        order (int): Order of the neighbourhoods of the regions.
+
+    Returns:
+        affected (set): Cluster numbers of the changed clusters and of the clusters around them.
+        old_net (list): Neighbourhoods of the given order of the previous cluster set (including self-loops).
+        new_net (list): Neighbourhoods of the given order of the corrected cluster set (including self-loops).
+    """
+    old_ids, new_ids = old_df['cluster'].tolist(), new_df['cluster'].tolist()
+    old_locations, new_locations = dhs_cluster_locations(old_df), dhs_cluster_locations(new_df)
+    old_position = {c: k for k, c in enumerate(old_ids)}
+    new_position = {c: k for k, c in enumerate(new_ids)}
+
+    # Clusters that were removed, added or moved
+    moved = {c for c in old_ids
+             if c in new_position and old_locations[old_position[c]] != new_locations[new_position[c]]}
+    changed_ids = (set(old_ids) - set(new_ids)) | (set(new_ids) - set(old_ids)) | moved
+
+    # Their Delaunay neighbours before and after the change have different cells and neighbour lists
+    old_full = delaunay_clusters_network(old_locations, country_shape, self_loop=True, clip=False)
+    new_full = delaunay_clusters_network(new_locations, country_shape, self_loop=True, clip=False)
+    affected = set(changed_ids)
+    for c in changed_ids:
+        if c in old_position:
+            affected.update(old_ids[k] for k in old_full[old_position[c]])
+        if c in new_position:
+            affected.update(new_ids[k] for k in new_full[new_position[c]])
+
+    # Networks of the weights, and the clusters whose higher order neighbourhoods reach the changed cells
+    old_net = delaunay_clusters_network(old_locations, country_shape, self_loop=True)
+    new_net = delaunay_clusters_network(new_locations, country_shape, self_loop=True)
+    for _ in range(order - 1):
+        reached = set(affected)
+        for c in affected:
+            if c in old_position:
+                reached.update(old_ids[k] for k in old_net[old_position[c]])
+            if c in new_position:
+                reached.update(new_ids[k] for k in new_net[new_position[c]])
+        affected = reached
+
+    return affected, network_neighbourhood(old_net, order), network_neighbourhood(new_net, order)
+
+
+def update_lidw_operator(operator, raster, old_df, new_df, country_shape, pixel_mask=None, kernel=None, order=1):
+    """
+    Updates a LIDW operator for a corrected cluster set, recomputing only the pixels whose weights can change.
+
+    The rows of the pixels in the cells found by changed_cluster_neighbourhoods, and of the pixels
+    holding a cluster, are recomputed; all other rows are kept, with their columns and regions
+    renumbered to the new cluster set. Clusters are matched by their 'cluster' number.
+
+    Args:
+        operator (dict): Operator of the previous cluster set, as returned by lidw_operator.
+        raster (DatasetReader): Open population raster the operator was built on.
+        old_df (DataFrame): Previous DHS cluster data with the 'cluster', 'LNG' and 'LAT' columns.
+        new_df (DataFrame): Corrected DHS cluster data with the 'cluster', 'LNG' and 'LAT' columns.
+        country_shape (GeoDataFrame): Country shape.
+        pixel_mask (numpy.ndarray): Boolean mask of the interpolated pixels the operator was built with, if any.
+        kernel (function): Interpolation kernel the operator was built with; 1/distance when None.
+        order (int): Order of the neighbourhoods the operator was built with.
+
+    Returns:
+        new_operator (dict): Operator of the corrected cluster set, as built by build_lidw_operator.
+        changed (numpy.ndarray): Flattened indices of the pixels whose row was recomputed.
+    """
+    height, width = operator['shape']
+
+    old_ids, new_ids = old_df['cluster'].tolist(), new_df['cluster'].tolist()
+    old_locations, new_locations = dhs_cluster_locations(old_df), dhs_cluster_locations(new_df)
+    old_position = {c: k for k, c in enumerate(old_ids)}
+    new_position = {c: k for k, c in enumerate(new_ids)}
+
+    # Clusters whose cells and neighbour lists change
+    affected, old_net, new_net = changed_cluster_neighbourhoods(old_df, new_df, country_shape, order)
+    affected_old = np.zeros(len(old_ids), dtype=bool)
+    affected_old[[old_position[c] for c in affected if c in old_position]] = True
+
+    # Region of every pixel of the operator, located again for operators cached without their regions
+    matrix = operator['matrix']
+    region = operator.get('region')
+    if region is None:
+        region = locate_voronoi_sites(voronoi_site_locator(old_locations, country_shape),
+                                      *raster_pixel_centers(raster.transform, operator['rows'], operator['cols']))
+    flat = operator['rows'] * width + operator['cols']
+
+    # Pixels to recompute: those of the affected regions and those holding a cluster, before and after
+    old_known_rows, old_known_cols, _ = known_cluster_pixels(raster, old_locations)
+    new_known_rows, new_known_cols, new_known_index = known_cluster_pixels(raster, new_locations)
+    if pixel_mask is not None:
+        # Known pixels outside the mask stay without an estimate
+        keep = pixel_mask[new_known_rows, new_known_cols]
+        new_known_rows, new_known_cols, new_known_index = new_known_rows[keep], new_known_cols[keep], \
+            new_known_index[keep]
+    recompute = np.unique(np.concatenate([flat[(region < 0) | affected_old[np.maximum(region, 0)]],
+                                          old_known_rows * width + old_known_cols,
+                                          new_known_rows * width + new_known_cols]))
+    keep = ~np.isin(flat, recompute)
+
+    # Kept rows only refer to unaffected clusters, renumber them to the new cluster set
+    renumber = np.array([new_position.get(c, -1) for c in old_ids], dtype=np.int64)
+    kept = matrix[keep]
+    kept = sparse.csr_matrix((kept.data, renumber[kept.indices], kept.indptr), shape=(kept.shape[0], len(new_ids)))
+
+    # Recompute the rows of the other pixels with the corrected clusters
+    new_known_flat = new_known_rows * width + new_known_cols
+    is_known = np.isin(recompute, new_known_flat)
+    rows, cols = recompute[~is_known] // width, recompute[~is_known] % width
+
+    # Only the populated pixels (of the mask) are interpolated
+    populated = raster.read(1)[rows, cols] > 0.0
+    if pixel_mask is not None:
+        populated &= pixel_mask[rows, cols]
+    rows, cols = rows[populated], cols[populated]
+    new_region = locate_voronoi_sites(voronoi_site_locator(new_locations, country_shape),
+                                      *raster_pixel_centers(raster.transform, rows, cols))
+    inside, index, weight = lidw_pixel_weights(raster.transform, rows, cols, new_locations, new_net, None, kernel,
+                                               region=new_region)
+    rows, cols, new_region = rows[inside], cols[inside], new_region[inside]
+
+    # Rows of the interpolated pixels, without the padding of the neighbour table
+    valid = weight != 0.0
+    indptr = np.concatenate([[0], np.cumsum(np.sum(valid, axis=1))])
+    recomputed = sparse.csr_matrix((weight[valid], index[valid], indptr), shape=(len(rows), len(new_ids)))
+
+    # Rows of the pixels holding a cluster (known_cluster_pixels returns each pixel once)
+    known_matrix = sparse.csr_matrix((np.ones(len(new_known_flat)), new_known_index,
+                                      np.arange(len(new_known_flat) + 1)), shape=(len(new_known_flat), len(new_ids)))
+
+    new_operator = {'matrix': sparse.vstack([kept, recomputed, known_matrix], format='csr'),
+                    'rows': np.concatenate([operator['rows'][keep], rows, new_known_rows]),
+                    'cols': np.concatenate([operator['cols'][keep], cols, new_known_cols]),
+                    'region': np.concatenate([renumber[region[keep]], new_region, new_known_index]),
+                    'shape': (height, width)}
+
+    return new_operator, recompute
+
+
+def lidw_operator_pixel_values(operator, indicator_percentages, flat, nodata=-9999.0, std=False):
+    """
+    Evaluates a LIDW operator on a set of pixels, as they are stored in the float32 indicator rasters.
+
+    Args:
+        operator (dict): Operator as returned by lidw_operator.
+        indicator_percentages (list): Indicator values of the DHS clusters.
+        flat (numpy.ndarray): Flattened indices of the pixels.
+        nodata (float): Value of the pixels without an estimate.
+        std (bool): Whether to also return the weighted standard deviations, as in apply_lidw_operator.
+
+    Returns:
+        values (numpy.ndarray): Float32 values of the pixels.
+        spreads (numpy.ndarray): Float32 weighted standard deviations of the pixels (only if std).
+    """
+    width = operator['shape'][1]
+    operator_flat = operator['rows'] * width + operator['cols']
+    v = np.asarray(indicator_percentages, dtype=float)
+    if std:
+        moments = operator['matrix'] @ np.column_stack([v, v * v])
+        estimates = moments[:, 0]
+        deviations = np.sqrt(np.maximum(moments[:, 1] - estimates * estimates, 0.0))
+    else:
+        estimates = operator['matrix'] @ v
+
+    values = np.full(len(flat), nodata, dtype=np.float32)
+    spreads = np.full(len(flat), nodata, dtype=np.float32)
+
+    if len(operator_flat) > 0:
+        # Look up the pixels among the rows of the operator
+        order = np.argsort(operator_flat)
+        sorted_flat = operator_flat[order]
+        position = np.minimum(np.searchsorted(sorted_flat, flat), len(order) - 1)
+        found = sorted_flat[position] == flat
+        values[found] = estimates[order[position[found]]]
+        if std:
+            spreads[found] = deviations[order[position[found]]]
+
+    return (values, spreads) if std else values
+
+
+def raster_tile_windows(height, width, block_size=256, tile_budget=None):
+    """
+    Splits a raster into windows aligned to its blocks, each holding at most tile_budget pixels.
+
+    Args:
+        height (int): Raster height.
+        width (int): Raster width.
+        block_size (int): Size of the (square) GeoTIFF blocks.
+        tile_budget (int): Maximum number of pixels per window (at least one block); the whole raster when None.
+
+    Returns:
+        windows (list): List of rasterio Windows covering the raster.
+    """
+    if tile_budget is None:
+        return [rasterio.windows.Window(0, 0, width, height)]
+
+    # Number of blocks that fit in the budget, and the tile shape in blocks (full rows of blocks first)
+    num_blocks = max(1, int(tile_budget) // (block_size * block_size))
+    blocks_x = min(int(np.ceil(width / block_size)), num_blocks)
+    blocks_y = max(1, num_blocks // blocks_x)
+    tile_width, tile_height = blocks_x * block_size, blocks_y * block_size
+
+    windows = []
+    for row_off in range(0, height, tile_height):
+        for col_off in range(0, width, tile_width):
+            windows.append(rasterio.windows.Window(col_off, row_off, min(tile_width, width - col_off),
+                                                   min(tile_height, height - row_off)))
+
+    return windows
+
+
+def known_cluster_pixels(raster, locations):
+    """
+    Finds the raster pixels that hold a DHS cluster (the last cluster wins on shared pixels).
+
+    Args:
+        raster (DatasetReader): Open population raster.
+        locations (list): List of cluster locations (coordinates).
+
+    Returns:
+        rows (numpy.ndarray): Row indices of the pixels.
+        cols (numpy.ndarray): Column indices of the pixels.
+        index (numpy.ndarray): Index of the cluster of each pixel.
+    """
+    known = {}
+    for c, (x, y) in enumerate(locations):
+        known[raster.index(x, y)] = c
+
+    rows = np.array([k[0] for k in known], dtype=np.int64)
+    cols = np.array([k[1] for k in known], dtype=np.int64)
+    index = np.array(list(known.values()), dtype=np.int64)
+
+    return rows, cols, index
+
+
+def lidw_tile(raster, window, locations, table, locator, values, known, std=False, mask_shapes=None, kernel=None):
+    """
+    Interpolates one window of the raster for several indicators sharing the same clusters.
+
+    The distances, weights and weighted sums are computed in float32, the type of the rasters, and the
+    settlement mask is rasterized for the window only, so memory depends on the window and not on the raster.
+
+    Args:
+        raster (DatasetReader): Open population raster.
+        window (Window): Window of the raster to interpolate.
+        locations (numpy.ndarray): Cluster locations (coordinates).
+        table (numpy.ndarray): Neighbour table of the network (including self-loops).
+        locator (dict): Region locator as returned by voronoi_site_locator.
+        values (numpy.ndarray): Indicator values, one row per indicator.
+        known (tuple): Rows, columns and cluster indices of the known pixels, as returned by known_cluster_pixels.
+        std (bool): Whether to also compute the weighted standard deviations of the neighbour values.
+        mask_shapes (numpy.ndarray): Settlements whose pixels are the only ones interpolated, as returned by
+            settlement_mask_shapes; all populated pixels when None.
+        kernel (function): Interpolation kernel as returned by lidw_kernel; 1/distance when None.
+
+    Returns:
+        tiles (numpy.ndarray): Float32 array of shape (indicators, height, width) with the interpolated window,
+            followed by the standard deviations of all indicators when std is set.
+    """
+    known_rows, known_cols, known_index = known
+    row_off, col_off = int(window.row_off), int(window.col_off)
+    h, w = int(window.height), int(window.width)
+
+    # Read the population of the window only
+    band = raster.read(1, window=window)
+
+    # Known pixels that fall in the window
+    in_tile = ((known_rows >= row_off) & (known_rows < row_off + h) &
+               (known_cols >= col_off) & (known_cols < col_off + w))
+    tile_known_rows, tile_known_cols = known_rows[in_tile] - row_off, known_cols[in_tile] - col_off
+    tile_known_index = known_index[in_tile]
+
+    # Pixels outside the settlements of the window stay without an estimate, even when they hold a cluster
+    if mask_shapes is not None:
+        window_mask = settlement_window_mask(raster.transform, window, mask_shapes)
+        band = np.where(window_mask, band, 0.0)
+        keep = window_mask[tile_known_rows, tile_known_cols]
+        tile_known_rows, tile_known_cols, tile_known_index = (tile_known_rows[keep], tile_known_cols[keep],
+                                                              tile_known_index[keep])
+
+    is_known = np.zeros((h, w), dtype=bool)
+    is_known[tile_known_rows, tile_known_cols] = True
+
+    # Weights of the populated pixels of the window, shared by all indicators
+    rows, cols = np.nonzero(~is_known & (band > 0.0))
+    inside, index, weight = lidw_pixel_weights(raster.transform, rows + row_off, cols + col_off,
+                                               locations, table, locator, kernel, dtype=np.float32)
+
+    tiles = np.full((2 * len(values) if std else len(values), h, w), -9999.0, dtype=np.float32)
+    for k, v in enumerate(values):
+        if std:
+            # The standard deviation comes from the same neighbour values, it is zero on the known pixels
+            tiles[k, rows, cols], tiles[len(values) + k, rows, cols] = lidw_apply_weights(inside, index, weight, v,
+                                                                                          std=True, dtype=np.float32)
+            tiles[len(values) + k, tile_known_rows, tile_known_cols] = 0.0
+        else:
+            tiles[k, rows, cols] = lidw_apply_weights(inside, index, weight, v, dtype=np.float32)
+        tiles[k, tile_known_rows, tile_known_cols] = v[tile_known_index]
+
+    return tiles
+
+
+# State of the worker processes of write_lidw_rasters_tiled, set by init_lidw_worker
+lidw_worker_state = {}
+
+
+def init_lidw_worker(path_to_population_raster, shared, bounds, polygon_wkb, known, std=False, kernel=None,
+                     mask_wkb=None):
+    """
+    Initialises a worker process of write_lidw_rasters_tiled.
+
+    The cluster locations, indicator values and neighbour table are attached from shared memory,
+    so they are not pickled and copied for every tile.
+    """
+    # Attach the shared memory blocks as numpy arrays (keeping the blocks alive with the state)
+    for key, (name, shape, dtype) in shared.items():
+        block = shared_memory.SharedMemory(name=name)
+        lidw_worker_state[key + '_block'] = block
+        lidw_worker_state[key] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+    # Rebuild the region locator of the clusters
+    polygon = shapely.from_wkb(polygon_wkb) if polygon_wkb is not None else None
+    if polygon is not None:
+        shapely.prepare(polygon)
+    sites = np.append(lidw_worker_state['locations'], bounds, axis=0)
+    lidw_worker_state['locator'] = {'tree': cKDTree(sites), 'sites': sites,
+                                    'num_locations': len(lidw_worker_state['locations']), 'polygon': polygon}
+
+    # Each worker reads its own windows of the population raster
+    lidw_worker_state['raster'] = rasterio.open(path_to_population_raster)
+    lidw_worker_state['known'] = known
+    lidw_worker_state['std'] = std
+    lidw_worker_state['kernel'] = kernel
+    lidw_worker_state['mask_shapes'] = shapely.from_wkb(mask_wkb) if mask_wkb is not None else None
+
+
+def lidw_tile_worker(window):
+    # Interpolate one window with the shared state of the worker
+    state = lidw_worker_state
+    tiles = lidw_tile(state['raster'], window, state['locations'], state['table'], state['locator'],
+                      state['values'], state['known'], state['std'], state['mask_shapes'], state['kernel'])
+
+    return window, tiles
+
+
+def write_lidw_rasters_tiled(raster, locations, net, locator, values, output_paths, tile_budget, block_size=256,
+                             processes=None, std_paths=None, mask_shapes=None, kernel=None):
+    """
+    Interpolates and writes LIDW rasters tile by tile, so that memory is bounded by the tile budget.
+
+    Every tile of the population raster is read, interpolated in float32 for all indicators sharing the
+    cluster set and written to tiled float32 GeoTIFFs before moving to the next tile. With several
+    processes, the tiles are row bands of the raster interpolated by a process pool whose workers
+    share the cluster locations, values and neighbour lists through shared memory; the tiles are
+    written by the calling process as they arrive. A pool cannot be started from inside the worker
+    of another pool, so use processes only when the country-years are run one after another.
+
+    Args:
+        raster (DatasetReader): Open population raster.
+        locations (list): List of cluster locations (coordinates).
+        net (list): Network of regions (including self-loops).
+        locator (dict): Region locator as returned by voronoi_site_locator.
+        values (list): List of indicator value lists, one per output raster.
+        output_paths (list): Paths of the output rasters.
+        tile_budget (int): Maximum number of pixels per tile (one row of blocks per tile when None).
+        block_size (int): Size of the GeoTIFF blocks, tiles are aligned to them.
+        processes (int): Number of worker processes; the tiles are processed serially when None or 1.
+        std_paths (list): Paths of the rasters of weighted standard deviations, computed in the same pass when given.
+        mask_shapes (numpy.ndarray): Settlements whose pixels are the only ones interpolated, as returned by
+            settlement_mask_shapes; all populated pixels when None.
+        kernel (function): Interpolation kernel as returned by lidw_kernel; 1/distance when None.
+    """
+    height, width = raster.height, raster.width
+
+    # Pixels holding a DHS cluster keep the value of the cluster (within the settlements, when masked)
+    known = known_cluster_pixels(raster, locations)
+    locations = np.reshape(np.asarray(locations, dtype=float), (-1, 2))
+    values = np.array([np.asarray(v, dtype=float) for v in values])
+    table = neighbour_table(net)
+
+    # Without a budget the tiles are row bands one block high
+    if tile_budget is None:
+        tile_budget = width * block_size
+    windows = raster_tile_windows(height, width, block_size, tile_budget)
+
+    # Open all output rasters as tiled, compressed float32 GeoTIFFs
+    profile = geotiff_profile(width, height, raster.transform, block_size=block_size)
+    std = std_paths is not None
+    destinations = [rasterio.open(path, 'w', **profile) for path in list(output_paths) + list(std_paths or [])]
+    blocks = []
+
+    try:
+        if processes is None or processes <= 1:
+            for window in windows:
+                tiles = lidw_tile(raster, window, locations, table, locator, values, known, std, mask_shapes, kernel)
+
+                # Write the tile as soon as it is finished
+                for dst, tile in zip(destinations, tiles):
+                    dst.write(tile, 1, window=window)
+        else:
+            # Copy the cluster data to shared memory once for all workers
+            shared = {}
+            arrays = [('locations', locations), ('values', values), ('table', table)]
+            for key, array in arrays:
+                block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+                np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+                blocks.append(block)
+                shared[key] = (block.name, array.shape, array.dtype.str)
+
+            bounds = locator['sites'][locator['num_locations']:]
+            polygon_wkb = shapely.to_wkb(locator['polygon']) if locator['polygon'] is not None else None
+            mask_wkb = shapely.to_wkb(mask_shapes) if mask_shapes is not None else None
+
+            with multiprocessing.Pool(processes=processes, initializer=init_lidw_worker,
+                                      initargs=(raster.name, shared, bounds, polygon_wkb, known, std, kernel,
+                                                mask_wkb)) as pool:
+                # Write the bands in the order they are finished
+                for window, tiles in pool.imap_unordered(lidw_tile_worker, windows):
+                    for dst, tile in zip(destinations, tiles):
+                        dst.write(tile, 1, window=window)
+
+    finally:
+        for dst in destinations:
+            dst.close()
+
+        # Release the shared memory
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    # Add the overviews and the cloud-optimized layout once all tiles are written
+    for path in list(output_paths) + list(std_paths or []):
+        cloud_optimize_geotiff(path, block_size=block_size)
+
+
+def coarse_population_raster(band, transform, factor):
+    """
+    Aggregates a population raster to a grid that is factor times coarser.
+
+    The population of a coarse pixel is the sum of the (non-negative) population of its fine pixels.
+
+    Args:
+        band (numpy.ndarray): Population values of the fine raster.
+        transform (Affine): Affine transform of the fine raster.
+        factor (int): Aggregation factor (2, 4, 8, ...).
+
+    Returns:
+        memfile (MemoryFile): In-memory file holding the coarse raster (to be closed by the caller).
+        coarse (DatasetReader): Open coarse raster, usable wherever the population raster is.
+        coarse_band (numpy.ndarray): Population values of the coarse raster.
+    """
+    height, width = band.shape
+    coarse_height, coarse_width = -(-height // factor), -(-width // factor)
+
+    # Sum the populated fine pixels of every coarse pixel (the last row and column of blocks may be partial)
+    padded = np.zeros((coarse_height * factor, coarse_width * factor))
+    padded[:height, :width] = np.where(band > 0.0, band, 0.0)
+    coarse_band = padded.reshape(coarse_height, factor, coarse_width, factor).sum(axis=(1, 3))
+
+    # Keep the coarse raster in memory so that the functions of the full-resolution engine can use it
+    memfile = MemoryFile()
+    with memfile.open(driver='GTiff', dtype='float64', count=1, width=coarse_width, height=coarse_height,
+                      crs='+proj=latlong', transform=transform * rasterio.transform.Affine.scale(factor)) as dst:
+        dst.write(coarse_band, 1)
+
+    return memfile, memfile.open(), coarse_band
+
+
+def voronoi_boundary_pixels(raster, locator):
+    """
+    Finds the pixels whose neighbouring pixels fall in a different Voronoi region (or outside all regions).
+
+    Args:
+        raster (DatasetReader): Open raster.
+        locator (dict): Region locator as returned by voronoi_site_locator.
+
+    Returns:
+        boundary (numpy.ndarray): Boolean array with the shape of the raster.
+    """
+    height, width = raster.height, raster.width
+
+    # Region of every pixel centre
+    rows, cols = np.indices((height, width))
+    x, y = raster_pixel_centers(raster.transform, rows.ravel(), cols.ravel())
+    region = np.pad(locate_voronoi_sites(locator, x, y).reshape(height, width), 1, mode='edge')
+
+    # A pixel is on a boundary if one of its eight neighbours is in another region
+    boundary = np.zeros((height, width), dtype=bool)
+    for di in (-1, 0, 1):
+        for dj in (-1, 0, 1):
+            boundary |= region[1 + di:1 + di + height, 1 + dj:1 + dj + width] != region[1:-1, 1:-1]
+
+    return boundary
+
+
+def lidw_multiresolution(raster, locations, net, locator, values, factor, refine=False, kernel=None):
+    """
+    Interpolates several indicators on a population grid that is factor times coarser.
+
+    With refine, the result is brought back to the full resolution: every populated pixel takes the
+    value of its coarse pixel, except in the coarse pixels near a Voronoi cell boundary (where the
+    neighbour set changes) or holding a DHS cluster, whose fine pixels are interpolated exactly.
+
+    Args:
+        raster (DatasetReader): Open population raster.
+        locations (list): List of cluster locations (coordinates).
+        net (list): Network of regions (including self-loops).
+        locator (dict): Region locator as returned by voronoi_site_locator.
+        values (list): List of indicator value lists.
+        factor (int): Aggregation factor (2, 4, 8, ...).
+        refine (bool): Whether to return full-resolution grids refined near the cell boundaries.
+        kernel (function): Interpolation kernel as returned by lidw_kernel; 1/distance when None.
+
+    Returns:
+        grids (list): Interpolated grids, one per indicator.
+        transform (Affine): Affine transform of the grids.
+    """
+    band = raster.read(1)
+    memfile, coarse, coarse_band = coarse_population_raster(band, raster.transform, factor)
+
+    try:
+        # Interpolate the coarse grid with the full-resolution engine
+        operator = build_lidw_operator(coarse, coarse_band, locations, net, locator, kernel=kernel)
+        grids = [apply_lidw_operator(operator, v) for v in values]
+        if not refine:
+            return grids, coarse.transform
+
+        # Coarse pixels to refine: those near a cell boundary and those holding a DHS cluster
+        refine_coarse = voronoi_boundary_pixels(coarse, locator)
+        known_rows, known_cols, _ = known_cluster_pixels(coarse, locations)
+        inside = (known_rows >= 0) & (known_rows < coarse.height) & (known_cols >= 0) & (known_cols < coarse.width)
+        refine_coarse[known_rows[inside], known_cols[inside]] = True
+    finally:
+        coarse.close()
+        memfile.close()
+
+    # Bring the coarse values back to the populated fine pixels
+    height, width = band.shape
+    populated = band > 0.0
+    grids = [np.where(populated, np.kron(g, np.ones((factor, factor)))[:height, :width], -9999.0) for g in grids]
+
+    # Interpolate the fine pixels of the refined coarse pixels exactly
+    refine_fine = np.kron(refine_coarse, np.ones((factor, factor), dtype=bool))[:height, :width]
+    known_rows, known_cols, known_index = known_cluster_pixels(raster, locations)
+    is_known = np.zeros((height, width), dtype=bool)
+    inside = (known_rows >= 0) & (known_rows < height) & (known_cols >= 0) & (known_cols < width)
+    is_known[known_rows[inside], known_cols[inside]] = True
+
+    rows, cols = np.nonzero(refine_fine & populated & ~is_known)
+    inside_region, index, weight = lidw_pixel_weights(raster.transform, rows, cols, locations, net, locator, kernel)
+    for grid, v in zip(grids, values):
+        grid[rows, cols] = lidw_apply_weights(inside_region, index, weight, v)
+        grid[known_rows[inside], known_cols[inside]] = np.asarray(v, dtype=float)[known_index[inside]]
+
+    return grids, raster.transform
+
+
+def rewrite_raster_pixels(path, rows, cols, values):
+    """
+    Rewrites some pixels of an existing raster, reading and writing only the blocks that contain them.
+
+    Args:
+        path (str): Path to the raster.
+        rows (numpy.ndarray): Row indices of the pixels.
+        cols (numpy.ndarray): Column indices of the pixels.
+        values (numpy.ndarray): New values of the pixels.
+
+    Returns:
+        num_windows (int): Number of blocks that were rewritten.
+    """
+    # The cloud-optimized layout is restored by cloud_optimize_geotiff after the update
+    with rasterio.open(path, 'r+', IGNORE_COG_LAYOUT_BREAK='YES') as dst:
+        block_height, block_width = dst.block_shapes[0]
+
+        # Group the pixels by the block that contains them
+        block = (rows // block_height) * ((dst.width + block_width - 1) // block_width) + cols // block_width
+        order = np.argsort(block, kind='stable')
+        blocks, starts = np.unique(block[order], return_index=True)
+
+        for b, pixels in zip(blocks, np.split(order, starts[1:])):
+            row_off = int(rows[pixels[0]] // block_height) * block_height
+            col_off = int(cols[pixels[0]] // block_width) * block_width
+            window = rasterio.windows.Window(col_off, row_off, min(block_width, dst.width - col_off),
+                                             min(block_height, dst.height - row_off))
+
+            # Update the pixels of the block in place
+            tile = dst.read(1, window=window)
+            tile[rows[pixels] - row_off, cols[pixels] - col_off] = values[pixels]
+            dst.write(tile, 1, window=window)
+
+    return len(blocks)
+
+
+def update_lidw_rasters_tiled(raster, old_df, new_df, group, output_paths, country_shape, tile_budget=None,
+                              block_size=256, std_paths=None, mask_shapes=None, kernel=None, order=1):
+    """
+    Updates LIDW rasters written by write_lidw_rasters_tiled for a corrected cluster set, without an operator.
+
+    The cells that can change are those found by changed_cluster_neighbourhoods and those next to a
+    cluster whose value changed. The populated pixels of every tile are located among the previous and
+    the corrected clusters; only the tiles holding a pixel of those cells, or a cluster before or after
+    the correction, are interpolated again with lidw_tile, and their pixels are rewritten where the
+    stored value differs. Memory stays bounded by the tile budget, as when the rasters were written.
+
+    Args:
+        raster (DatasetReader): Open population raster.
+        old_df (DataFrame): Previous DHS cluster data of the group, with the 'cluster', 'LNG' and 'LAT' columns.
+        new_df (DataFrame): Corrected DHS cluster data of the group, with the 'cluster', 'LNG' and 'LAT' columns.
+        group (list): Indicators of the output rasters.
+        output_paths (list): Paths of the rasters to update.
+        country_shape (GeoDataFrame): Country shape.
+        tile_budget (int): Maximum number of pixels per tile (one row of blocks per tile when None).
+        block_size (int): Size of the GeoTIFF blocks, tiles are aligned to them.
+        std_paths (list): Paths of the rasters of weighted standard deviations to update as well, if any.
+        mask_shapes (numpy.ndarray): Settlements the rasters were masked with, as returned by settlement_mask_shapes.
+        kernel (function): Interpolation kernel the rasters were written with; 1/distance when None.
+        order (int): Order of the neighbourhoods the rasters were written with.
+
+    Returns:
+        num_pixels (list): Number of rewritten pixels of every raster (output rasters first).
+    """
+    height, width = raster.height, raster.width
+    old_ids, new_ids = old_df['cluster'].tolist(), new_df['cluster'].tolist()
+    old_locations, new_locations = dhs_cluster_locations(old_df), dhs_cluster_locations(new_df)
+    affected, old_net, new_net = changed_cluster_neighbourhoods(old_df, new_df, country_shape, order)
+
+    # Pixels weighting a cluster whose value changed lie in the cells of its neighbourhood
+    old_values, new_values = old_df.set_index('cluster'), new_df.set_index('cluster')
+    common = old_values.index.intersection(new_values.index)
+    revalued = set(common[np.any(old_values.loc[common, group].to_numpy() !=
+                                 new_values.loc[common, group].to_numpy(), axis=1)])
+    old_position = {c: k for k, c in enumerate(old_ids)}
+    new_position = {c: k for k, c in enumerate(new_ids)}
+    for c in revalued:
+        affected.update(old_ids[k] for k in old_net[old_position[c]])
+        affected.update(new_ids[k] for k in new_net[new_position[c]])
+    # The last entry stands for the pixels outside all regions (region -1)
+    dirty_old = np.array([c in affected for c in old_ids] + [False])
+    dirty_new = np.array([c in affected for c in new_ids] + [False])
+
+    old_locator = voronoi_site_locator(old_locations, country_shape)
+    new_locator = voronoi_site_locator(new_locations, country_shape)
+    old_known = known_cluster_pixels(raster, old_locations)
+    new_known = known_cluster_pixels(raster, new_locations)
+    locations = np.reshape(np.asarray(new_locations, dtype=float), (-1, 2))
+    values = np.array([new_df[indicator].to_numpy(dtype=float) for indicator in group])
+    table = neighbour_table(new_net)
+
+    if tile_budget is None:
+        tile_budget = width * block_size
+    paths = list(output_paths) + list(std_paths or [])
+    num_pixels = [0] * len(paths)
+
+    # The cloud-optimized layout is restored by cloud_optimize_geotiff after the update
+    destinations = [rasterio.open(path, 'r+', IGNORE_COG_LAYOUT_BREAK='YES') for path in paths]
+    try:
+        for window in raster_tile_windows(height, width, block_size, tile_budget):
+            row_off, col_off = int(window.row_off), int(window.col_off)
+            h, w = int(window.height), int(window.width)
+
+            window_mask = None
+            if mask_shapes is not None:
+                window_mask = settlement_window_mask(raster.transform, window, mask_shapes)
+
+            # Tiles holding a cluster (within the settlements) before or after the correction are always
+            # interpolated again
+            dirty = False
+            for rows, cols, _ in (old_known, new_known):
+                in_tile = (rows >= row_off) & (rows < row_off + h) & (cols >= col_off) & (cols < col_off + w)
+                if window_mask is not None:
+                    in_tile[in_tile] = window_mask[rows[in_tile] - row_off, cols[in_tile] - col_off]
+                dirty |= bool(np.any(in_tile))
+
+            # Otherwise, only the tiles with a populated pixel (of the settlements) in a changed cell
+            if not dirty:
+                band = raster.read(1, window=window)
+                if window_mask is not None:
+                    band = np.where(window_mask, band, 0.0)
+                rows, cols = np.nonzero(band > 0.0)
+                x, y = raster_pixel_centers(raster.transform, rows + row_off, cols + col_off)
+                dirty = bool(np.any(dirty_old[locate_voronoi_sites(old_locator, x, y)]) or
+                             np.any(dirty_new[locate_voronoi_sites(new_locator, x, y)]))
+            if not dirty:
+                continue
+
+            tiles = lidw_tile(raster, window, locations, table, new_locator, values, new_known, std_paths is not None,
+                              mask_shapes, kernel)
+
+            # Rewrite the tile of the rasters whose stored values differ
+            for k, (dst, tile) in enumerate(zip(destinations, tiles)):
+                differ = int(np.sum(dst.read(1, window=window) != tile))
+                if differ > 0:
+                    dst.write(tile, 1, window=window)
+                    num_pixels[k] += differ
+    finally:
+        for dst in destinations:
+            dst.close()
+
+    # Rebuild the overviews and the cloud-optimized layout of the updated rasters
+    for path, n in zip(paths, num_pixels):
+        if n > 0:
+            cloud_optimize_geotiff(path, block_size=block_size)
+
+    return num_pixels
+
+
+def local_inverse_distance_weighting_interpolation(x, use_cache=True, tile_budget=None, processes=None, std=False,
+                                                   settlements_only=False, kernel=None, order=1, resolution=1,
+                                                   refine=False):
+    # Unpack the tuple 'x' containing 'country', 'year', and 'indicator' (a single indicator or a list of indicators)
+    country, year, indicator = x
+
+    # The quick-look mode writes neither the std rasters nor a settlement mask
+    if resolution > 1 and (std or settlements_only):
+        raise ValueError("std and settlements_only are not supported with resolution > 1")
+
+    # Print the provided country, year, and indicator values
+    print(country, year, indicator)
+
+    # A list of indicators is interpolated in a single pass over the country-year
+    indicators = list(indicator) if isinstance(indicator, (list, tuple)) else [indicator]
+
+    # Obtain the country's alpha-3 code from the function get_country_alpha3_code(country)
+    code, CODE = get_country_alpha3_code(country)
+
+    # Get the path to the indicator CSV file and the shapefile for the country
+    path_to_indicator_file = dhs_csv_file(country, year)
+    path_to_shapefile = country_shapefile(country)
+
+    # Read the indicator CSV file into a pandas DataFrame
+    df = pd.read_csv(path_to_indicator_file)
+
+    # Keep only relevant columns from the DataFrame (including 'cluster', the indicators, longitude, and latitude)
+    df = df[['cluster'] + indicators + ['LNG', 'LAT']]
+
+    # Remove spurious data from the DataFrame using a custom function removing_spurious_data(df)
+    df = removing_spurious_data(df)
+
+    # Group the indicators by their set of valid (non-missing) clusters
+    groups = [(mask, group) for mask, group in valid_cluster_groups(df, indicators) if np.any(mask)]
+
+    # Check if there are indicator percentages available in the DataFrame
+    if len(groups) > 0:
+        # Read the country shapefile into a GeoDataFrame
+        country_shape = gpd.read_file(path_to_shapefile)
+
+        # Get the path to the population raster for the country and year
+        path_to_population_raster = population_raster(country,year)
+
+        # Read the population raster using rasterio
+        raster = rasterio.open(path_to_population_raster)
+
+        # Define the subfolder to save the interpolated TIFF files
+        subfolder = f"{result_root}{country}/{year}/tiff/"
+        if not os.path.exists(subfolder):
+            os.makedirs(subfolder)
+
+        # Only the pixels within settlements are aggregated downstream, the others can stay nodata
+        mask_shapes = None
+        if settlements_only and (tile_budget is not None or processes is not None):
+            mask_shapes = settlement_mask_shapes(settlement_mask_shapefile(country, year))
+
+        for mask, group in groups:
+            # Drop rows with missing values for the indicators of this group
+            df_group = df[mask]
+
+            if resolution > 1:
+                # Quick-look mode: interpolate on a coarser population grid (optionally refined near the cell boundaries)
+                locations = dhs_cluster_locations(df_group)
+                net = network_neighbourhood(delaunay_clusters_network(locations, country_shape, self_loop=True), order)
+                locator = voronoi_site_locator(locations, country_shape)
+
+                grids, transform = lidw_multiresolution(raster, locations, net, locator,
+                                                        [df_group[indicator].tolist() for indicator in group],
+                                                        resolution, refine=refine, kernel=kernel)
+
+                suffix = f"_res{resolution}" + ('_refined' if refine else '')
+                for indicator, grid in zip(group, grids):
+                    write_geotiff(f"{subfolder}{code}_{year}_idw_{indicator[4:]}{suffix}.tif", grid, transform)
+                continue
+
+            if tile_budget is not None or processes is not None:
+                # Bounded-memory (and optionally parallel) mode: interpolate and write the rasters of the group tile by tile
+                locations = dhs_cluster_locations(df_group)
+                net = network_neighbourhood(delaunay_clusters_network(locations, country_shape, self_loop=True), order)
+                locator = voronoi_site_locator(locations, country_shape)
+
+                write_lidw_rasters_tiled(raster, locations, net, locator,
+                                         [df_group[indicator].tolist() for indicator in group],
+                                         [f"{subfolder}{code}_{year}_idw_{indicator[4:]}.tif" for indicator in group],
+                                         tile_budget, processes=processes,
+                                         std_paths=[f"{subfolder}{code}_{year}_idw_{indicator[4:]}_std.tif"
+                                                    for indicator in group] if std else None,
+                                         mask_shapes=mask_shapes, kernel=kernel)
+                continue
+
+            # Get the (cached) sparse operator of the cluster set, shared by all indicators of the group
+            operator = lidw_operator(country, year, df_group, country_shape, use_cache=use_cache,
+                                     settlements_only=settlements_only, kernel=kernel, order=order)
+
+            for indicator in group:
+                # Extract the indicator percentages from the DataFrame as a list
+                indicator_percentages = df_group[indicator].tolist()
+
+                # Perform local inverse distance weighting interpolation with one sparse matrix-vector product
+                if std:
+                    grid, std_grid = apply_lidw_operator(operator, indicator_percentages, std=True)
+                else:
+                    grid = apply_lidw_operator(operator, indicator_percentages)
+
+                # Define the output path for the interpolated TIFF file
+                output_path = f"{subfolder}{code}_{year}_idw_{indicator[4:]}.tif"
+
+                # Save the interpolated values as a compressed, cloud-optimized float32 TIFF file
+                write_geotiff(output_path, grid, raster.transform)
+
+                # Companion raster with the weighted standard deviation of the neighbour values
+                if std:
+                    write_geotiff(output_path[:-4] + '_std.tif', std_grid, raster.transform)
+
+
+def update_local_inverse_distance_weighting_interpolation(x, previous_df, use_cache=True, tile_budget=1024 * 1024,
+                                                          settlements_only=False, kernel=None, order=1):
+    """
+    Updates the LIDW rasters of a country-year after its DHS cluster file was corrected.
+
+    When the operator of the previous cluster set is cached, it is updated with update_lidw_operator and
+    only the pixels whose value changes are rewritten. Rasters written tile by tile (as main1.py does) have
+    no cached operator; they are updated with update_lidw_rasters_tiled. The _std.tif companions are updated
+    along with their rasters, the rasters of indicators left without valid clusters are removed, and
+    indicators whose previous raster is not available are interpolated from scratch. The rasters must have been
+    written with the same settlements_only, kernel and order, which select the cached operator and the weights.
+
+    Args:
+        x (tuple): Country, year and indicator (a single indicator or a list of indicators).
+        previous_df (DataFrame): Previous DHS cluster data, or the path to its CSV file.
+        use_cache (bool): Whether to store the updated operators in the cache.
+        tile_budget (int): Maximum number of pixels per tile when the rasters are updated or rebuilt tile by tile.
+        settlements_only (bool): Whether the rasters interpolate only the pixels of the settlements.
+        kernel (function): Interpolation kernel of the rasters, as returned by lidw_kernel; 1/distance when None.
+        order (int): Order of the neighbourhoods of the regions of the rasters.
+    """
+    country, year, indicator = x
+    print(country, year, indicator)
+
+    indicators = list(indicator) if isinstance(indicator, (list, tuple)) else [indicator]
+    code, CODE = get_country_alpha3_code(country)
+
+    # Read the corrected and the previous cluster data in the same way
+    df = pd.read_csv(dhs_csv_file(country, year))
+    old_df = pd.read_csv(previous_df) if isinstance(previous_df, str) else previous_df
+    df = removing_spurious_data(df[['cluster'] + indicators + ['LNG', 'LAT']])
+    old_df = removing_spurious_data(old_df[['cluster'] + indicators + ['LNG', 'LAT']])
+
+    path_to_population_raster = population_raster(country, year)
+    path_to_mask_shapefile = settlement_mask_shapefile(country, year) if settlements_only else None
+    variant = lidw_variant_key(kernel, order)
+    subfolder = f"{result_root}{country}/{year}/tiff/"
+    country_shape = None
+    pixel_mask = None
+    mask_shapes = None
+    rebuild = []
+    rebuild_std = False
+
+    for mask, group in valid_cluster_groups(df, indicators):
+        # Indicators without valid clusters are not interpolated anymore, so their previous rasters are stale
+        if not np.any(mask):
+            for indicator in group:
+                for path in [f"{subfolder}{code}_{year}_idw_{indicator[4:]}.tif",
+                             f"{subfolder}{code}_{year}_idw_{indicator[4:]}_std.tif"]:
+                    if os.path.exists(path):
+                        os.remove(path)
+                        print(f"{indicator}: no valid clusters left, {path} removed")
+            continue
+
+        # Indicators of the group may have had different clusters in the previous file
+        for old_mask, old_group in valid_cluster_groups(old_df, group):
+            output_paths = [f"{subfolder}{code}_{year}_idw_{indicator[4:]}.tif" for indicator in old_group]
+            std_paths = [output_path[:-4] + '_std.tif' for output_path in output_paths]
+            std = all(os.path.exists(std_path) for std_path in std_paths)
+            path = lidw_operator_path(country, year, old_df[old_mask], path_to_population_raster, path_to_mask_shapefile,
+                                      variant)
+
+            # Without the previous rasters there is nothing to update
+            if not np.any(old_mask) or not all(os.path.exists(output_path) for output_path in output_paths):
+                rebuild += old_group
+                rebuild_std |= any(os.path.exists(std_path) for std_path in std_paths)
+                continue
+
+            if country_shape is None:
+                country_shape = gpd.read_file(country_shapefile(country))
+
+            if not os.path.exists(path):
+                # Rasters written tile by tile: update the tiles of the changed cells (of the settlements, when only
+                # those were interpolated)
+                if settlements_only and mask_shapes is None:
+                    mask_shapes = settlement_mask_shapes(path_to_mask_shapefile)
+                with rasterio.open(path_to_population_raster) as raster:
+                    num_pixels = update_lidw_rasters_tiled(raster, old_df[old_mask], df[mask], old_group, output_paths,
+                                                           country_shape, tile_budget,
+                                                           std_paths=std_paths if std else None,
+                                                           mask_shapes=mask_shapes, kernel=kernel, order=order)
+                for indicator, n in zip(old_group, num_pixels):
+                    print(f"{indicator}: {n} pixels rewritten")
+                continue
+
+            operator = load_lidw_operator(path)
+            with rasterio.open(path_to_population_raster) as raster:
+                # Pixels of the settlements, when only those were interpolated
+                if settlements_only and pixel_mask is None:
+                    pixel_mask = settlement_pixel_mask(raster, path_to_mask_shapefile)
+                new_operator, recompute = update_lidw_operator(operator, raster, old_df[old_mask], df[mask],
+                                                               country_shape, pixel_mask, kernel, order)
+
+            if use_cache:
+                save_lidw_operator(lidw_operator_path(country, year, df[mask], path_to_population_raster,
+                                                      path_to_mask_shapefile, variant), new_operator)
+
+            # Pixels that may change: the recomputed ones and those weighting a cluster whose value changed
+            width = operator['shape'][1]
+            flat = operator['rows'] * width + operator['cols']
+            weighted = operator['matrix'].tocsc()
+            old_values = old_df[old_mask].set_index('cluster')
+            new_values = df[mask].set_index('cluster')
+            for indicator, output_path, std_path in zip(old_group, output_paths, std_paths):
+                common = old_values.index.intersection(new_values.index)
+                revalued = common[old_values.loc[common, indicator].to_numpy() !=
+                                  new_values.loc[common, indicator].to_numpy()]
+                columns = [old_values.index.get_loc(c) for c in revalued]
+                candidates = np.union1d(recompute, flat[np.unique(weighted[:, columns].indices)])
+
+                # Rewrite the pixels whose stored value differs, and those of the standard deviations
+                before = lidw_operator_pixel_values(operator, old_values[indicator].tolist(), candidates, std=std)
+                after = lidw_operator_pixel_values(new_operator, new_values[indicator].tolist(), candidates, std=std)
+                rasters = zip([output_path, std_path], before, after) if std else [(output_path, before, after)]
+                for raster_path, b, a in rasters:
+                    differ = b != a
+                    num_windows = rewrite_raster_pixels(raster_path, candidates[differ] // width,
+                                                        candidates[differ] % width, a[differ])
+                    print(f"{os.path.basename(raster_path)}: {int(np.sum(differ))} pixels rewritten in "
+                          f"{num_windows} blocks")
+
+                    # Rebuild the overviews and the cloud-optimized layout of the updated raster
+                    if num_windows > 0:
+                        cloud_optimize_geotiff(raster_path)
+
+    # Interpolate the remaining indicators from scratch, tile by tile as main1.py does
+    rebuild = [indicator for indicator in indicators if indicator in rebuild]
+    if len(rebuild) > 0:
+        local_inverse_distance_weighting_interpolation((country, year, rebuild), use_cache=use_cache,
+                                                       tile_budget=tile_budget, std=rebuild_std,
+                                                       settlements_only=settlements_only, kernel=kernel, order=order)
+
+
+def settlement_intersect_with_region(path_to_settlement_shapefile, regions):
+    # Open the settlement shapefile using fiona
+    with fiona.open(path_to_settlement_shapefile, "r") as shapefile:
+        # Extract coordinates of settlement shapes
+        shapes = [feature["geometry"]["coordinates"][0] for feature in shapefile]
+
+        # Initialize lists to store intersections
+        settlement_intersections = [[] for _ in shapes]
+        region_intersections = [[] for _ in regions]
+
+        # Iterate through settlements
+        for i, settlement in enumerate(shapes):
+            settlement = Polygon(settlement)
+
+            # Iterate through regions
+            for j, region in enumerate(regions):
+                region = region[0]
+                # Check for intersection between settlement and region
+                if settlement.intersects(region):
+                    settlement_intersections[i].append(j)
+                    region_intersections[j].append(i)
+
+    return settlement_intersections, region_intersections
+
+
+def dhs_estimation_for_settlements(numerator, denominator, dhs_settlement_clusters, dhs_settlement_id):
+    # Initialize a dictionary to store DHS estimations
+    dhs_estimation_dict = {}
+
+    # Iterate through DHS settlement IDs
+    for i, id in enumerate(dhs_settlement_id):
+        # Get clusters within the current settlement
+        clusters_within_settlement = dhs_settlement_clusters[i]
+
+        # Calculate numerator and denominator sums for the settlement
+        n_dhs = np.sum([numerator[c] for c in clusters_within_settlement])
+        d_dhs = np.sum([denominator[c] for c in clusters_within_settlement])
+
+        # Calculate the DHS estimation (avoid division by zero)
+        tmp = np.nan
+        if d_dhs > 0:
+            tmp = n_dhs / d_dhs
+
+        # Store the estimation in the dictionary
+        dhs_estimation_dict[id] = tmp
+
+    return dhs_estimation_dict
+
+
+def lidw_estimation_for_settlements(country, year, indicator, settlement_polygons, dhs_settlement_id, touched=True):
+    # Initialize a dictionary to store LIDW estimations
+    lidw_estimation_dict = {}
+
+    # Iterate through DHS settlement IDs
+    for i, id in enumerate(dhs_settlement_id):
+        # Get the polygon shape for the current settlement
+        shapei = Polygon(settlement_polygons[id])
+
+        # Get the path to the indicator raster for the given country, year, and indicator
+        path_to_indicator_raster = indicator_raster(country, year, indicator)
+
+        # Calculate the average raster value within the settlement polygon
+        lidw_estimation_dict[id] = average_raster_within_shape(path_to_indicator_raster, shapei, touched=touched)
+
+    return lidw_estimation_dict
+
+#       THE FUNCTIONS FOR VALIDATION
+#---------------------------------------------------------------------------------------------------
+
+# Progress of the long validation runs, configured by the main scripts with configure_progress_logging
+progress_logger = logging.getLogger('lidw_functions.progress')
+
+
+def configure_progress_logging(level=logging.INFO):
+    """
+    Sends the progress reports of progress_logger to the standard error of the current process.
+
+    The main scripts call it in the parent process and pass it as the initializer of their multiprocessing.Pool,
+    so the reports of the workers are also shown when they are spawned rather than forked.
+
+    Args:
+        level (int): Logging level of the reports.
+    """
+    logging.basicConfig(level=level, format='%(asctime)s %(processName)s %(message)s')
+
+
+def open_result_stream(path, columns):
+    """
+    Opens an append-only CSV file of partial results, resuming from the rows already in it.
+
+    A last row cut by a crash or a kill is dropped, and a file written with other columns is started again.
+
+    Args:
+        path (str): Path to the file of partial results.
+        columns (list): Column names of the rows.
+
+    Returns:
+        stream (file): The file, opened for appending rows with append_result_rows.
+        done (DataFrame): Rows already in the file.
+    """
+    header = (','.join(columns) + '\n').encode()
+    content = b''
+
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            content = f.read()
+
+        # Keep the complete lines of a file with the same columns
+        content = content[:content.rfind(b'\n') + 1] if content.startswith(header) else b''
+
+    with open(path, 'r+b' if len(content) > 0 else 'wb') as f:
+        if len(content) > 0:
+            f.truncate(len(content))
+        else:
+            f.write(header)
+        f.flush()
+        os.fsync(f.fileno())
+
+    done = pd.read_csv(path, float_precision='round_trip')
+
+    return open(path, 'a'), done
+
+
+def append_result_rows(stream, rows, sync=False):
+    """
+    Appends rows to a file of partial results, writing the floats so that they are read back exactly.
+
+    Args:
+        stream (file): File as returned by open_result_stream.
+        rows (list): List of rows, each a list of values in the order of the columns.
+        sync (bool): Whether to flush the rows to disk (fsync) after writing them.
+    """
+    for row in rows:
+        stream.write(','.join(str(v) if isinstance(v, (int, np.integer)) else repr(float(v)) for v in row) + '\n')
+
+    if sync:
+        stream.flush()
+        os.fsync(stream.fileno())
+
+
+def log_progress(label, done, total, started, resumed=0):
+    """
+    Reports the progress of a validation loop, with its throughput and estimated remaining time.
+
+    The values are also passed to the log handlers as the 'progress' attribute of the record.
+
+    Args:
+        label (str): Name of the run (e.g. the country, year and indicator).
+        done (int): Number of units done, including those of a previous run.
+        total (int): Total number of units.
+        started (float): Start time (time.time()) of this run.
+        resumed (int): Number of units done by a previous run.
+    """
+    elapsed = time.time() - started
+    rate = (done - resumed) / elapsed if elapsed > 0 else 0.0
+    eta = (total - done) / rate if rate > 0 else float('nan')
+
+    progress_logger.info('%s: %d/%d done, %.2f/s, ETA %.0f s', label, done, total, rate, eta,
+                         extra={'progress': {'label': label, 'done': done, 'total': total, 'rate': rate, 'eta': eta}})
+
+
+def validation_network_level(x, sync_seconds=10, report_seconds=30, use_cache=True):
+    """
+    Network-level leave-one-out validation of one indicator, resuming from the rows of a stopped run.
+
+    The row of every left-out cluster is streamed to {output}.partial, which is removed once the output is written.
+    The leave-one-out neighbourhoods are read from the cache of validation_geometry, so a resumed run does not
+    compute them again.
+
+    Args:
+        x (tuple): Country, year and indicator.
+        sync_seconds (float): Interval between the flushes (fsync) of the streamed rows to disk.
+        report_seconds (float): Interval between the progress reports of progress_logger.
+        use_cache (bool): Whether to read and write the cached validation context and geometry.
+    """
+    # Unpack the input tuple
+    country, year, indicator = x
+
+    progress_logger.info('%s starts', x)
+
+    # Get alpha3 country code
+    code, CODE = get_country_alpha3_code(country)
+
+    # Clean DHS data of the survey, and the clusters with a value of the indicator
+    context = validation_context((country, year), use_cache=use_cache)
+    mask, _ = valid_cluster_groups(context['df'], [indicator])[0]
+    df = context['df'][mask]
+
+    # Extract indicator values and cluster locations
+    indicator_percentages = df[indicator].tolist()
+    locations = dhs_cluster_locations(df)
+
+    # Create a subfolder for saving results
+    subfolder = f"{result_root}{country}/{year}/validation/"
+    if not os.path.exists(subfolder):
+        os.makedirs(subfolder)
+
+    # Define output file path
+    # output = subfolder + CODE + '_VAL2_' + indicator + '_' + year + '.csv'
+    output = f"{subfolder}{CODE}_VAL2_{indicator}_{year}.csv"
 
     # Initialize lists to store computed values
     indicator_mean, indicator_std = [0 for f in indicator_percentages], [0 for f in indicator_percentages]
 
-    # Iterate through locations for validation
-    for q, location in enumerate(locations):
-        print(q)
-        # Get remaining locations and indicator values
-        remaining_locations = [l for i, l in enumerate(locations) if i != q]
-        remaining_indicator_percentages = [indicator_percentages[i] for i, l in enumerate(locations) if i != q]
-
-        # Combine remaining locations with boundary points
-        remaining_locations_plus_boundaries = remaining_locations + boundaries
-        points = MultiPoint(remaining_locations_plus_boundaries)
-
-        # Calculate Voronoi diagram
-        polygons = voronoi_diagram(points)
-
-        regions=[]
-
-        # Identify Voronoi regions for each remaining location
-        for poly in polygons.geoms:
-            for l,f in zip(remaining_locations,remaining_indicator_percentages) :
-                point=Point(l)
-                if point.within(poly) :
-                    regions.append([poly,l,f])
-                    b=True
-                    break
-
-
-        # Build a network connecting intersecting Voronoi regions
-        net = [[i] for i, r in enumerate(regions)]
-        for i in range(len(regions)):
-            p1 = regions[i][0]
-            for j in range(i + 1, len(regions)):
-                p2 = regions[j][0]
-                if p1.intersects(p2) :
-                    net[i].append(j)
-                    net[j].append(i)
-
-        # Find the index of polygon that include the location
-        k = None
-        point = Point(location)
-        for i in range(len(regions)):
-            polygon = regions[i][0]
-            if point.within(polygon):
-                k = i
-                break
-
-        # Calculate the indicator percentage prediction for the location based on the LIDW interpolation
-        neighbors_indicator_percentage = [regions[a][2] for a in net[k]]
-
-        inverse_distance = [1 / distance(location, regions[a][1]) for a in net[k]]
-        weight = [d / sum(inverse_distance) for d in inverse_distance]
-
-        v1 = sum([v * w for v, w in zip(neighbors_indicator_percentage, weight)])
-        v2 = sum([v * v * w for v, w in zip(neighbors_indicator_percentage, weight)])
-        vs = np.sqrt(v2 - v1 * v1)
-
-        indicator_mean[q] = v1
-        indicator_std[q] = vs
+    # Rows of a previous run that was stopped, streamed to an append-only file next to the output
+    # (only the rows of the same clusters are kept)
+    clusters = df['cluster'].tolist()
+    stream, done = open_result_stream(f"{output}.partial", ['Q', 'CLUST_NUM', 'PRED_VAL', 'VAL_STD'])
+    finished = np.zeros(len(locations), dtype=bool)
+    for q, cluster, v1, vs in done.itertuples(index=False):
+        if q < len(clusters) and clusters[q] == cluster:
+            indicator_mean[q], indicator_std[q], finished[q] = v1, vs, True
+
+    # Neighbourhood of the region holding each left-out location in the network of the remaining locations
+    # (cached with the validation geometry, and not needed when all the rows were done by a previous run)
+    if not np.all(finished):
+        neighbourhoods = validation_geometry(context, mask)['loocv']
+
+    started, resumed = time.time(), int(np.sum(finished))
+    synced = reported = started
+
+    # Iterate through locations for validation
+    for q, location in enumerate(locations):
+        if finished[q]:
+            continue
+
+        if neighbourhoods[q] is None:
+            # The location is on a region border or outside all regions
+            indicator_mean[q], indicator_std[q] = np.nan, np.nan
+        else:
+            nbr, d = neighbourhoods[q]
+
+            # Calculate the indicator percentage prediction for the location based on the LIDW interpolation
+            neighbors_indicator_percentage = [indicator_percentages[a] for a in nbr]
+
+            inverse_distance = 1 / d
+            weight = inverse_distance / np.sum(inverse_distance)
+
+            v1 = sum([v * w for v, w in zip(neighbors_indicator_percentage, weight)])
+            v2 = sum([v * v * w for v, w in zip(neighbors_indicator_percentage, weight)])
+            vs = np.sqrt(v2 - v1 * v1)
+
+            indicator_mean[q] = v1
+            indicator_std[q] = vs
+
+        # Stream the row, flushing it to disk every sync_seconds
+        now = time.time()
+        sync = now - synced >= sync_seconds
+        append_result_rows(stream, [[q, clusters[q], indicator_mean[q], indicator_std[q]]], sync=sync)
+        finished[q] = True
+        if sync:
+            synced = now
+
+        # Report the throughput every report_seconds
+        if now - reported >= report_seconds:
+            log_progress(f"{country} {year} {indicator}", int(np.sum(finished)), len(locations), started, resumed)
+            reported = now
+
+    append_result_rows(stream, [], sync=True)
+    stream.close()
+
+    # Create a result DataFrame and save to CSV
+    result = pd.DataFrame()
+    result['CLUST_NUM'] = df['cluster'].tolist()
+    result['DHS_VAL'] = indicator_percentages
+    result['PRED_VAL'] = indicator_mean
+    result['VAL_STD'] = indicator_std
+    result.to_csv(output)
+
+    # The partial rows are no longer needed once the output is written
+    os.remove(f"{output}.partial")
+
+    #result.to_csv('test.csv')
+    progress_logger.info('%s ends', x)
+
+
+def loocv_weight_matrix(neighbourhoods, kernel=None):
+    """
+    Builds the sparse matrix of the normalized weights of the leave-one-out predictions.
+
+    Row q holds the weights of the neighbours of left-out cluster q, so the predictions of every
+    indicator of a group of clusters are a single matrix product.
+
+    Args:
+        neighbourhoods (list): Neighbourhoods of one order, as returned by network_loocv_neighbourhoods.
+        kernel (function): Interpolation kernel as returned by lidw_kernel; 1/distance when None.
+
+    Returns:
+        weights (scipy.sparse.csr_matrix): Matrix of weights (left-out clusters x clusters), empty rows for
+            the clusters outside all regions.
+    """
+    n = len(neighbourhoods)
+    rows, cols, data = [], [], []
+
+    for q, neighbourhood in enumerate(neighbourhoods):
+        if neighbourhood is None:
+            continue
+
+        # Normalized weights of the neighbours of the left-out cluster
+        nbr, d = neighbourhood
+        weight = kernel_weights(d, kernel)
+        rows.append(np.full(len(nbr), q))
+        cols.append(nbr)
+        data.append(weight / np.sum(weight))
+
+    if len(rows) == 0:
+        return sparse.csr_matrix((n, n))
+
+    return sparse.csr_matrix((np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))), shape=(n, n))
+
+
+def validation_network_level_indicators(x, indicators=None, use_cache=True):
+    """
+    Network-level leave-one-out validation of all the indicators of a country-year.
+
+    The leave-one-out neighbourhoods only depend on which clusters have values, so they are computed
+    once for every group of indicators with the same valid clusters (valid_cluster_groups) and cached
+    with the validation context (validation_geometry); the predictions of all the indicators of the
+    group are matrix products with loocv_weight_matrix. The CSV file of each indicator is the one
+    written by validation_network_level.
+
+    Args:
+        x (tuple): Country and year.
+        indicators (list): List of indicator column names, read_list_of_indicators() when None.
+        use_cache (bool): Whether to read and write the cached validation context.
+    """
+    country, year = x
+
+    progress_logger.info('%s starts', x)
+
+    if indicators is None:
+        indicators = read_list_of_indicators()
+
+    # Get alpha3 country code
+    code, CODE = get_country_alpha3_code(country)
+
+    # Clean DHS data shared by all the validations of the survey
+    context = validation_context(x, use_cache=use_cache)
+    df = context['df']
+
+    # Create a subfolder for saving results
+    subfolder = f"{result_root}{country}/{year}/validation/"
+    if not os.path.exists(subfolder):
+        os.makedirs(subfolder)
+
+    for mask, group in valid_cluster_groups(df, indicators):
+        # Indicator values of the valid clusters, one column per indicator of the group
+        valid = df[mask]
+        values = valid[group].to_numpy(dtype=float)
+
+        # Neighbourhoods and weights of the left-out clusters, shared by all indicators of the group
+        neighbourhoods = validation_geometry(context, mask)['loocv']
+        weights = loocv_weight_matrix(neighbourhoods)
+
+        # Weighted mean and standard deviation of the neighbours of every left-out cluster
+        v1 = weights @ values
+        v2 = weights @ (values * values)
+        with np.errstate(invalid='ignore'):
+            vs = np.sqrt(v2 - v1 * v1)
+
+        # Clusters on a region border or outside all regions have no prediction
+        missing = np.array([neighbourhood is None for neighbourhood in neighbourhoods], dtype=bool)
+        v1[missing], vs[missing] = np.nan, np.nan
+
+        for j, indicator in enumerate(group):
+            # Create a result DataFrame and save to CSV
+            result = pd.DataFrame()
+            result['CLUST_NUM'] = valid['cluster'].tolist()
+            result['DHS_VAL'] = values[:, j]
+            result['PRED_VAL'] = v1[:, j]
+            result['VAL_STD'] = vs[:, j]
+            result.to_csv(f"{subfolder}{CODE}_VAL2_{indicator}_{year}.csv")
+
+    progress_logger.info('%s ends', x)
+
+
+# Kernel settings compared by lidw_kernel_sweep: (kernel name, parameter)
+lidw_kernel_settings = [('idw', 1.0), ('idw', 1.5), ('idw', 2.0), ('idw', 2.5), ('idw', 3.0),
+                        ('gaussian', 5.0), ('gaussian', 10.0), ('gaussian', 20.0), ('gaussian', 40.0)]
+
+
+def delaunay_deletion_triangles(tri, sites, neighbours, removed):
+    """
+    Finds the triangles that fill the hole left when some sites are removed from a triangulation.
+
+    Removing sites only changes the triangles of their stars: the hole is filled by the triangles of the
+    Delaunay triangulation of the sites around it that lie inside the hole, so the new triangles are found
+    from a triangulation of a handful of points instead of all the sites.
+
+    Args:
+        tri (scipy.spatial.Delaunay): Triangulation of all the sites.
+        sites (numpy.ndarray): Coordinates of the sites of the triangulation.
+        neighbours (list): Set of the Delaunay neighbours of each site.
+        removed (list): Indices of the removed sites (or a single index).
+
+    Returns:
+        triangles (numpy.ndarray): Array of shape (triangles, 3) with the site indices of the new triangles.
+    """
+    removed = np.atleast_1d(removed)
+    around = np.array(sorted(set().union(*[neighbours[q] for q in removed.tolist()]) - set(removed.tolist())),
+                      dtype=np.int64)
+
+    if len(around) < 3:
+        return np.zeros((0, 3), dtype=np.int64)
+
+    # Triangulate the sites around the hole and keep the triangles inside the stars of the removed sites
+    local = Delaunay(sites[around])
+    centroid = np.mean(sites[around][local.simplices], axis=1)
+    simplex = tri.find_simplex(centroid)
+    inside = (simplex >= 0) & np.any(np.isin(tri.simplices[simplex], removed), axis=1)
+
+    return around[local.simplices[inside]]
+
+
+def delaunay_deletion_neighbours(tri, sites, neighbours, q):
+    """
+    Finds the Delaunay edges created when one site is removed from a triangulation.
+
+    Args:
+        tri (scipy.spatial.Delaunay): Triangulation of all the sites.
+        sites (numpy.ndarray): Coordinates of the sites of the triangulation.
+        neighbours (list): Set of the Delaunay neighbours of each site.
+        q (int): Index of the removed site.
+
+    Returns:
+        new (dict): For every neighbour of the removed site, the set of its new neighbours.
+    """
+    new = {a: set() for a in sorted(neighbours[q])}
+
+    # Every side of a triangle filling the hole is an edge of the new triangulation
+    for a, b, c in delaunay_deletion_triangles(tri, sites, neighbours, q).tolist():
+        new[a].update((b, c))
+        new[b].update((a, c))
+        new[c].update((a, b))
+
+    return new
+
+
+def delaunay_deletion_context(locations, country_shape, table=None):
+    """
+    Triangulates the cluster sites once so that networks without some of the clusters are found locally.
+
+    Args:
+        locations (list): List of cluster locations (coordinates).
+        country_shape (GeoDataFrame): Country shape, used for the bounding points and the clipping polygon.
+        table (numpy.ndarray): Neighbour table of the network of the locations, when it is already known
+            (as stored by validation_geometry); computed with delaunay_clusters_network when None.
+
+    Returns:
+        context (dict): Dictionary with the triangulation, the neighbours and triangles of every site, and the
+            network of delaunay_clusters_network (with self-loops) as a list and as a neighbour_table.
+    """
+    n = len(locations)
+
+    # Triangulate all the sites once, with the bounding points that close the border cells
+    sites = append_country_bounds_to_locations(np.reshape(np.asarray(locations, dtype=float), (-1, 2)), country_shape)
+    tri = Delaunay(sites)
+    indptr, indices = tri.vertex_neighbor_vertices
+    neighbours = [set(indices[indptr[i]:indptr[i + 1]].tolist()) for i in range(len(sites))]
+
+    # Triangles around every site
+    order = np.argsort(tri.simplices.ravel(), kind='stable')
+    bounds = np.searchsorted(tri.simplices.ravel()[order], np.arange(len(sites) + 1))
+    incident = [order[bounds[i]:bounds[i + 1]] // 3 for i in range(len(sites))]
+
+    country_polygon = country_shape['geometry'][0]
+    shapely.prepare(country_polygon)
+
+    if table is None:
+        net = delaunay_clusters_network(locations, country_shape, self_loop=True)
+        table = neighbour_table(net)
+    else:
+        net = [row[row >= 0].tolist() for row in table]
+
+    return {'tri': tri, 'sites': sites, 'neighbours': neighbours, 'incident': incident, 'polygon': country_polygon,
+            'locations': locations, 'country_shape': country_shape, 'num_locations': n, 'net': net,
+            'table': table,
+            # Delaunay keeps only one of the sites sharing their coordinates, and which one depends on the other sites
+            'rebuild': len(np.unique(sites, axis=0)) < len(sites)}
+
+
+def network_table_without_sites(context, removed):
+    """
+    Returns the network of delaunay_clusters_network (with self-loops) once some clusters are removed.
+
+    Only the edges between the clusters around the removed ones change: they are found from the triangles
+    filling the hole (delaunay_deletion_triangles) and the unchanged triangles around it, and tested
+    against the country polygon as in delaunay_clusters_network. The indices are those of all the clusters.
+
+    Args:
+        context (dict): Context as returned by delaunay_deletion_context.
+        removed (list): Indices of the removed clusters.
+
+    Returns:
+        table (numpy.ndarray): Neighbour table of the network (padded with -1), empty rows for the removed clusters.
+    """
+    n = context['num_locations']
+    removed = np.unique(np.asarray(removed, dtype=np.int64))
+    is_removed = np.zeros(n, dtype=bool)
+    is_removed[removed] = True
+
+    if context['rebuild']:
+        # Network of the remaining locations, with indices of the full list of locations
+        remaining = np.flatnonzero(~is_removed)
+        net = delaunay_clusters_network([context['locations'][i] for i in remaining], context['country_shape'],
+                                        self_loop=True)
+        rows = {i: remaining[net[j]].tolist() for j, i in enumerate(remaining.tolist())}
+    else:
+        tri, sites, neighbours = context['tri'], context['sites'], context['neighbours']
+
+        # Sites around the hole
+        around = set().union(*[neighbours[q] for q in removed.tolist()]) - set(removed.tolist())
+
+        # Triangles filling the hole and the unchanged triangles around it
+        old = np.unique(np.concatenate([context['incident'][a] for a in around]))
+        old = old[~np.any(np.isin(tri.simplices[old], removed), axis=1)]
+        simplices = np.concatenate([delaunay_deletion_triangles(tri, sites, neighbours, removed),
+                                    tri.simplices[old]])
+
+        # Edges between the clusters around the hole, kept when their Voronoi edge touches the country polygon
+        a, b, t1, t2 = triangle_edges(simplices, len(sites))
+        keep = np.isin(a, list(around)) & np.isin(b, list(around)) & (b < n)
+        a, b, t1, t2 = a[keep], b[keep], t1[keep], t2[keep]
+        if len(a) > 0:
+            touch = voronoi_edges_touching(sites, simplices, a, b, t1, t2, context['polygon'])
+            a, b = a[touch], b[touch]
+
+        # The other edges of the clusters around the hole do not change
+        rows = {i: {j for j in context['net'][i] if j not in around and not is_removed[j]} for i in around if i < n}
+        for i, j in zip(a.tolist(), b.tolist()):
+            rows[i].add(j)
+            rows[j].add(i)
+        rows = {i: [i] + sorted(row - {i}) for i, row in rows.items()}
+
+    # Replace the rows of the changed clusters in the neighbour table
+    table = context['table']
+    degree = max([table.shape[1]] + [len(row) for row in rows.values()])
+    table = np.pad(table, ((0, 0), (0, degree - table.shape[1])), constant_values=-1)
+    table[is_removed] = -1
+    for i, row in rows.items():
+        table[i] = -1
+        table[i, :len(row)] = row
+
+    return table
+
+
+def network_table_of_sites(context, keep):
+    """
+    Returns the network of delaunay_clusters_network (with self-loops) of the kept clusters, numbered among them.
+
+    Args:
+        context (dict): Context as returned by delaunay_deletion_context.
+        keep (numpy.ndarray): Boolean mask of the kept clusters.
+
+    Returns:
+        table (numpy.ndarray): Neighbour table of the network of the kept clusters (padded with -1).
+    """
+    kept = np.flatnonzero(keep)
+    if len(kept) == context['num_locations']:
+        return context['table']
+
+    # Remove the other clusters locally and renumber the kept ones
+    table = network_table_without_sites(context, np.flatnonzero(~np.asarray(keep)))[kept]
+    renumber = np.full(context['num_locations'], -1, dtype=np.int64)
+    renumber[kept] = np.arange(len(kept))
+
+    return np.where(table >= 0, renumber[np.maximum(table, 0)], -1)
+
+
+def network_loocv_neighbourhoods(locations, boundaries, orders=(1,)):
+    """
+    Finds the neighbours of every left-out cluster in the network-level leave-one-out validation.
+
+    As in validation_network_level, each cluster is left out in turn and the neighbourhood of the region
+    holding the left-out cluster in the network of the remaining clusters is used. The triangulation is
+    built once: leaving a cluster out only changes the edges of its Delaunay neighbours, which are found
+    with delaunay_deletion_neighbours, and the region holding the cluster is the one of its nearest
+    remaining site. When several sites share their coordinates, the network of the remaining clusters is
+    rebuilt for every left-out cluster instead.
+
+    Args:
+        locations (list): List of cluster locations (coordinates).
+        boundaries (list): Bounding points of the country.
+        orders (tuple): Orders of the neighbourhoods.
+
+    Returns:
+        neighbourhoods (dict): For every order, a list with the (cluster indices, distances in km) of the
+            neighbours of each left-out cluster, or None when it falls outside all regions.
+    """
+    neighbourhoods = {order: [] for order in orders}
+    n = len(locations)
+
+    # Triangulate all the sites once, with the bounding points that close the border cells
+    sites = np.append(np.reshape(np.asarray(locations, dtype=float), (-1, 2)), boundaries, axis=0)
+    tri = Delaunay(sites)
+    indptr, indices = tri.vertex_neighbor_vertices
+    neighbours = [set(indices[indptr[i]:indptr[i + 1]].tolist()) for i in range(len(sites))]
+
+    # Delaunay keeps only one of the sites sharing their coordinates, and which one depends on the other sites
+    rebuild = len(np.unique(sites, axis=0)) < len(sites)
+
+    # Three nearest sites of every cluster, the first being the cluster itself
+    d, idx = cKDTree(sites).query(sites[:n], k=3)
+
+    for q, location in enumerate(locations):
+        if rebuild:
+            # Network and regions of the remaining locations, with indices of the full list of locations
+            remaining_locations = [l for i, l in enumerate(locations) if i != q]
+            net = delaunay_clusters_network(remaining_locations, bounds=boundaries, self_loop=True, clip=False)
+            locator = voronoi_site_locator(remaining_locations, bounds=boundaries)
+            k = locate_voronoi_sites(locator, [location[0]], [location[1]])[0]
+            k = k + (k >= q) if k >= 0 else k
+            changed = {j + (j >= q): {a + (a >= q) for a in net[j]} for j in range(n - 1)}
+        else:
+            # The region holding the left-out location is the one of its nearest remaining site,
+            # unless it is equidistant from two sites or it is the region of a bounding point
+            k = int(idx[q, 1]) if d[q, 1] != d[q, 2] and idx[q, 1] < n else -1
+
+            # Neighbours of the clusters around the left-out cluster once it is removed
+            new = delaunay_deletion_neighbours(tri, sites, neighbours, q)
+            changed = {a: {a} | {b for b in neighbours[a] | new[a] if b < n and b != q} for a in new if a < n}
+
+        for order in orders:
+            if k < 0:
+                # The location is on a region border or outside all regions
+                neighbourhoods[order].append(None)
+                continue
+
+            # Neighbourhood of the given order of the region (the region itself first)
+            nbr = {k}
+            for _ in range(order):
+                nbr = set().union(*[changed[j] if j in changed else {j} | {b for b in neighbours[j] if b < n}
+                                    for j in nbr])
+            nbr = np.array([k] + sorted(nbr - {k}), dtype=np.int64)
+
+            # Neighbours as indices of the full list of locations, with their distances to the left-out location
+            d_nbr = distances_from(location, [locations[a] for a in nbr])
+            neighbourhoods[order].append((nbr, d_nbr))
+
+    return neighbourhoods
+
+
+def validation_context_path(country, year, path_to_settlements_shapefile):
+    # Obtain the country code
+    code, CODE = get_country_alpha3_code(country)
+
+    # Identify the DHS survey, the country shape and the settlements by their path, size and modification time
+    key = ''
+    for path in [dhs_csv_file(country, year), country_shapefile(country), path_to_settlements_shapefile]:
+        if path is not None:
+            stat = os.stat(path)
+            key += f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}:"
+    key = hashlib.sha1(key.encode()).hexdigest()[:16]
+
+    return f"{data_root}{country}/{year}/lidw/{code}_{year}_validation_context_{key}.npz"
+
+
+def validation_context(x, use_cache=True):
+    """
+    Returns the preprocessing shared by the validations of a country-year, from the cache when it exists.
+
+    The cleaned DHS clusters and the clusters inside every settlement (dhs_clusters_inside_settlements)
+    are cached once per survey; the geometry of every group of valid clusters is added by validation_geometry.
+    The settlements are those of settlements_shapefile(country, year), as in the settlement validations.
+
+    Args:
+        x (tuple): Country and year.
+        use_cache (bool): Whether to read and write the cached context.
+
+    Returns:
+        context (dict): Dictionary with the cleaned DHS data 'df', the cluster 'locations', the bounding points
+            'boundaries', the 'country_shape', the 'settlements_shapefile' (None when missing) and the
+            'dhs_locations_in_settlement' lists.
+    """
+    country, year = x
+
+    path_to_settlements_shapefile = settlements_shapefile(country, year)
+    path = validation_context_path(country, year, path_to_settlements_shapefile)
+
+    raw = pd.read_csv(dhs_csv_file(country, year))
+    country_shape = gpd.read_file(country_shapefile(country))
+
+    if use_cache and os.path.exists(path):
+        # Rows of the clean clusters and the clusters of every settlement (in CSR form)
+        with np.load(path) as cache:
+            kept, indptr, indices = cache['kept'], cache['settlement_indptr'], cache['settlement_indices']
+    else:
+        df = removing_spurious_data(raw)
+        kept = raw.index.get_indexer(df.index)
+
+        dhs_locations_in_settlement = []
+        if path_to_settlements_shapefile is not None:
+            dhs_locations_in_settlement, _, _ = dhs_clusters_inside_settlements(
+                path_to_settlements_shapefile, dhs_cluster_locations(df), dhs_cluster_areas_type(df))
+
+        indptr = np.concatenate([[0], np.cumsum([len(c) for c in dhs_locations_in_settlement])]).astype(np.int64)
+        indices = np.concatenate([[]] + dhs_locations_in_settlement).astype(np.int64)
+
+        if use_cache:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            np.savez(path, kept=kept, settlement_indptr=indptr, settlement_indices=indices)
+
+    df = raw.iloc[kept]
+
+    # Bounding points of the country, as appended by append_country_bounds_to_locations
+    min_lng, min_lat, max_lng, max_lat = country_shape.total_bounds
+    boundaries = [(max_lng + 1, max_lat + 1), (min_lng - 1, max_lat + 1), (max_lng + 1, min_lat - 1),
+                  (min_lng - 1, min_lat - 1)]
+
+    return {'country': country, 'year': year, 'path': path, 'use_cache': use_cache, 'df': df,
+            'locations': dhs_cluster_locations(df), 'boundaries': boundaries, 'country_shape': country_shape,
+            'settlements_shapefile': path_to_settlements_shapefile,
+            'dhs_locations_in_settlement': [indices[indptr[i]:indptr[i + 1]].tolist() for i in range(len(indptr) - 1)]}
+
+
+def validation_geometry(context, mask):
+    """
+    Returns the triangulation, network and leave-one-out neighbourhoods of a group of valid clusters.
+
+    The network of delaunay_clusters_network and the network-level leave-one-out neighbourhoods
+    (network_loocv_neighbourhoods) are cached next to the validation context, so they are computed once
+    per survey and group of valid clusters; the triangulation itself is rebuilt from the locations.
+
+    Args:
+        context (dict): Context as returned by validation_context.
+        mask (numpy.ndarray): Boolean mask of the valid clusters of the group (see valid_cluster_groups).
+
+    Returns:
+        geometry (dict): Dictionary with the valid 'locations', the 'deletion' context of delaunay_deletion_context
+            and the leave-one-out neighbourhoods 'loocv' (as network_loocv_neighbourhoods(...)[1]).
+    """
+    mask = np.asarray(mask, dtype=bool)
+    locations = [context['locations'][c] for c in np.flatnonzero(mask)]
+
+    # The geometry of a group is identified by the context and its valid clusters
+    key = hashlib.sha1(context['path'].encode() + np.packbits(mask).tobytes()).hexdigest()[:16]
+    path = context['path'].replace('_validation_context_', '_validation_geometry_')[:-20] + f"{key}.npz"
+
+    if context['use_cache'] and os.path.exists(path):
+        with np.load(path) as cache:
+            table = cache['table']
+            indptr, indices, distances = cache['loocv_indptr'], cache['loocv_indices'], cache['loocv_distances']
+            missing = cache['loocv_missing']
+        neighbourhoods = [None if missing[q] else (indices[indptr[q]:indptr[q + 1]], distances[indptr[q]:indptr[q + 1]])
+                          for q in range(len(locations))]
+        deletion = delaunay_deletion_context(locations, context['country_shape'], table=table)
+    else:
+        deletion = delaunay_deletion_context(locations, context['country_shape'])
+        neighbourhoods = network_loocv_neighbourhoods(locations, context['boundaries'])[1]
+
+        if context['use_cache']:
+            # Neighbourhoods in CSR form, empty for the clusters without a region
+            sizes = [0 if neighbourhood is None else len(neighbourhood[0]) for neighbourhood in neighbourhoods]
+            found = [neighbourhood for neighbourhood in neighbourhoods if neighbourhood is not None]
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            np.savez(path, table=deletion['table'],
+                     loocv_indptr=np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64),
+                     loocv_indices=np.concatenate([[]] + [nbr for nbr, _ in found]).astype(np.int64),
+                     loocv_distances=np.concatenate([[]] + [d for _, d in found]).astype(float),
+                     loocv_missing=np.array([neighbourhood is None for neighbourhood in neighbourhoods], dtype=bool))
+
+    return {'locations': locations, 'deletion': deletion, 'loocv': neighbourhoods}
+
+
+def kernel_loocv_predictions(neighbourhoods, indicator_percentages, kernel=None, std=False):
+    """
+    Predicts every left-out cluster from its neighbours with an interpolation kernel.
+
+    Args:
+        neighbourhoods (list): Neighbourhoods of one order, as returned by network_loocv_neighbourhoods.
+        indicator_percentages (list): Indicator values of the DHS clusters.
+        kernel (function): Interpolation kernel as returned by lidw_kernel; 1/distance when None.
+        std (bool): Whether to also return the weighted standard deviation of the neighbour values.
+
+    Returns:
+        predict (numpy.ndarray): Predictions, NaN for the clusters without a neighbourhood or positive weights.
+        spread (numpy.ndarray): Weighted standard deviations, NaN where the prediction is NaN (only if std).
+    """
+    values = np.asarray(indicator_percentages, dtype=float)
+    predict = np.full(len(neighbourhoods), np.nan)
+    spread = np.full(len(neighbourhoods), np.nan)
+
+    for q, neighbourhood in enumerate(neighbourhoods):
+        if neighbourhood is None:
+            continue
+
+        nbr, d = neighbourhood
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            weight = kernel_weights(d, kernel)
+            weight = weight / np.sum(weight)
+            predict[q] = np.sum(values[nbr] * weight)
+
+            # Weighted standard deviation sqrt(v2 - v1 * v1), as in lidw_apply_weights
+            spread[q] = np.sqrt(np.maximum(np.sum(values[nbr] ** 2 * weight) - predict[q] ** 2, 0.0))
+
+    if std:
+        return predict, spread
+
+    return predict
+
+
+def loocv_error_summary(actual, predict, std=None):
+    """
+    Summarises the errors of the leave-one-out predictions with the metrics of validation_metrics.
+
+    Args:
+        actual (numpy.ndarray): Observed values.
+        predict (numpy.ndarray): Predicted values (NaN predictions are left out).
+        std (numpy.ndarray): Standard deviations of the predictions, for the coverage P95.
+
+    Returns:
+        summary (dict): Number of predictions 'N', 'BIAS', 'RMSE', 'MAE', percentage 'P95' of observed values within
+            1.96 standard deviations of the prediction (NaN without std) and 95th percentile 'AE95' of the
+            absolute errors.
+    """
+    metrics = error_metrics(actual, predict, std)
+
+    return {name: metrics[name] for name in ['N', 'BIAS', 'RMSE', 'MAE', 'P95', 'AE95']}
+
+
+def lidw_kernel_sweep(x, settings=None, orders=(1, 2)):
+    """
+    Compares interpolation kernels and neighbourhood orders with the network-level leave-one-out validation.
+
+    The neighbourhoods and distances are computed once per set of valid clusters, and every kernel
+    setting and indicator only recombines them. All the settings of an indicator are scored on the same
+    clusters: those predicted by every kernel and order.
+
+    Args:
+        x (tuple): Country and year.
+        settings (list): List of (kernel name, parameter) pairs, lidw_kernel_settings when None.
+        orders (tuple): Orders of the neighbourhoods.
+
+    Returns:
+        result (DataFrame): One row per indicator, kernel, parameter and order with the N, BIAS, RMSE, MAE, P95
+            coverage and AE95 of loocv_error_summary.
+    """
+    country, year = x
+    progress_logger.info('%s starts', x)
+    started = time.time()
+
+    if settings is None:
+        settings = lidw_kernel_settings
+
+    code, CODE = get_country_alpha3_code(country)
+    indicators = read_list_of_indicators()
+
+    # Read the DHS data once for all indicators
+    df = pd.read_csv(dhs_csv_file(country, year))
+    df = removing_spurious_data(df[['cluster'] + indicators + ['LNG', 'LAT']])
+
+    # Extract boundaries from country shapefile
+    country_shape = gpd.read_file(country_shapefile(country))
+    min_lng, min_lat, max_lng, max_lat = country_shape.total_bounds
+    boundaries = [(max_lng + 1, max_lat + 1), (min_lng - 1, max_lat + 1), (max_lng + 1, min_lat - 1), (min_lng - 1, min_lat - 1)]
+
+    rows = []
+    done = 0
+    for mask, group in valid_cluster_groups(df, indicators):
+        if not np.any(mask):
+            done += len(group)
+            continue
+
+        # Neighbourhoods of the left-out clusters, shared by all kernels and indicators of the group
+        neighbourhoods = network_loocv_neighbourhoods(dhs_cluster_locations(df[mask]), boundaries, orders)
+
+        for indicator in group:
+            actual = df[mask][indicator].to_numpy(dtype=float)
+            predicts = {(order, name, parameter): kernel_loocv_predictions(neighbourhoods[order], actual,
+                                                                           lidw_kernel(name, parameter), std=True)
+                        for order in orders for name, parameter in settings}
+
+            # Clusters predicted by every setting, so that the settings are compared on the same clusters
+            common = np.all([np.isfinite(predict) for predict, _ in predicts.values()], axis=0)
+
+            for (order, name, parameter), (predict, spread) in predicts.items():
+                rows.append({'INDICATOR': indicator, 'KERNEL': name, 'PARAMETER': parameter, 'ORDER': order,
+                             **loocv_error_summary(actual[common], predict[common], spread[common])})
+
+            done += 1
+            log_progress(f"{country} {year} kernel sweep", done, len(indicators), started)
+
+    result = pd.DataFrame(rows, columns=['INDICATOR', 'KERNEL', 'PARAMETER', 'ORDER', 'N', 'BIAS', 'RMSE', 'MAE',
+                                         'P95', 'AE95'])
+    result.insert(0, 'YEAR', year)
+    result.insert(0, 'COUNTRY', country)
+
+    # Save the table of the country-year
+    subfolder = f"{result_root}{country}/{year}/validation/"
+    if not os.path.exists(subfolder):
+        os.makedirs(subfolder)
+    result.to_csv(f"{subfolder}{CODE}_KERNEL_SWEEP_{year}.csv", index=False)
+
+    progress_logger.info('%s ends', x)
+    return result
+
+
+def settlement_folds(dhs_settlement_clusters, num_clusters, k=10, seed=0):
+    """
+    Splits the settlements holding DHS clusters into k disjoint folds with a fixed seed.
+
+    Settlements sharing a DHS cluster are kept in the same fold, so the clusters held out by
+    different folds are disjoint as well.
+
+    Args:
+        dhs_settlement_clusters (list): List of lists with the DHS cluster indices of each settlement.
+        num_clusters (int): Number of DHS clusters.
+        k (int): Number of folds.
+        seed (int): Seed of the random assignment of the settlements to the folds.
+
+    Returns:
+        fold (numpy.ndarray): Fold of every settlement.
+    """
+    if len(dhs_settlement_clusters) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    # Settlements x clusters membership, and the groups of settlements linked by shared clusters
+    rows = np.repeat(np.arange(len(dhs_settlement_clusters)), [len(c) for c in dhs_settlement_clusters])
+    cols = np.concatenate([np.asarray(c, dtype=np.int64) for c in dhs_settlement_clusters])
+    membership = sparse.csr_matrix((np.ones(len(cols)), (rows, cols)),
+                                   shape=(len(dhs_settlement_clusters), num_clusters))
+    num_groups, group = connected_components(membership @ membership.T, directed=False)
+
+    # Deal the groups in a random (but reproducible) order to the folds
+    order = np.random.default_rng(seed).permutation(num_groups)
+    group_fold = np.empty(num_groups, dtype=np.int64)
+    group_fold[order] = np.arange(num_groups) % k
+
+    return group_fold[group]
+
+
+def settlement_lidw_predictions(raster, band, locations, values, country_shape, members, net=None):
+    """
+    Averages the LIDW estimates of a set of DHS clusters within some settlements, interpolating only their pixels.
+
+    Args:
+        raster (DatasetReader): Open population raster.
+        band (numpy.ndarray): Population values of the raster.
+        locations (list): List of cluster locations (coordinates).
+        values (numpy.ndarray): Indicator values, one column per indicator and one row per cluster.
+        country_shape (GeoDataFrame): Country shape.
+        members (scipy.sparse.csr_matrix): Membership matrix of the settlements, as returned by settlement_pixel_matrix.
+        net (list): Network of the clusters (including self-loops), or its neighbour_table, when it is already
+            known (e.g. from network_table_of_sites); computed with delaunay_clusters_network when None.
+
+    Returns:
+        averages (numpy.ndarray): Array of shape (settlements, indicators) with the settlement averages.
+    """
+    # Interpolate only the pixels of the settlements
+    pixel_mask = np.zeros(raster.height * raster.width, dtype=bool)
+    pixel_mask[members.indices] = True
+    pixel_mask = np.reshape(pixel_mask, (raster.height, raster.width))
+
+    if net is None:
+        net = delaunay_clusters_network(locations, country_shape, self_loop=True)
+    operator = build_lidw_operator(raster, band, locations, net, voronoi_site_locator(locations, country_shape),
+                                   pixel_mask)
 
-    # Create a subfolder for saving results
-    subfolder = f"{result_root}{country}/{year}/validation/"
+    return settlement_lidw_averages(operator, members, values)
+
+
+def settlement_direct_estimates(df, dhs_settlement_clusters, indicators):
+    """
+    Computes the direct DHS estimates of the settlements holding clusters, from the numerators and denominators.
+
+    Args:
+        df (DataFrame): DHS cluster data with the num_ and den_ columns of the indicators.
+        dhs_settlement_clusters (list): Clusters of every settlement, as returned by dhs_settlements.
+        indicators (list): List of indicators.
+
+    Returns:
+        settlement_clusters (scipy.sparse.csr_matrix): Settlements x clusters membership matrix.
+        num_dhs_clust (numpy.ndarray): Number of clusters of every settlement.
+        dhs_estimate (numpy.ndarray): Array of shape (settlements, indicators) with the direct estimates (NaN
+            when the denominator is not positive).
+    """
+    num_dhs_clust = np.array([len(c) for c in dhs_settlement_clusters], dtype=np.int64)
+    settlement_clusters = sparse.csr_matrix((np.ones(np.sum(num_dhs_clust)),
+                                             (np.repeat(np.arange(len(dhs_settlement_clusters)), num_dhs_clust),
+                                              np.concatenate([[]] + dhs_settlement_clusters).astype(np.int64))),
+                                            shape=(len(dhs_settlement_clusters), len(df)))
+
+    # Sums of the numerators and denominators of the clusters of every settlement
+    numerator = settlement_clusters @ np.nan_to_num(df[['num' + i[3:] for i in indicators]].to_numpy(dtype=float))
+    denominator = settlement_clusters @ np.nan_to_num(df[['den' + i[3:] for i in indicators]].to_numpy(dtype=float))
+    dhs_estimate = np.divide(numerator, denominator, out=np.full(numerator.shape, np.nan), where=denominator > 0)
+
+    return settlement_clusters, num_dhs_clust, dhs_estimate
+
+
+def kfold_validation_settlements(x, k=10, seed=0, indicators=None, write_rasters=False, use_cache=True):
+    """
+    K-fold validation of the LIDW settlement estimates with disjoint, reproducible folds.
+
+    The settlements holding DHS clusters are split into k folds with settlement_folds. For every fold, the
+    clusters of its settlements are held out, and the LIDW estimates of the remaining clusters are computed
+    only on the pixels of the held-out settlements and averaged within them. The predictions are compared
+    with the direct DHS estimates of the settlements and with the LIDW estimates of all the clusters.
+
+    Args:
+        x (tuple): Country and year.
+        k (int): Number of folds.
+        seed (int): Seed of the assignment of the settlements to the folds.
+        indicators (list): List of indicators, read_list_of_indicators() when None.
+        write_rasters (bool): Whether to also write the LIDW raster of every fold and indicator, to the
+            tiff/kfold_valid/ folder of the country-year.
+        use_cache (bool): Whether to read and write the cached settlement membership matrix and validation context.
+
+    Returns:
+        result (DataFrame): One row per indicator and held-out settlement with its 'FOLD', 'NUM_DHS_CLUST',
+            direct estimate 'DHS_VAL', fold prediction 'PRED_VAL' and estimate from all the clusters 'FULL_VAL'.
+    """
+    country, year = x
+    progress_logger.info('%s starts', x)
+
+    code, CODE = get_country_alpha3_code(country)
+
+    if indicators is None:
+        indicators = read_list_of_indicators()
+
+    # Clean DHS data, country shape and clusters inside every settlement, shared by all the validations
+    context = validation_context(x, use_cache=use_cache)
+    df, locations, country_shape = context['df'], context['locations'], context['country_shape']
+    dhs_locations_in_settlement = context['dhs_locations_in_settlement']
+
+    path_to_settlements_shapefile = settlement_mask_shapefile(country, year)
+    path_to_population_raster = population_raster(country, year)
+
+    # Settlements holding DHS clusters, and their folds
+    dhs_settlement_clusters, dhs_settlement_id = dhs_settlements(dhs_locations_in_settlement)
+    fold = settlement_folds(dhs_settlement_clusters, len(df), k, seed)
+
+    with fiona.open(path_to_settlements_shapefile, "r") as shapefile:
+        shapes = [shape(feature["geometry"]) for feature in shapefile]
+
+    members = settlement_members(country, year, path_to_population_raster, path_to_settlements_shapefile, shapes,
+                                 use_cache=use_cache)[dhs_settlement_id]
+
+    # Settlements x clusters membership and direct DHS estimates of the DHS settlements
+    settlement_clusters, num_dhs_clust, dhs_estimate = settlement_direct_estimates(df, dhs_settlement_clusters,
+                                                                                   indicators)
+
+    prediction = np.full((len(dhs_settlement_id), len(indicators)), np.nan)
+    full_estimate = np.full((len(dhs_settlement_id), len(indicators)), np.nan)
+
+    subfolder = f"{result_root}{country}/{year}/kfold_valid/"
     if not os.path.exists(subfolder):
         os.makedirs(subfolder)
 
-    # Define output file path
-    # output = subfolder + CODE + '_VAL2_' + indicator + '_' + year + '.csv'
-    output = f"{subfolder}{CODE}_VAL2_{indicator}_{year}.csv"
+    # The rasters of the folds go with those of local_inverse_distance_weighting_interpolation_10
+    raster_subfolder = f"{result_root}{country}/{year}/tiff/kfold_valid/"
+    if write_rasters and not os.path.exists(raster_subfolder):
+        os.makedirs(raster_subfolder)
 
-    # Create a result DataFrame and save to CSV
-    result = pd.DataFrame()
-    result['CLUST_NUM'] = df['cluster'].tolist()
-    result['DHS_VAL'] = indicator_percentages
-    result['PRED_VAL'] = indicator_mean
-    result['VAL_STD'] = indicator_std
-    result.to_csv(output)
+    with rasterio.open(path_to_population_raster) as raster:
+        band = raster.read(1)
 
-    #result.to_csv('test.csv')
-    print(x, '   ends')
+        for mask, group in valid_cluster_groups(df, indicators):
+            if not np.any(mask) or len(dhs_settlement_id) == 0:
+                continue
+
+            columns = [indicators.index(indicator) for indicator in group]
+            values = df[group].to_numpy(dtype=float)
+
+            # Triangulation of the valid clusters, shared by all the folds
+            valid = np.flatnonzero(mask)
+            geometry = validation_geometry(context, mask)
+            valid_locations, deletion = geometry['locations'], geometry['deletion']
+
+            # Estimates of the DHS settlements from all the valid clusters
+            full_estimate[:, columns] = settlement_lidw_predictions(raster, band, valid_locations, values[mask],
+                                                                    country_shape, members, deletion['table'])
+
+            for f in range(k):
+                # Held-out settlements and the clusters left to train on
+                held_out = fold == f
+                train = mask.copy()
+                train[settlement_clusters[held_out].indices] = False
+                if not np.any(held_out) or not np.any(train):
+                    continue
+
+                # Network of the training clusters, found locally from the triangulation of the valid clusters
+                train_locations = [locations[c] for c in np.flatnonzero(train)]
+                prediction[np.ix_(held_out, columns)] = settlement_lidw_predictions(
+                    raster, band, train_locations, values[train], country_shape, members[held_out],
+                    network_table_of_sites(deletion, train[valid]))
+
+                if write_rasters:
+                    # LIDW rasters of the fold, as written by local_inverse_distance_weighting_interpolation_10
+                    operator = lidw_operator(country, year, df[train], country_shape, use_cache=False)
+                    for j, indicator in enumerate(group):
+                        grid = apply_lidw_operator(operator, values[train, j])
+                        write_geotiff(f"{raster_subfolder}{code}_{year}_idw_{indicator[4:]}_{f}.tif", grid,
+                                      raster.transform)
+
+            progress_logger.info('%s %s folds done', x, group)
+
+    # One row per indicator and DHS settlement
+    result = pd.DataFrame({'INDICATOR': np.repeat(indicators, len(dhs_settlement_id)),
+                           'FOLD': np.tile(fold, len(indicators)),
+                           'SETTLEMENT_ID': np.tile(dhs_settlement_id, len(indicators)),
+                           'NUM_DHS_CLUST': np.tile(num_dhs_clust, len(indicators)),
+                           'DHS_VAL': dhs_estimate.T.ravel(),
+                           'PRED_VAL': prediction.T.ravel(),
+                           'FULL_VAL': full_estimate.T.ravel()})
+    result.insert(0, 'YEAR', year)
+    result.insert(0, 'COUNTRY', country)
+
+    result.to_csv(f"{subfolder}{code}_{year}_idw_kfold.csv", index=False)
+
+    progress_logger.info('%s ends', x)
+    return result
+
+
+def spatial_blocks(locations, country=None, level=1, block_km=None):
+    """
+    Assigns the DHS clusters to spatial blocks: subnational divisions or square grid cells.
+
+    Args:
+        locations (list): List of cluster locations (coordinates).
+        country (str): Country name, for the subnational divisions.
+        level (int): Level of the subnational divisions (GADM level-1 regions by default).
+        block_km (float): Side of the grid cells in km; the subnational divisions are used when None.
+
+    Returns:
+        block (numpy.ndarray): Block of every cluster, numbered from 0.
+    """
+    points = np.reshape(np.asarray(locations, dtype=float), (-1, 2))
+
+    if len(points) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    if block_km is None:
+        # The division containing the cluster (or the nearest one, for clusters on or past the border)
+        divisions = gpd.read_file(subnational_shapefile(country, level))['geometry'].to_numpy()
+        tree = shapely.STRtree(divisions)
+        nearest = tree.query_nearest(shapely.points(points[:, 0], points[:, 1]), all_matches=False)
+        division = np.zeros(len(points), dtype=np.int64)
+        division[nearest[0]] = nearest[1]
+    else:
+        # Grid cells of block_km x block_km, with the longitude scaled at the mean latitude
+        y = points[:, 1] * 110.574
+        x = points[:, 0] * 111.320 * np.cos(np.radians(np.mean(points[:, 1])))
+        division = np.floor(x / block_km).astype(np.int64) * (2 ** 32) + np.floor(y / block_km).astype(np.int64)
+
+    # Number the blocks that hold clusters from 0
+    _, block = np.unique(division, return_inverse=True)
+
+    return np.ravel(block)
+
+
+def spatial_block_validation(x, level=1, block_km=None, indicators=None, use_cache=True):
+    """
+    Spatially blocked cross-validation of the LIDW estimates of all the indicators of a country-year.
+
+    Every spatial block of spatial_blocks (a subnational division or a grid cell) is held out in turn. The
+    clusters are triangulated once per group of indicators with the same valid clusters; holding out a
+    block only changes the network around it (network_table_without_sites). LIDW is evaluated only at the
+    held-out clusters and on the pixels of the held-out settlements. A settlement belongs to the block holding
+    most of its clusters, and all its clusters are held out with it.
+
+    Args:
+        x (tuple): Country and year.
+        level (int): Level of the subnational divisions used as blocks.
+        block_km (float): Side of the grid cells in km; the subnational divisions are used when None.
+        indicators (list): List of indicators, read_list_of_indicators() when None.
+        use_cache (bool): Whether to read and write the cached settlement membership matrix and validation context.
+
+    Returns:
+        result (DataFrame): One row per indicator and held-out cluster ('LEVEL' CLUSTER) or settlement ('LEVEL'
+            SETTLEMENT) with its 'BLOCK', 'ID' (cluster number or settlement index), 'DHS_VAL' and 'PRED_VAL'.
+    """
+    country, year = x
+    progress_logger.info('%s starts', x)
+
+    code, CODE = get_country_alpha3_code(country)
+
+    if indicators is None:
+        indicators = read_list_of_indicators()
+
+    # Clean DHS data, country shape and clusters inside every settlement, shared by all the validations
+    context = validation_context(x, use_cache=use_cache)
+    df, locations, country_shape = context['df'], context['locations'], context['country_shape']
+    dhs_locations_in_settlement = context['dhs_locations_in_settlement']
+
+    path_to_settlements_shapefile = settlement_mask_shapefile(country, year)
+    path_to_population_raster = population_raster(country, year)
+    cluster_numbers = np.asarray(dhs_cluster_numbers(df))
+
+    # Spatial block of every cluster
+    block = spatial_blocks(locations, country, level, block_km)
+    num_blocks = block.max() + 1 if len(block) > 0 else 0
+
+    # Settlements holding DHS clusters, their clusters and their pixels
+    dhs_settlement_clusters, dhs_settlement_id = dhs_settlements(dhs_locations_in_settlement)
+
+    with fiona.open(path_to_settlements_shapefile, "r") as shapefile:
+        shapes = [shape(feature["geometry"]) for feature in shapefile]
+
+    members = settlement_members(country, year, path_to_population_raster, path_to_settlements_shapefile, shapes,
+                                 use_cache=use_cache)[dhs_settlement_id]
+
+    # Settlements x clusters membership and direct DHS estimates of the DHS settlements
+    settlement_clusters, num_dhs_clust, dhs_estimate = settlement_direct_estimates(df, dhs_settlement_clusters,
+                                                                                   indicators)
+
+    # Every settlement is held out with the block holding most of its clusters
+    settlement_block = np.array([np.argmax(np.bincount(block[c])) for c in dhs_settlement_clusters], dtype=np.int64)
+
+    cluster_prediction = np.full((len(df), len(indicators)), np.nan)
+    settlement_prediction = np.full((len(dhs_settlement_id), len(indicators)), np.nan)
+
+    with rasterio.open(path_to_population_raster) as raster:
+        band = raster.read(1)
+
+        for mask, group in valid_cluster_groups(df, indicators):
+            if not np.any(mask):
+                continue
+
+            columns = [indicators.index(indicator) for indicator in group]
+            values = df[group].to_numpy(dtype=float)
+
+            # Triangulation of the valid clusters, shared by all the blocks
+            valid = np.flatnonzero(mask)
+            geometry = validation_geometry(context, mask)
+            valid_locations, deletion = geometry['locations'], geometry['deletion']
+
+            for b in range(num_blocks):
+                held_out = mask & (block == b)
+                if not np.any(held_out) or np.all(held_out[valid]):
+                    continue
+
+                # Regions of the held-out clusters among the remaining ones, with indices of the valid clusters
+                remaining = np.flatnonzero(~held_out[valid])
+                locator = voronoi_site_locator([valid_locations[i] for i in remaining], country_shape)
+                px, py = np.asarray(locations, dtype=float)[held_out].T
+                region = locate_voronoi_sites(locator, px, py)
+                region = np.where(region >= 0, remaining[np.maximum(region, 0)], -1)
+
+                # Weights of the held-out clusters in the network without the block
+                table = network_table_without_sites(deletion, np.flatnonzero(held_out[valid]))
+                inside, index, weight = lidw_point_weights(px, py, valid_locations, table, None, region=region)
+
+                for j, c in enumerate(columns):
+                    predict = lidw_apply_weights(inside, index, weight, values[valid, j])
+                    cluster_prediction[held_out, c] = np.where(inside, predict, np.nan)
+
+                # Settlements of the block, predicted without any of their clusters
+                held_settlements = settlement_block == b
+                if not np.any(held_settlements):
+                    continue
+
+                train = mask & (block != b)
+                train[settlement_clusters[held_settlements].indices] = False
+                if not np.any(train):
+                    continue
+
+                # Network of the training clusters, found locally as for the held-out clusters
+                settlement_prediction[np.ix_(held_settlements, columns)] = settlement_lidw_predictions(
+                    raster, band, [locations[c] for c in np.flatnonzero(train)], values[train], country_shape,
+                    members[held_settlements], network_table_of_sites(deletion, train[valid]))
+
+            progress_logger.info('%s %s blocks done', x, group)
+
+    # One row per indicator and held-out cluster or settlement
+    frames = []
+    for j, indicator in enumerate(indicators):
+        clusters = np.isfinite(cluster_prediction[:, j])
+        frames.append(pd.DataFrame({'INDICATOR': indicator, 'LEVEL': 'CLUSTER', 'BLOCK': block[clusters],
+                                    'ID': cluster_numbers[clusters],
+                                    'DHS_VAL': df[indicator].to_numpy(dtype=float)[clusters],
+                                    'PRED_VAL': cluster_prediction[clusters, j]}))
+
+        settlements = np.isfinite(settlement_prediction[:, j])
+        frames.append(pd.DataFrame({'INDICATOR': indicator, 'LEVEL': 'SETTLEMENT',
+                                    'BLOCK': settlement_block[settlements],
+                                    'ID': np.asarray(dhs_settlement_id, dtype=np.int64)[settlements],
+                                    'DHS_VAL': dhs_estimate[settlements, j],
+                                    'PRED_VAL': settlement_prediction[settlements, j]}))
+
+    result = pd.concat(frames, ignore_index=True)
+    result.insert(0, 'YEAR', year)
+    result.insert(0, 'COUNTRY', country)
+
+    # Save the table of the country-year
+    subfolder = f"{result_root}{country}/{year}/validation/"
+    if not os.path.exists(subfolder):
+        os.makedirs(subfolder)
+    blocks = f"ADM{level}" if block_km is None else f"GRID{block_km:g}KM"
+    result.to_csv(f"{subfolder}{CODE}_BLOCK_{blocks}_{year}.csv", index=False)
+
+    progress_logger.info('%s ends', x)
+    return result
 
 
 def get_end_part_after_substring(full_string, substring):
@@ -1842,96 +4836,31 @@ def error_analysis_network_level(path: str =  list_of_country_years):
         # Get the alpha-3 country code
         code, CODE = get_country_alpha3_code(country)
 
-        # Define paths to relevant files
-        # csv_path = result_root + country + '/' + year + '/' + CODE + '_VAL2_' + year + '.csv'
-        # dhs_path = data_root + country + '/' + year + '/' + country + '_DHS_' + year + '.csv'
-        # dir_path = result_root + country + '/' + year + '/validation'
-        csv_path = f"{result_root}{country}/{year}/{CODE}_VAL2_{year}.csv"
+        # Total number of clusters of the DHS data for the given country and year
         dhs_path = f"{data_root}{country}/{year}/{country}_DHS_{year}.csv"
-        dir_path = f"{result_root}{country}/{year}/validation"
-
-        # Read DHS data for the given country and year
-        dhs = pd.read_csv(dhs_path)
-        tot_clust = len(dhs.index)  # Total number of clusters
-
-        # Initialize empty lists to store indicator-wise metrics
-        INDICATOR, BIAS, MAE, RMSE, P95, RATIO, TOT_CLUST, NUM_CLUST = [], [], [], [], [], [], [], []
-
-        # Collect indicator files in the 'validation' directory
-        indicators = []
-        for root, dirs, files in os.walk(dir_path):
-            for file in files:
-                if file.endswith(".csv"):
-                    s = get_end_part_after_substring(file,'VAL2_')
-                    s = s[:-9]
-                    #print(country,file,s)
-                    #input('****')
-                    if s in indicator_files :
-                        #print(s)
-                        #input('****')
-                        indicators.append(os.path.join(root, file))
-
-        # Loop through each indicator file
-        for indicator in indicators:
-            df = pd.read_csv(indicator)  # Read the indicator validation data
-
-            # Initialize metrics as NaN (Not a Number)
-            bias, mae, rmse, p95, ratio = np.nan, np.nan, np.nan, np.nan, np.nan
-
-            name = indicator[len(dir_path) + 1 + 13:-9]  # Extract indicator name from the path
-            num_clust = len(df.index)  # Number of clusters in the validation data
-
-            if num_clust > 0:
-                vac_dhs = df['DHS_VAL'].to_numpy()  # True DHS values
-                vac_pred = df['PRED_VAL'].to_numpy()  # Predicted values
-                vac_std = df['VAL_STD'].to_numpy()  # Standard deviations of predicted values
-
-                err = vac_pred - vac_dhs #vac_dhs - vac_pred  # Calculate errors
-
-                rmse = np.sqrt(np.sum(err ** 2) / len(err))  # Calculate RMSE
-                rmse = np.round(rmse, 3)
-
-                # Calculate the percentage of predictions within 95% confidence interval
-                p95 = sum([1 for vr, vp, vs in zip(vac_dhs, vac_pred, vac_std)
-                           if vp - 1.96 * vs <= vr <= vp + 1.96 * vs]) / len(err)
-                p95 = np.round(p95, 3) * 100
-
-                mae = np.mean(abs(err))  # Calculate MAE
-                mae = np.round(mae, 3)
-
-                av = np.mean(vac_dhs)  # Mean of true DHS values
-                bias = np.mean(err)  # Calculate bias
-                bias = np.round(bias, 4)
-
-                ratio = np.nan
-
-                if av > 0 : #np.mean(vac_pred) > 0:
-                    ratio = np.mean(vac_pred) / av #/ np.mean(vac_pred)  # Calculate ratio of mean values
-                    ratio = np.round(ratio, 3)
-
-            # Append metrics to respective lists
-            INDICATOR.append(name)
-            TOT_CLUST.append(tot_clust)
-            NUM_CLUST.append(num_clust)
-            BIAS.append(bias)
-            MAE.append(mae)
-            RMSE.append(rmse)
-            P95.append(p95)
-            RATIO.append(ratio)
+        tot_clust = len(pd.read_csv(dhs_path).index)
+
+        # Read the leave-one-out outputs of the indicators in the long format
+        frames = [frame for frame in [network_validation_frame(country, year, indicator)
+                                      for indicator in indicator_files] if frame is not None]
+        columns = ['INDICATOR', 'TOT_CLUST', 'NUM_CLUST', 'BIAS', 'RATIO', 'MAE', 'RMSE', 'P95']
+        if len(frames) == 0:
+            res = pd.DataFrame(columns=columns)
+        else:
+            # Metrics of every indicator
+            metrics = validation_metrics(pd.concat(frames, ignore_index=True), by=['INDICATOR'])
 
-        # Create a DataFrame to store the results
-        res = pd.DataFrame()
-        res['INDICATOR'] = INDICATOR
-        res['TOT_CLUST'] = TOT_CLUST
-        res['NUM_CLUST'] = NUM_CLUST
-        res['BIAS'] = BIAS
-        res['RATIO'] = RATIO
-        res['MAE'] = MAE
-        res['RMSE'] = RMSE
-        res['P95'] = P95
+            res = pd.DataFrame()
+            res['INDICATOR'] = metrics['INDICATOR'].str[4:]
+            res['TOT_CLUST'] = tot_clust
+            res['NUM_CLUST'] = metrics['N']
+            res['BIAS'] = np.round(metrics['BIAS'], 4)
+            res['RATIO'] = np.round(metrics['RATIO'], 3)
+            res['MAE'] = np.round(metrics['MAE'], 3)
+            res['RMSE'] = np.round(metrics['RMSE'], 3)
+            res['P95'] = np.round(metrics['P95'], 1)
 
         # Define the output path for the summary CSV file
-        # output_path = result_root + country + '/' + year + '/' + CODE + '_VAL2_' + year
         output_path = f"{result_root}{country}/{year}/{CODE}_VAL2_{year}"
         res.to_csv(output_path + '.csv')  # Save the DataFrame as a CSV file
 
@@ -1939,7 +4868,6 @@ def error_analysis_network_level(path: str =  list_of_country_years):
         print(country, year)
 
 
-
 def merge_error_analysis_network_level(path: str =  list_of_country_years):
 
     # Create a dictionary of abbreviation and full name for indicators using the dictionary_of_indicators function
@@ -2324,32 +5252,14 @@ def merge_error_analysis_settlement_level():
         # Read the settlement result CSV file into a DataFrame
         df = pd.read_csv(path_to_settlement_result)
 
-        tmp = [[np.nan for _ in range(5)] for _ in indicators]
+        # Metrics of every indicator
+        metrics = wide_validation_metrics(df, indicators, 'SETTLEMENT_ID')
 
-        # Loop through indicators and calculate error metrics
-        for i, indicator in enumerate(indicators):
-            pair = pd.DataFrame()
-            a = indicator[4:].upper()
-            b = ('DHS_' + indicator[4:]).upper()
-            pair[a] = df[a]
-            pair[b] = df[b]
-            pair = pair.dropna()
-
-            bias = np.mean(pair[a] - pair[b])
-            rmsd = np.sqrt(np.mean(abs(pair[a] - pair[b])**2))
-            mad = np.mean(abs(pair[a] - pair[b]))
-            ratio = np.mean(pair[a]) / np.mean(pair[b])
-            madv1 = mad / np.max(pair[a])
-            madv2 = mad / np.max(pair[b])
-            tmp[i] = np.round([rmsd, mad, ratio, madv1, madv2, bias],3)
-
-        # Add error metrics columns to the result DataFrame
-        result['BIAS'] = [t[5] for t in tmp]
-        result['RMSD'] = [t[0] for t in tmp]
-        result['MAD'] = [t[1] for t in tmp]
-        result['RATIO'] = [t[2] for t in tmp]
-        result['MAD_to_MaxPred'] = [t[3] for t in tmp]
-        result['MAD_to_MaxDHS'] = [t[4] for t in tmp]
+        # Add error metrics columns to the result DataFrame, under their published names (RMSD is the RMSE and
+        # MAD the MAE)
+        for column, metric in [('BIAS', 'BIAS'), ('RMSD', 'RMSE'), ('MAD', 'MAE'), ('RATIO', 'RATIO'),
+                               ('MAD_to_MaxPred', 'MAE_to_MaxPred'), ('MAD_to_MaxDHS', 'MAE_to_MaxDHS')]:
+            result[column] = np.round(metrics[metric].to_numpy(), 3)
 
         # Get the shape of the result DataFrame
         (max_row, max_column) = result.shape
@@ -2445,29 +5355,10 @@ def rmsd_error_analysis_settlement_level():
         # Read the settlement result DataFrame
         df = pd.read_csv(path_to_settlement_result)
 
-        # Initialize a temporary list to store RMSD values for each indicator
-        tmp = [[np.nan for _ in range(5)] for _ in indicators]
-
-        # Loop through each indicator
-        for i, indicator in enumerate(indicators):
-            pair = pd.DataFrame()
-
-            # Extract column names for the current indicator
-            a = indicator[4:].upper()
-            b = ('DHS_' + indicator[4:]).upper()
-
-            # Populate the pair DataFrame with relevant columns and drop NaN values
-            pair[a] = df[a]
-            pair[b] = df[b]
-            pair = pair.dropna()
-
-            # Calculate RMSD (Root Mean Square Deviation) for the indicator
-            rmsd = np.sqrt(np.mean(abs(pair[a] - pair[b])**2))
+        # RMSD (root mean square deviation) of every indicator
+        tmp = np.round(wide_validation_metrics(df, indicators, 'SETTLEMENT_ID')['RMSE'].to_numpy(), 2)
 
-            # Round the RMSD value and store it in the temporary list
-            tmp[i] = np.round(rmsd, 2)
-
-        # Add the temporary list of RMSD values to the result DataFrame
+        # Add the RMSD values to the result DataFrame
         # result[country+' '+year] = tmp
         result[f"{country} {year}"] = tmp
 
@@ -2609,34 +5500,14 @@ def merge_error_analysis_subnational_division_level(level=1):
         # Read the subnational division result DataFrame
         df = pd.read_csv(path_to_division_result)
 
-        # Initialize a temporary list to store various metrics
-        tmp = [[np.nan for _ in range(5)] for _ in indicators]
+        # Metrics of every indicator
+        metrics = wide_validation_metrics(df, indicators, 'DIVISION_NAME')
 
-        # Loop through each indicator
-        for i, indicator in enumerate(indicators):
-            pair = pd.DataFrame()
-            a = indicator[4:].upper()
-            b = ('DHS_' + indicator[4:]).upper()
-            pair[a] = df[a]
-            pair[b] = df[b]
-            pair = pair.dropna()
-
-            # Calculate RMSD, MAD, ratio, MAD_to_MaxPred, and MAD_to_MaxDHS metrics
-            bias = np.mean(pair[a] - pair[b])
-            rmsd = np.sqrt(np.mean(abs(pair[a] - pair[b])**2))
-            mad = np.mean(abs(pair[a] - pair[b]))
-            ratio = np.mean(pair[a]) / np.mean(pair[b])
-            madv1 = mad / np.max(pair[a])
-            madv2 = mad / np.max(pair[b])
-            tmp[i] = np.round([rmsd, mad, ratio, madv1, madv2, bias], 3)
-
-        # Add the calculated metrics to the result DataFrame
-        result['BIAS'] = [t[5] for t in tmp]
-        result['RMSD'] = [t[0] for t in tmp]
-        result['MAD'] = [t[1] for t in tmp]
-        result['RATIO'] = [t[2] for t in tmp]
-        result['MAD_to_MaxPred'] = [t[3] for t in tmp]
-        result['MAD_to_MaxDHS'] = [t[4] for t in tmp]
+        # Add error metrics columns to the result DataFrame, under their published names (RMSD is the RMSE and
+        # MAD the MAE)
+        for column, metric in [('BIAS', 'BIAS'), ('RMSD', 'RMSE'), ('MAD', 'MAE'), ('RATIO', 'RATIO'),
+                               ('MAD_to_MaxPred', 'MAE_to_MaxPred'), ('MAD_to_MaxDHS', 'MAE_to_MaxDHS')]:
+            result[column] = np.round(metrics[metric].to_numpy(), 3)
 
         # Get the shape of the DataFrame
         (max_row, max_column) = result.shape
@@ -2729,29 +5600,10 @@ def rmsd_error_analysis_subnational_division_level(level=1):
         # Read the subnational division result DataFrame
         df = pd.read_csv(path_to_division_result)
 
-        # Initialize a temporary list to store RMSD values for each indicator
-        tmp = [[np.nan for _ in range(5)] for _ in indicators]
-
-        # Loop through each indicator
-        for i, indicator in enumerate(indicators):
-            pair = pd.DataFrame()
-
-            # Extract column names for the current indicator
-            a = indicator[4:].upper()
-            b = ('DHS_' + indicator[4:]).upper()
-
-            # Populate the pair DataFrame with relevant columns and drop NaN values
-            pair[a] = df[a]
-            pair[b] = df[b]
-            pair = pair.dropna()
-
-            # Calculate RMSD (Root Mean Square Deviation) for the indicator
-            rmsd = np.sqrt(np.mean(abs(pair[a] - pair[b])**2))
-
-            # Round the RMSD value and store it in the temporary list
-            tmp[i] = np.round(rmsd, 2)
+        # RMSD (root mean square deviation) of every indicator
+        tmp = np.round(wide_validation_metrics(df, indicators, 'DIVISION_NAME')['RMSE'].to_numpy(), 2)
 
-        # Add the temporary list of RMSD values to the result DataFrame
+        # Add the RMSD values to the result DataFrame
         # result[country+' '+year] = tmp
         result[f"{country} {year}"] = tmp
 
@@ -2853,6 +5705,339 @@ def aggregate_error_analysis():
 
 
 
+#       THE FUNCTIONS FOR VALIDATION METRICS
+#---------------------------------------------------------------------------------------------------
+
+# Metrics computed by validation_metrics
+validation_metric_names = ['N', 'BIAS', 'MAE', 'RMSE', 'RATIO', 'P95', 'AE95', 'MAE_to_MaxPred', 'MAE_to_MaxDHS']
+
+# Metrics of validation_metrics that get bootstrap confidence intervals
+bootstrap_metric_names = ['BIAS', 'MAE', 'RMSE', 'RATIO', 'P95']
+
+
+def wide_validation_frame(df, indicators, unit, level):
+    """
+    Converts a wide validation output (one predicted and one DHS_ column per indicator) to the long format.
+
+    Args:
+        df (DataFrame): Validation output with the {INDICATOR} and DHS_{INDICATOR} columns.
+        indicators (list): List of indicators.
+        unit (str): Column identifying the validation units.
+        level (str): Validation level.
+
+    Returns:
+        long (DataFrame): Long-format frame as in load_validation_results (without country and year).
+    """
+    frames = []
+    for indicator in indicators:
+        a, b = indicator[4:].upper(), ('DHS_' + indicator[4:]).upper()
+        if a in df.columns and b in df.columns:
+            frames.append(pd.DataFrame({'INDICATOR': indicator, 'LEVEL': level, 'UNIT': df[unit].to_numpy(),
+                                        'OBS': df[b].to_numpy(dtype=float), 'PRED': df[a].to_numpy(dtype=float),
+                                        'STD': np.nan}))
+    return frames
+
+
+def wide_validation_metrics(df, indicators, unit):
+    """
+    Computes the validation metrics of every indicator of a wide validation output with validation_metrics.
+
+    Args:
+        df (DataFrame): Validation output with the {INDICATOR} and DHS_{INDICATOR} columns.
+        indicators (list): List of indicators.
+        unit (str): Column identifying the validation units.
+
+    Returns:
+        metrics (DataFrame): One row per indicator, in the given order, with validation_metric_names (NaN for
+            the indicators without columns or valid units).
+    """
+    frames = wide_validation_frame(df, indicators, unit, None)
+    if len(frames) == 0:
+        return pd.DataFrame(np.nan, index=indicators, columns=validation_metric_names)
+
+    metrics = validation_metrics(pd.concat(frames, ignore_index=True), by=['INDICATOR'])
+
+    return metrics.set_index('INDICATOR').reindex(indicators)
+
+
+def network_validation_frame(country, year, indicator):
+    """
+    Reads the network level leave-one-out output of an indicator (validation_network_level) in the long format.
+
+    Args:
+        country (str): Country name.
+        year (str): Survey year.
+        indicator (str): Indicator.
+
+    Returns:
+        long (DataFrame): Long-format frame as in load_validation_results (without country and year), None when
+            the output does not exist.
+    """
+    code, CODE = get_country_alpha3_code(country)
+    path = f"{result_root}{country}/{year}/validation/{CODE}_VAL2_{indicator}_{year}.csv"
+    if not os.path.exists(path):
+        return None
+
+    df = pd.read_csv(path)
+    return pd.DataFrame({'INDICATOR': indicator, 'LEVEL': 'NETWORK', 'UNIT': df['CLUST_NUM'].to_numpy(),
+                         'OBS': df['DHS_VAL'].to_numpy(dtype=float), 'PRED': df['PRED_VAL'].to_numpy(dtype=float),
+                         'STD': df['VAL_STD'].to_numpy(dtype=float)})
+
+
+def validation_result_frames(country, year, indicators):
+    """
+    Reads all the validation outputs of a country-year in the long format.
+
+    Args:
+        country (str): Country name.
+        year (str): Survey year.
+        indicators (list): List of indicators.
+
+    Returns:
+        frames (list): List of long-format frames as in load_validation_results (without country and year).
+    """
+    code, CODE = get_country_alpha3_code(country)
+    folder = f"{result_root}{country}/{year}/"
+    frames = []
+
+    # Network level leave-one-out (validation_network_level)
+    for indicator in indicators:
+        frame = network_validation_frame(country, year, indicator)
+        if frame is not None:
+            frames.append(frame)
+
+    # Settlement and subnational division levels (validation_settlement_level, validation_subnational_division_level)
+    for path, unit, level in [(f"{folder}{country}_{year}_settlement.csv", 'SETTLEMENT_ID', 'SETTLEMENT'),
+                              (f"{folder}{country}_{year}_subnational_level_1.csv", 'DIVISION_NAME', 'ADM1'),
+                              (f"{folder}{country}_{year}_subnational_level_2.csv", 'DIVISION_NAME', 'ADM2')]:
+        if os.path.exists(path):
+            frames += wide_validation_frame(pd.read_csv(path), indicators, unit, level)
+
+    # Settlement leave-one-out, compared with the estimates from all the clusters (loocv_settlements_indicators)
+    for indicator in indicators:
+        path = f"{folder}loocv_settl_valid/{code}_{year}_idw_loocv_settl_{indicator[4:]}.csv"
+        if os.path.exists(path):
+            df = pd.read_csv(path)
+            frames.append(pd.DataFrame({'INDICATOR': indicator, 'LEVEL': 'LOOCV_SETTLEMENT', 'UNIT': np.arange(len(df)),
+                                        'OBS': df['DIR_EST'].to_numpy(dtype=float),
+                                        'PRED': df['LOOCV_EST'].to_numpy(dtype=float), 'STD': np.nan}))
+
+    # K-fold and spatially blocked validations (kfold_validation_settlements, spatial_block_validation)
+    tidy = [(f"{folder}kfold_valid/{code}_{year}_idw_kfold.csv", None)]
+    if os.path.isdir(f"{folder}validation/"):
+        tidy += [(f"{folder}validation/{file}", file[len(CODE) + 1:-len(year) - 5])
+                 for file in sorted(os.listdir(f"{folder}validation/"))
+                 if file.startswith(f"{CODE}_BLOCK_") and file.endswith(f"_{year}.csv")]
+    for path, blocks in tidy:
+        if os.path.exists(path):
+            df = pd.read_csv(path)
+            df = df[df['INDICATOR'].isin(indicators)]
+            frames.append(pd.DataFrame({'INDICATOR': df['INDICATOR'].to_numpy(),
+                                        'LEVEL': 'KFOLD' if blocks is None else blocks + '_' + df['LEVEL'],
+                                        'UNIT': df['SETTLEMENT_ID' if blocks is None else 'ID'].to_numpy(),
+                                        'OBS': df['DHS_VAL'].to_numpy(dtype=float),
+                                        'PRED': df['PRED_VAL'].to_numpy(dtype=float), 'STD': np.nan}))
+
+    return frames
+
+
+def load_validation_results(country_year=None, indicators=None):
+    """
+    Loads every validation output of all the country-years into a single long-format frame.
+
+    Args:
+        country_year (list): List of (country, year) pairs, read_list_of_country_years() when None.
+        indicators (list): List of indicators, read_list_of_indicators() when None.
+
+    Returns:
+        long (DataFrame): One row per validation unit with the 'COUNTRY', 'YEAR', 'INDICATOR', 'LEVEL' (NETWORK,
+            SETTLEMENT, ADM1, ADM2, LOOCV_SETTLEMENT, KFOLD, BLOCK_...), 'UNIT', observed 'OBS', predicted 'PRED'
+            and predicted standard deviation 'STD' (network level only).
+    """
+    if country_year is None:
+        country_year = read_list_of_country_years()
+    if indicators is None:
+        indicators = read_list_of_indicators()
+
+    frames = []
+    for country, year in country_year:
+        for frame in validation_result_frames(country, str(year), indicators):
+            frame.insert(0, 'YEAR', str(year))
+            frame.insert(0, 'COUNTRY', country)
+            frames.append(frame)
+
+    columns = ['COUNTRY', 'YEAR', 'INDICATOR', 'LEVEL', 'UNIT', 'OBS', 'PRED', 'STD']
+    if len(frames) == 0:
+        return pd.DataFrame(columns=columns)
+
+    return pd.concat(frames, ignore_index=True)[columns]
+
+
+def validation_metrics(long, by=('COUNTRY', 'YEAR', 'INDICATOR', 'LEVEL')):
+    """
+    Computes the validation metrics of every group of a long-format frame with grouped aggregations.
+
+    Units with a missing observed or predicted value are left out. The errors are predicted minus observed values,
+    so a positive BIAS is an overestimate. P95 is the percentage of observed values within 1.96 standard deviations
+    of the prediction (NaN without standard deviations), AE95 is the 95th percentile of the absolute errors, and
+    RATIO is the ratio of the mean prediction to the mean observed value (NaN when the latter is not positive).
+
+    Args:
+        long (DataFrame): Long-format frame as returned by load_validation_results.
+        by (tuple): Columns defining the groups.
+
+    Returns:
+        metrics (DataFrame): One row per group with validation_metric_names.
+    """
+    by = list(by)
+    long = long[np.isfinite(long['OBS']) & np.isfinite(long['PRED'])]
+
+    # Errors and coverage of every unit
+    error = long['PRED'] - long['OBS']
+    covered = np.where(np.isfinite(long['STD']), (np.abs(error) <= 1.96 * long['STD']).astype(float), np.nan)
+    frame = long[by].assign(ERR=error, ABS=np.abs(error), SQ=error ** 2, COVERED=covered,
+                            PRED=long['PRED'], OBS=long['OBS'])
+
+    groups = frame.groupby(by, sort=False)
+    metrics = groups.agg(N=('ERR', 'size'), BIAS=('ERR', 'mean'), MAE=('ABS', 'mean'), MSE=('SQ', 'mean'),
+                         P95=('COVERED', 'mean'), MEAN_PRED=('PRED', 'mean'), MEAN_OBS=('OBS', 'mean'),
+                         MAX_PRED=('PRED', 'max'), MAX_OBS=('OBS', 'max'))
+    metrics['AE95'] = groups['ABS'].quantile(0.95)
+    metrics = metrics.reset_index()
+
+    metrics['RMSE'] = np.sqrt(metrics['MSE'])
+    metrics['RATIO'] = np.where(metrics['MEAN_OBS'] > 0, metrics['MEAN_PRED'] / metrics['MEAN_OBS'], np.nan)
+    metrics['P95'] = metrics['P95'] * 100
+    metrics['MAE_to_MaxPred'] = metrics['MAE'] / metrics['MAX_PRED']
+    metrics['MAE_to_MaxDHS'] = metrics['MAE'] / metrics['MAX_OBS']
+
+    return metrics[by + validation_metric_names]
+
+
+def error_metrics(observed, predicted, std=None):
+    """
+    Computes the validation metrics of a single set of predictions with validation_metrics.
+
+    Args:
+        observed (array-like): Observed values.
+        predicted (array-like): Predicted values.
+        std (array-like): Standard deviations of the predictions, if any.
+
+    Returns:
+        metrics (dict): Value of every metric of validation_metric_names (N is 0 and the others NaN without units).
+    """
+    long = pd.DataFrame({'GROUP': 0, 'OBS': np.asarray(observed, dtype=float),
+                         'PRED': np.asarray(predicted, dtype=float),
+                         'STD': np.nan if std is None else np.asarray(std, dtype=float)})
+    metrics = validation_metrics(long, by=['GROUP'])
+
+    if len(metrics) == 0:
+        return {name: 0 if name == 'N' else np.nan for name in validation_metric_names}
+
+    metrics = metrics[validation_metric_names].iloc[0].to_dict()
+    metrics['N'] = int(metrics['N'])
+
+    return metrics
+
+
+def bootstrap_validation_metrics(long, by=('COUNTRY', 'YEAR', 'INDICATOR', 'LEVEL'), num_samples=1000, seed=0,
+                                 confidence=0.95):
+    """
+    Bootstrap confidence intervals of the validation metrics, resampling the units of every group.
+
+    The resamples of a group are drawn at once as multinomial counts, so every metric of all the resamples
+    is a matrix-vector product.
+
+    Args:
+        long (DataFrame): Long-format frame as returned by load_validation_results.
+        by (tuple): Columns defining the groups.
+        num_samples (int): Number of bootstrap resamples.
+        seed (int): Seed of the resampling.
+        confidence (float): Confidence level of the intervals.
+
+    Returns:
+        intervals (DataFrame): One row per group with the {METRIC}_LO and {METRIC}_HI bounds of bootstrap_metric_names.
+    """
+    by = list(by)
+    long = long[np.isfinite(long['OBS']) & np.isfinite(long['PRED'])]
+    rng = np.random.default_rng(seed)
+    quantiles = [50 * (1 - confidence), 50 * (1 + confidence)]
+
+    rows = []
+    for key, group in long.groupby(by, sort=False):
+        n = len(group)
+        obs, pred = group['OBS'].to_numpy(), group['PRED'].to_numpy()
+        error = pred - obs
+
+        # Number of times every unit is drawn in every resample
+        counts = rng.multinomial(n, np.full(n, 1.0 / n), size=num_samples).astype(float)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            samples = {'BIAS': counts @ error / n,
+                       'MAE': counts @ np.abs(error) / n,
+                       'RMSE': np.sqrt(counts @ error ** 2 / n),
+                       'RATIO': np.where(counts @ obs > 0, (counts @ pred) / (counts @ obs), np.nan)}
+
+            # Coverage of the units with a standard deviation, in percent
+            std = group['STD'].to_numpy()
+            known = np.isfinite(std)
+            samples['P95'] = (100 * (counts[:, known] @ (np.abs(error[known]) <= 1.96 * std[known]))
+                              / np.sum(counts[:, known], axis=1)) if np.any(known) else np.full(num_samples, np.nan)
+
+        row = dict(zip(by, key if isinstance(key, tuple) else (key,)))
+        for name in bootstrap_metric_names:
+            finite = samples[name][np.isfinite(samples[name])]
+            lo, hi = np.percentile(finite, quantiles) if len(finite) > 0 else (np.nan, np.nan)
+            row[name + '_LO'], row[name + '_HI'] = lo, hi
+        rows.append(row)
+
+    columns = [name + bound for name in bootstrap_metric_names for bound in ['_LO', '_HI']]
+    return pd.DataFrame(rows, columns=by + columns)
+
+
+def validation_summary_tables(country_year=None, num_samples=1000, seed=0):
+    """
+    Rebuilds the validation summary tables of all the country-years from the validation outputs in one pass.
+
+    Writes VALIDATION_METRICS.csv, with the metrics and bootstrap confidence intervals of every country, year,
+    indicator and level, and VALIDATION_RMSE_{LEVEL}.csv, with the RMSE of every indicator and country-year.
+
+    Args:
+        country_year (list): List of (country, year) pairs, read_list_of_country_years() when None.
+        num_samples (int): Number of bootstrap resamples (no intervals when 0).
+        seed (int): Seed of the resampling.
+
+    Returns:
+        metrics (DataFrame): Metrics and confidence intervals of every group.
+    """
+    indicators = read_list_of_indicators()
+    indicator_dict = dictionary_of_indicators()
+
+    long = load_validation_results(country_year, indicators)
+    by = ['COUNTRY', 'YEAR', 'INDICATOR', 'LEVEL']
+
+    metrics = validation_metrics(long, by)
+    if num_samples > 0:
+        metrics = metrics.merge(bootstrap_validation_metrics(long, by, num_samples, seed), on=by, how='left')
+
+    # Indicators in the order of the list of indicators, with their names
+    order = {indicator: i for i, indicator in enumerate(indicators)}
+    metrics = metrics.sort_values(['LEVEL', 'COUNTRY', 'YEAR', 'INDICATOR'], key=lambda c: c.map(order)
+                                  if c.name == 'INDICATOR' else c, kind='stable').reset_index(drop=True)
+    metrics.insert(3, 'INDICATOR_NAME', metrics['INDICATOR'].map(indicator_dict))
+    metrics.to_csv(f"{result_root}VALIDATION_METRICS.csv", index=False)
+
+    # RMSE of every indicator (rows) and country-year (columns), one table per level
+    for level, group in metrics.groupby('LEVEL', sort=False):
+        table = group.assign(COUNTRY_YEAR=group['COUNTRY'] + ' ' + group['YEAR'].astype(str)).pivot_table(
+            index='INDICATOR', columns='COUNTRY_YEAR', values='RMSE', sort=False).round(3)
+        table = table.reindex([i for i in indicators if i in table.index])
+        table.index = table.index.map(indicator_dict)
+        table.to_csv(f"{result_root}VALIDATION_RMSE_{level}.csv")
+
+    return metrics
+
+
 #       THE FUNCTIONS FOR PLOTTING
 #---------------------------------------------------------------------------------------------------
 
@@ -3331,127 +6516,174 @@ def get_masked_pixel_indices(src, shape):
 
     return adjusted_indices
 
-def loocv_settlements(x):
-
-    country, year, indicator = x
-    print(x,'start')
-    code, CODE = get_country_alpha3_code(country)
-
-    path_to_indicators_file = dhs_csv_file(country, year)
-
-    path_to_indicator_raster = indicator_raster(country, year, indicator)
-
-    path_to_settlements_shapefile = settlements_shapefile(country, year)
-
-    path_to_shapefile = country_shapefile(country)
-
-    dic_indic = dictionary_of_indicators()
-    indic = dic_indic[indicator]
-
-    country_shape = gpd.read_file(path_to_shapefile)
-
-    df = pd.read_csv(path_to_indicators_file)
-
-    df = df[['cluster', indicator, 'LNG', 'LAT', 'URBAN_RURA']]
-
-    df = removing_spurious_data(df)
-
-    df = df.dropna()
-
-    if len(df) > 0 :
-
-        locations = dhs_cluster_locations(df)
-
-        areas_type = dhs_cluster_areas_type(df)
-
-        cluster_num = dhs_cluster_numbers(df)
-
-        dhs_locations_in_settlement, _, _ = dhs_clusters_inside_settlements(path_to_settlements_shapefile, locations, areas_type)
-
-        dhs_settlement_clusters, dhs_settlement_id = dhs_settlements(dhs_locations_in_settlement)
-
-
-
-        loocv_estimate, direct_estimate, num_pixels = [], [], []
-
-        with fiona.open(path_to_settlements_shapefile, "r") as shapefile:
-
-            shapes = [shape(feature["geometry"]) for feature in shapefile]
-
-            lidw_estimation_dict = f"lidw_estimation_for_settlements({country}, {year}, {indicator}, {shapes}, {dhs_settlement_id})"
-
-            with rasterio.open(path_to_indicator_raster) as src:
-                data = src.read(1)
-                height = src.height
-                width = src.width
-                nodata = src.nodata
-
-                for n,id in enumerate(dhs_settlement_id):
-
-                    clusters_idx = dhs_settlement_clusters[n]
-
-                    clusters_to_remove = [cluster_num[c] for c in clusters_idx]
-
-                    filtered_df = df[~df['cluster'].isin(clusters_to_remove)]
-
-                    indicator_percentages = filtered_df[indicator].tolist()
-
-                    filtered_locations = dhs_cluster_locations(filtered_df)
-
-                    regions = voronoi_regions(filtered_locations, country_shape)
-
-                    net = dhs_clusters_network(regions, self_loop=True)
+def loocv_settlements_indicators(x, indicators=None, use_cache=True, sync_seconds=10, report_seconds=30):
+    """
+    Leave-one-settlement-out validation of the LIDW estimates of all the indicators of a country-year.
 
-                    #indices = get_raster_indices(src,shapes[id])
-                    indices = get_masked_pixel_indices(src,shapes[id])
+    For every settlement holding DHS clusters, its clusters are left out and the pixels of the settlement
+    with an estimate are predicted from the remaining clusters. The clusters are triangulated once per group
+    of indicators with the same valid clusters (validation_geometry): leaving clusters out only changes
+    the network around them (network_table_without_sites), and only the pixels of the settlement are
+    interpolated, with the weights shared by all the indicators of the group. The estimates from all the
+    clusters (DIR_EST) come from the LIDW operator (settlement_lidw_averages), and both estimates average the
+    same pixels with the same rule: the positive float32 estimates of the pixels of the operator.
 
-                    average = 0.0
+    The row of every settlement is streamed to an append-only .partial file per group of indicators, so a
+    stopped run resumes from the last settlement written; the file is removed once the outputs are written.
 
-                    for i,j in indices:
-                        loc = src.xy(i, j)
-                        point = Point(loc)
+    Args:
+        x (tuple): Country and year.
+        indicators (list): List of indicators, read_list_of_indicators() when None.
+        use_cache (bool): Whether to read and write the cached operators, membership matrices and validation
+            context.
+        sync_seconds (float): Interval between the flushes (fsync) of the streamed rows to disk.
+        report_seconds (float): Interval between the progress reports of progress_logger.
+    """
+    country, year = x
+    progress_logger.info('%s starts', x)
+    code, CODE = get_country_alpha3_code(country)
 
-                        for k in range(len(regions)):
-                            polygon = regions[k][0]
-                            if point.within(polygon):
-                                weight = [1.0 / distance(loc, regions[a][1]) for a in net[k]]
-                                predict = [indicator_percentages[regions[a][2]] * w / sum(weight) for a, w in zip(net[k], weight)]
-                                average += sum(predict)
-                                break
-                    if len(indices) > 0 :
-                        average /= len(indices)
+    if indicators is None:
+        indicators = read_list_of_indicators()
 
-                    direct_estimate.append(lidw_estimation_dict[id])
+    # Clean DHS data, country shape and clusters inside every settlement, shared by all the validations
+    context = validation_context(x, use_cache=use_cache)
+    df, country_shape = context['df'], context['country_shape']
+    dhs_locations_in_settlement = context['dhs_locations_in_settlement']
 
-                    num_pixels.append(len(indices))
+    path_to_settlements_shapefile = context['settlements_shapefile']
+    path_to_population_raster = population_raster(country, year)
 
-                    loocv_estimate.append(average)
-                    if n%10 == 0 :
-                        print(x,n,len(dhs_settlement_id))
+    with fiona.open(path_to_settlements_shapefile, "r") as shapefile:
+        shapes = [shape(feature["geometry"]) for feature in shapefile]
 
+    members = settlement_members(country, year, path_to_population_raster, path_to_settlements_shapefile, shapes,
+                                 use_cache=use_cache)
 
+    subfolder = f"{result_root}{country}/{year}/loocv_settl_valid/"
+    if not os.path.exists(subfolder):
+        os.makedirs(subfolder)
 
-                num_dhs_clust = [ len(c) for c in  dhs_settlement_clusters ]
+    with rasterio.open(path_to_population_raster) as raster:
+        for mask, group in valid_cluster_groups(df, indicators):
+            if not np.any(mask):
+                progress_logger.info('%s %s ended without result.', x, group)
+                continue
+
+            # Valid clusters of the group and the clusters of every settlement among them
+            valid = df[mask]
+            geometry = validation_geometry(context, mask)
+            locations = geometry['locations']
+            values = valid[group].to_numpy(dtype=float)
+            position = np.cumsum(mask) - 1
+            dhs_settlement_clusters, dhs_settlement_id = dhs_settlements(
+                [[int(position[c]) for c in s if mask[c]] for s in dhs_locations_in_settlement])
+
+            # Estimates from all the clusters, and the pixels that have one
+            operator = lidw_operator(country, year, valid, country_shape, use_cache=use_cache)
+            direct_estimate = settlement_lidw_averages(operator, members[dhs_settlement_id], values)
+            estimated = np.zeros(raster.height * raster.width, dtype=bool)
+            estimated[operator['rows'] * raster.width + operator['cols']] = True
+
+            # Pixel of every valid cluster, which keeps the value of its cluster as in build_lidw_operator
+            cluster_pixel = np.array([i * raster.width + j for i, j in
+                                      (raster.index(lng, lat) for lng, lat in locations)], dtype=np.int64)
+
+            # Triangulation of the valid clusters, shared by all the settlements
+            deletion = geometry['deletion']
+
+            loocv_estimate = np.zeros((len(dhs_settlement_id), len(group)))
+            num_pixels = np.zeros(len(dhs_settlement_id), dtype=np.int64)
+
+            # Rows of a previous run that was stopped (only the rows of the same settlements are kept)
+            partial = f"{subfolder}{code}_{year}_idw_loocv_settl_{group[0][4:]}.partial"
+            stream, done = open_result_stream(partial, ['N', 'SETTLEMENT_ID', 'NUM_PIXELS'] + group)
+            finished = np.zeros(len(dhs_settlement_id), dtype=bool)
+            for row in done.itertuples(index=False):
+                n = int(row[0])
+                if n < len(dhs_settlement_id) and dhs_settlement_id[n] == row[1]:
+                    num_pixels[n], loocv_estimate[n], finished[n] = row[2], row[3:], True
+
+            started, resumed = time.time(), int(np.sum(finished))
+            synced = reported = started
+
+            for n, id in enumerate(dhs_settlement_id):
+                if finished[n]:
+                    continue
 
+                # Pixels of the settlement with an estimate, and their membership weights
+                pixels, membership = members[id].indices, members[id].data
+                pixels, membership = pixels[estimated[pixels]], membership[estimated[pixels]]
+                num_pixels[n] = len(pixels)
+
+                if len(pixels) > 0:
+                    rows, cols = np.divmod(pixels, raster.width)
+
+                    # Regions of the pixels among the remaining clusters, with indices of all the valid clusters
+                    remaining = np.setdiff1d(np.arange(len(locations)), dhs_settlement_clusters[n])
+                    locator = voronoi_site_locator([locations[i] for i in remaining], country_shape)
+                    region = locate_voronoi_sites(locator, *raster_pixel_centers(raster.transform, rows, cols))
+                    region = np.where(region >= 0, remaining[np.maximum(region, 0)], -1)
+
+                    # Weights of the pixels in the network without the clusters of the settlement
+                    table = network_table_without_sites(deletion, dhs_settlement_clusters[n])
+                    inside, index, weight = lidw_pixel_weights(raster.transform, rows, cols, locations, table, None,
+                                                               region=region)
+
+                    # Pixels holding one of the remaining clusters keep its value (the last cluster wins)
+                    held = np.setdiff1d(np.flatnonzero(np.isin(cluster_pixel, pixels)), dhs_settlement_clusters[n])
+                    known = np.full(len(pixels), -1, dtype=np.int64)
+                    order = np.argsort(pixels)
+                    for c in held.tolist():
+                        known[order[np.searchsorted(pixels[order], cluster_pixel[c])]] = c
+
+                    # Average of the positive estimates, rounded as in the float32 rasters (pixels outside all
+                    # regions have none)
+                    for j in range(len(group)):
+                        predict = lidw_apply_weights(inside, index, weight, values[:, j])
+                        predict[known >= 0] = values[known[known >= 0], j]
+                        predict = predict.astype(np.float32)
+                        positive = (inside | (known >= 0)) & (predict > 0.0)
+                        count = np.sum(membership[positive])
+                        loocv_estimate[n, j] = np.sum(membership[positive] * predict[positive].astype(float)) / count \
+                            if count > 0 else 0.0
+
+                # Stream the row, flushing it to disk every sync_seconds
+                now = time.time()
+                sync = now - synced >= sync_seconds
+                append_result_rows(stream, [[n, id, num_pixels[n]] + loocv_estimate[n].tolist()], sync=sync)
+                finished[n] = True
+                if sync:
+                    synced = now
+
+                # Report the throughput every report_seconds
+                if now - reported >= report_seconds:
+                    log_progress(f"{country} {year} {group[0]}", int(np.sum(finished)), len(dhs_settlement_id),
+                                 started, resumed)
+                    reported = now
+
+            append_result_rows(stream, [], sync=True)
+            stream.close()
+
+            for j, indicator in enumerate(group):
                 res = pd.DataFrame()
-
-                res['NUM_DHS_CLUST'] = num_dhs_clust
+                res['NUM_DHS_CLUST'] = [len(c) for c in dhs_settlement_clusters]
                 res['NUM_PIXELS'] = num_pixels
-                res['DIR_EST'] = direct_estimate
-                res['LOOCV_EST' ] = loocv_estimate
+                res['DIR_EST'] = direct_estimate[:, j]
+                res['LOOCV_EST'] = loocv_estimate[:, j]
 
-                subfolder = result_root + country + '/' + year + '/loocv_settl_valid/'
-                if not os.path.exists(subfolder):
-                    os.makedirs(subfolder)
+                res.to_csv(f"{subfolder}{code}_{year}_idw_loocv_settl_{indicator[4:]}.csv")
 
-                # out_path =  subfolder + code + '_' + year + '_idw_loocv_settl_' + indicator[4:] +'.csv'
-                out_path = f"{subfolder}{code}_{year}_idw_loocv_settl_{indicator[4:]}.csv"
+            # The partial rows are no longer needed once the outputs are written
+            os.remove(partial)
 
-                res.to_csv(out_path)
-                print(x,'end')
+    progress_logger.info('%s ends', x)
 
-    else :
-        print(x,'ended without result.')
+
+def loocv_settlements(x):
+    # Unpack the input tuple and validate the single indicator
+    country, year, indicator = x
+    loocv_settlements_indicators((country, year), [indicator])
 
 
 def rmse_loocv_settlements(x):
@@ -3681,6 +6913,422 @@ def settlements_indicators_to_csv(x):
     return False
 
 
+def settlement_pixel_matrix(raster, shapes, touched=True):
+    """
+    Builds the sparse (settlements x pixels) membership matrix of the settlement polygons on a raster grid.
+
+    The pixels of each settlement are the ones selected by rasterio.mask.mask in average_raster_within_shape
+    and aggregate_raster_within_shape, so that products with this matrix reproduce those per-polygon reads.
+
+    Args:
+        raster (DatasetReader): Open raster defining the grid.
+        shapes (list): List of settlement geometries.
+        touched (bool): Whether to include all pixels touched by a settlement.
+
+    Returns:
+        members (scipy.sparse.csr_matrix): Matrix with a one for every (settlement, flattened pixel index) pair.
+    """
+    height, width = raster.height, raster.width
+    indices, counts = [], []
+
+    for shapei in shapes:
+        try:
+            # Mask of the settlement on the window covering it (True outside the settlement)
+            mask, _, window = rasterio.mask.raster_geometry_mask(raster, [shapei], all_touched=touched, crop=True)
+        except ValueError:
+            # The settlement does not overlap the raster
+            counts.append(0)
+            continue
+
+        rows, cols = np.nonzero(~mask)
+        rows, cols = rows + int(window.row_off), cols + int(window.col_off)
+
+        # Keep the pixels that are inside the raster
+        inside = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+        indices.append(rows[inside] * width + cols[inside])
+        counts.append(int(np.sum(inside)))
+
+    indices = np.concatenate(indices) if len(indices) > 0 else np.zeros(0, dtype=np.int64)
+    indptr = np.concatenate([[0], np.cumsum(counts)])
+
+    return sparse.csr_matrix((np.ones(len(indices)), indices, indptr), shape=(len(shapes), height * width))
+
+
+def settlement_pixel_matrix_path(country, year, path_to_raster, path_to_settlements_shapefile):
+    # Obtain the country code
+    code, CODE = get_country_alpha3_code(country)
+
+    # Identify the raster and the settlements by their path, size and modification time
+    key = ''
+    for path in [path_to_raster, path_to_settlements_shapefile]:
+        stat = os.stat(path)
+        key += f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}:"
+    key = hashlib.sha1(key.encode()).hexdigest()[:16]
+
+    return f"{data_root}{country}/{year}/lidw/{code}_{year}_settlement_pixels_{key}.npz"
+
+
+def settlement_members(country, year, path_to_raster, path_to_settlements_shapefile, shapes, use_cache=True):
+    """
+    Returns the settlement membership matrix of a raster grid, from the cache when it exists.
+
+    Args:
+        country (str): Country name.
+        year (str): Survey year.
+        path_to_raster (str): Path to the raster defining the grid.
+        path_to_settlements_shapefile (str): Path to the settlements shapefile.
+        shapes (list): List of settlement geometries read from the shapefile.
+        use_cache (bool): Whether to read and write the cached matrix.
+
+    Returns:
+        members (scipy.sparse.csr_matrix): Matrix as returned by settlement_pixel_matrix.
+    """
+    path = settlement_pixel_matrix_path(country, year, path_to_raster, path_to_settlements_shapefile)
+
+    # Reuse the cached matrix when it was already computed for this grid and these settlements
+    if use_cache and os.path.exists(path):
+        return sparse.load_npz(path)
+
+    with rasterio.open(path_to_raster) as raster:
+        members = settlement_pixel_matrix(raster, shapes)
+
+    if use_cache:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        sparse.save_npz(path, members)
+
+    return members
+
+
+def settlement_lidw_averages(operator, members, values):
+    """
+    Averages the LIDW estimates of several indicators within every settlement without writing rasters.
+
+    As in average_raster_within_shape, the average of a settlement is taken over its pixels with a
+    positive estimate, and is zero for settlements without such pixels.
+
+    Args:
+        operator (dict): LIDW operator as returned by lidw_operator.
+        members (scipy.sparse.csr_matrix): Settlement membership matrix on the grid of the operator.
+        values (numpy.ndarray): Indicator values, one column per indicator and one row per cluster.
+
+    Returns:
+        averages (numpy.ndarray): Array of shape (settlements, indicators) with the settlement averages.
+    """
+    # Estimates of all indicators on the pixels of the operator, rounded as in the float32 rasters
+    estimates = (operator['matrix'] @ np.asarray(values, dtype=float)).astype(np.float32).astype(float)
+
+    # Restrict the membership matrix to the pixels of the operator
+    settlement_weights = members[:, operator['rows'] * operator['shape'][1] + operator['cols']]
+
+    # Sum and number of the positive estimates within every settlement
+    total = settlement_weights @ np.where(estimates > 0.0, estimates, 0.0)
+    count = settlement_weights @ (estimates > 0.0).astype(float)
+
+    return np.divide(total, count, out=np.zeros_like(total), where=count > 0)
+
+
+def settlement_cluster_matrix(operator, members, pixels=None):
+    """
+    Builds the sparse (settlements x clusters) matrix that maps cluster values to the settlement averages.
+
+    Row s holds the LIDW weights of the pixels of settlement s averaged over those pixels, so that the
+    product with the cluster values is the average of the pixel estimates within the settlement. With
+    pixels set to the pixels of positive estimate of an indicator, as averaged by settlement_lidw_averages,
+    the product with the values of that indicator is its settlement average.
+
+    Args:
+        operator (dict): LIDW operator as returned by lidw_operator.
+        members (scipy.sparse.csr_matrix): Settlement membership matrix on the grid of the operator.
+        pixels (numpy.ndarray): Boolean mask of the rows of the operator to average; all rows when None.
+
+    Returns:
+        weights (scipy.sparse.csr_matrix): Matrix whose rows sum to one (zero for settlements without pixels).
+    """
+    matrix = operator['matrix']
+    flat = operator['rows'] * operator['shape'][1] + operator['cols']
+    if pixels is not None:
+        matrix, flat = matrix[pixels], flat[pixels]
+
+    # Restrict the membership matrix to the pixels
+    settlement_weights = members[:, flat]
+
+    # Sum of the pixel weights of every settlement, divided by its number of pixels
+    count = np.asarray(settlement_weights.sum(axis=1)).ravel()
+    scale = np.divide(1.0, count, out=np.zeros_like(count), where=count > 0)
+
+    return sparse.csr_matrix(sparse.diags(scale) @ (settlement_weights @ matrix))
+
+
+def settlement_cluster_matrix_path(country, year, df, path_to_raster, path_to_settlements_shapefile, pixels=None):
+    # Obtain the country code
+    code, CODE = get_country_alpha3_code(country)
+
+    # Identify the matrix by the operator of the cluster set and the membership of the settlements
+    key = lidw_operator_path(country, year, df, path_to_raster)
+    key += settlement_pixel_matrix_path(country, year, path_to_raster, path_to_settlements_shapefile)
+
+    # A matrix averaging only some pixels is also identified by them
+    if pixels is not None and not np.all(pixels):
+        key += hashlib.sha1(np.packbits(pixels).tobytes()).hexdigest()
+    key = hashlib.sha1(key.encode()).hexdigest()[:16]
+
+    return f"{data_root}{country}/{year}/lidw/{code}_{year}_settlement_clusters_{key}.npz"
+
+
+def settlement_cluster_weights(country, year, df, operator, members, path_to_settlements_shapefile, use_cache=True,
+                               pixels=None):
+    """
+    Returns the settlements x clusters matrix of a cluster set, from the cache when it exists.
+
+    Args:
+        country (str): Country name.
+        year (str): Survey year.
+        df (DataFrame): DHS cluster data the operator was built from.
+        operator (dict): LIDW operator of the cluster set, as returned by lidw_operator.
+        members (scipy.sparse.csr_matrix): Settlement membership matrix on the grid of the operator.
+        path_to_settlements_shapefile (str): Path to the settlements shapefile.
+        use_cache (bool): Whether to read and write the cached matrix.
+        pixels (numpy.ndarray): Boolean mask of the rows of the operator to average; all rows when None.
+
+    Returns:
+        weights (scipy.sparse.csr_matrix): Matrix as returned by settlement_cluster_matrix.
+    """
+    path = settlement_cluster_matrix_path(country, year, df, population_raster(country, year),
+                                          path_to_settlements_shapefile, pixels)
+
+    # Reuse the cached matrix when it was already computed for this cluster set and these settlements
+    if use_cache and os.path.exists(path):
+        return sparse.load_npz(path)
+
+    weights = settlement_cluster_matrix(operator, members, pixels)
+
+    if use_cache:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        sparse.save_npz(path, weights)
+
+    return weights
+
+
+def bootstrap_cluster_counts(num_clusters, num_samples=1000, seed=0, strata=None):
+    """
+    Draws the number of times every DHS cluster is selected in each bootstrap resample of the survey.
+
+    Args:
+        num_clusters (int): Number of clusters.
+        num_samples (int): Number of resamples.
+        seed (int): Seed of the resampling.
+        strata (array-like): Stratum of every cluster (e.g. URBAN_RURA); clusters are resampled within
+            their stratum, keeping the stratum sizes, when given.
+
+    Returns:
+        counts (numpy.ndarray): Array of shape (clusters, resamples) with the selection counts.
+    """
+    rng = np.random.default_rng(seed)
+    strata = np.zeros(num_clusters, dtype=int) if strata is None else np.asarray(strata)
+
+    counts = np.zeros((num_clusters, num_samples), dtype=np.int32)
+    for stratum in pd.unique(strata):
+        rows = np.flatnonzero(strata == stratum)
+        counts[rows] = rng.multinomial(len(rows), np.full(len(rows), 1.0 / len(rows)), size=num_samples).T
+
+    return counts
+
+
+def bootstrap_settlement_estimates(weights, values, counts, chunk_size=100, confidence=0.95,
+                                   settlement_chunk_size=10000):
+    """
+    Percentile bootstrap intervals of the settlement averages of one indicator.
+
+    The LIDW weights are kept fixed and every resample reweights the clusters by their selection counts,
+    so the estimate of a settlement is sum(w * c * v) / sum(w * c); without resampling (all counts one)
+    it is the settlement average. The settlements are processed in chunks, and the numerators and
+    denominators of a chunk of resamples come from a single sparse matrix product. Memory is bounded by
+    the settlement_chunk_size x resamples replicates of a chunk of settlements (nanpercentile makes one
+    copy of them) and one clusters x chunk_size block of counts, whatever the number of settlements.
+
+    Args:
+        weights (scipy.sparse.csr_matrix): Settlements x clusters matrix as returned by settlement_cluster_weights.
+        values (numpy.ndarray): Indicator values of the clusters.
+        counts (numpy.ndarray): Selection counts as returned by bootstrap_cluster_counts.
+        chunk_size (int): Number of resamples per product.
+        confidence (float): Confidence level of the intervals.
+        settlement_chunk_size (int): Number of settlements whose replicates are held at once.
+
+    Returns:
+        low (numpy.ndarray): Lower bound of every settlement.
+        high (numpy.ndarray): Upper bound of every settlement.
+        error (numpy.ndarray): Bootstrap standard error of every settlement.
+    """
+    values = np.asarray(values, dtype=float)
+    num_settlements, num_samples = weights.shape[0], counts.shape[1]
+    low, high, error = np.zeros(num_settlements), np.zeros(num_settlements), np.zeros(num_settlements)
+
+    for first in range(0, num_settlements, settlement_chunk_size):
+        block = weights[first:first + settlement_chunk_size]
+        replicates = np.empty((block.shape[0], num_samples), dtype=np.float32)
+
+        for start in range(0, num_samples, chunk_size):
+            chunk = counts[:, start:start + chunk_size].astype(float)
+            width = chunk.shape[1]
+
+            # Numerators and denominators of the chunk in one product
+            product = block @ np.hstack([chunk * values[:, None], chunk])
+            numerator, denominator = product[:, :width], product[:, width:]
+
+            # Settlements whose clusters were all left out of a resample have no estimate in it
+            replicates[:, start:start + width] = np.divide(numerator, denominator,
+                                                           out=np.full_like(numerator, np.nan), where=denominator > 0)
+
+        # Settlements without pixels get the zero estimate of settlement_lidw_averages
+        replicates[np.diff(block.indptr) == 0] = 0.0
+
+        settlements = slice(first, first + block.shape[0])
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            low[settlements], high[settlements] = np.nanpercentile(replicates, [50 * (1 - confidence),
+                                                                                50 * (1 + confidence)], axis=1)
+            error[settlements] = np.nanstd(replicates, axis=1)
+
+    return low, high, error
+
+
+def settlement_lidw_indicators_to_csv(x, indicators=None, write_rasters=False, use_cache=True, num_bootstrap=0,
+                                      stratify=False, seed=0, chunk_size=100, confidence=0.95):
+    """
+    Writes the settlement x indicator table of settlements_indicators_to_csv directly from the LIDW operators.
+
+    The settlement averages come from sparse products of the cached LIDW operators with the settlement
+    membership matrix, so the indicator rasters are not needed; they are written only when requested.
+
+    In bootstrap mode, the DHS clusters are also resampled num_bootstrap times (within URBAN_RURA strata
+    when stratify is True) and the percentile intervals and standard errors of every settlement are
+    written to {code}_sett_indic_boot.csv (see bootstrap_settlement_estimates).
+
+    Args:
+        x (tuple): Country and year.
+        indicators (list): List of indicators, read_list_of_indicators() when None.
+        write_rasters (bool): Whether to also write the indicator rasters.
+        use_cache (bool): Whether to read and write the cached operators and membership matrices.
+        num_bootstrap (int): Number of bootstrap resamples (no bootstrap when 0).
+        stratify (bool): Whether to resample the clusters within their URBAN_RURA stratum.
+        seed (int): Seed of the resampling.
+        chunk_size (int): Number of resamples per matrix product.
+        confidence (float): Confidence level of the bootstrap intervals.
+
+    Returns:
+        success (bool): Whether the table was written.
+    """
+    try:
+        country, year = x
+        settlement_year = nearest_settlement_year(year)
+        code, CODE = get_country_alpha3_code(country)
+
+        path_to_settlements_shapefile = settlements_shapefile(country, str(settlement_year))
+        if path_to_settlements_shapefile is None:
+            raise FileNotFoundError(f"Settlement shapefile not found for {country}, year {year}")
+
+        path_to_population_raster = ghs_population_raster(country, year, str(settlement_year))
+        if path_to_population_raster is None:
+            raise FileNotFoundError(f"Population raster not found for {country}, year {year}")
+
+        if indicators is None:
+            indicators = read_list_of_indicators()
+
+        # The rasters are optional outputs, they reuse the cached operators
+        if write_rasters:
+            local_inverse_distance_weighting_interpolation((country, year, indicators), use_cache=use_cache)
+
+        with fiona.open(path_to_settlements_shapefile, "r") as shapefile:
+            shapes = [shape(feature["geometry"]) for feature in shapefile]
+
+        # Population of the settlements
+        with rasterio.open(path_to_population_raster) as src:
+            data = src.read(1)
+            data[data < 0] = 0
+            total_population = np.sum(data)
+
+        members = settlement_members(country, year, path_to_population_raster, path_to_settlements_shapefile,
+                                     shapes, use_cache=use_cache)
+        sett_pop = members @ data.ravel().astype(float)
+
+        # Indicators without any valid cluster get -1, as missing rasters do in settlements_indicators_to_csv
+        sett_indicator = np.full((len(shapes), len(indicators)), -1.0)
+        sett_bootstrap = np.full((3, len(shapes), len(indicators)), -1.0)
+
+        # Read the DHS clusters once for all indicators
+        df = pd.read_csv(dhs_csv_file(country, year))
+        columns = ['cluster'] + indicators + ['LNG', 'LAT'] + (['URBAN_RURA'] if stratify else [])
+        df = removing_spurious_data(df[columns])
+        groups = [(mask, group) for mask, group in valid_cluster_groups(df, indicators) if np.any(mask)]
+
+        # The same resamples of the survey clusters are used for all indicators
+        if num_bootstrap > 0:
+            counts = bootstrap_cluster_counts(len(df), num_bootstrap, seed, df['URBAN_RURA'] if stratify else None)
+
+        if len(groups) > 0:
+            country_shape = gpd.read_file(country_shapefile(country))
+
+            # The settlement membership on the grid of the LIDW operators
+            path_to_lidw_raster = population_raster(country, year)
+            lidw_members = members if os.path.abspath(path_to_lidw_raster) == os.path.abspath(path_to_population_raster) \
+                else settlement_members(country, year, path_to_lidw_raster, path_to_settlements_shapefile, shapes,
+                                        use_cache=use_cache)
+
+            for mask, group in groups:
+                # One operator and one product for all indicators sharing the same clusters
+                operator = lidw_operator(country, year, df[mask], country_shape, use_cache=use_cache)
+                averages = settlement_lidw_averages(operator, lidw_members, df[mask][group].to_numpy(dtype=float))
+                for j, indicator in enumerate(group):
+                    sett_indicator[:, indicators.index(indicator)] = averages[:, j]
+
+                if num_bootstrap > 0:
+                    for indicator in group:
+                        # Average the pixels of positive estimate, as settlement_lidw_averages does
+                        values = df[mask][indicator].to_numpy(dtype=float)
+                        positive = (operator['matrix'] @ values).astype(np.float32) > 0.0
+
+                        # Cached settlements x clusters matrix, shared by the indicators with the same pixels
+                        weights = settlement_cluster_weights(country, year, df[mask], operator, lidw_members,
+                                                             path_to_settlements_shapefile, use_cache=use_cache,
+                                                             pixels=positive)
+                        sett_bootstrap[:, :, indicators.index(indicator)] = bootstrap_settlement_estimates(
+                            weights, values, counts[mask], chunk_size, confidence)
+
+        res = pd.DataFrame()
+        res['SETT_CODE'] = [f"{CODE}{str(s).zfill(6)}" for s in range(len(shapes))]
+        res['SETT_POP'] = sett_pop
+        res['SETT_FRAC'] = sett_pop / total_population
+
+        for i, indicator in enumerate(indicators):
+            res[indicator[4:].upper()] = sett_indicator[:, i]
+
+        subfolder = f"{result_root}/{country}/{year}/"
+        if not os.path.exists(subfolder):
+            os.makedirs(subfolder)
+
+        output_file = f"{subfolder}{code}_sett_indic.csv"
+        res.to_csv(output_file)
+
+        if num_bootstrap > 0:
+            boot = pd.DataFrame()
+            boot['SETT_CODE'] = res['SETT_CODE']
+            for i, indicator in enumerate(indicators):
+                INDIC = indicator[4:].upper()
+                boot[f"{INDIC}_LO"], boot[f"{INDIC}_HI"], boot[f"{INDIC}_SE"] = sett_bootstrap[:, :, i]
+            boot.to_csv(f"{subfolder}{code}_sett_indic_boot.csv")
+
+        print(f"Successfully processed {country} for year {year}")
+        return True
+
+    except FileNotFoundError as e:
+        print(f"Skipping {country} for year {year}: {str(e)}")
+
+    except Exception as e:
+        print(f"Error processing {country} for year {year}: {str(e)}")
+
+    return False
+
+
 def add_properties_with_values_to_new_shapefile(shapefile_path, modified_shapefile_path, properties_with_values):
     # Open the existing shapefile to read
     with fiona.open(shapefile_path, 'r') as src:
@@ -3985,19 +7633,8 @@ def generate_geotiff_from_shapefile(shapefile_path, reference_geotiff_path, attr
         dtype=dtype
     )
 
-    # Write the raster to a new GeoTIFF file
-    with rasterio.open(
-        output_geotiff_path,
-        'w',
-        driver='GTiff',
-        height=out_shape[0],
-        width=out_shape[1],
-        count=1,
-        dtype=dtype,
-        crs=crs,
-        transform=transform
-    ) as dst:
-        dst.write(raster, 1)
+    # Write the raster to a new GeoTIFF file (the overviews keep the attribute values)
+    write_geotiff(output_geotiff_path, raster, transform, nodata=-9999, dtype=dtype, crs=crs, resampling='nearest')
 
 def calculate_difference(list1, list2):
     differences = [x - y for x, y in zip(list1, list2)]
@@ -4181,80 +7818,25 @@ def error_analysis_network_level_utazi():
         # dhs_path = data_root + country + '/' + year + '/' + country + '_DHS_' + year + '.csv'
         dhs_path = f"{data_root}{country}/{year}/{country}_DHS_{year}.csv"
 
-        # indic_path = result_root + country + '/' + year + '/validation/'+CODE + '_VAL2_' + indicator_name + '_' + year + '.csv'
-        indic_path = f"{result_root}{country}/{year}/validation/{CODE}_VAL2_{indicator_name}_{year}.csv"
-
         # Read DHS data for the given country and year
         dhs = pd.read_csv(dhs_path)
         tot_clust = len(dhs.index)  # Total number of clusters
 
-        # Initialize empty lists to store indicator-wise metrics
-        COUNTRY, BIAS, MAE, RMSE, P95, RATIO, TOT_CLUST, NUM_CLUST = [], [], [], [], [], [], [], []
-
-        # Collect indicator files in the 'validation' directory
-        indicators = [indic_path]
-
-
-
-        # Loop through each indicator file
-        for indicator in indicators:
-            df = pd.read_csv(indicator)  # Read the indicator validation data
-
-            # Initialize metrics as NaN (Not a Number)
-            bias, mae, rmse, p95, ratio = np.nan, np.nan, np.nan, np.nan, np.nan
-
-            name = indicator[len(indic_path) + 1 + 13:-9]  # Extract indicator name from the path
-
-            num_clust = len(df.index)  # Number of clusters in the validation data
-
-            if num_clust > 0:
-                vac_dhs = df['DHS_VAL'].to_numpy()  # True DHS values
-                vac_pred = df['PRED_VAL'].to_numpy()  # Predicted values
-                vac_std = df['VAL_STD'].to_numpy()  # Standard deviations of predicted values
-
-                err = vac_pred - vac_dhs #vac_dhs - vac_pred  # Calculate errors
-
-                rmse = np.sqrt(np.sum(err ** 2) / len(err))  # Calculate RMSE
-                rmse = np.round(rmse, 3)
-
-                # Calculate the percentage of predictions within 95% confidence interval
-                p95 = sum([1 for vr, vp, vs in zip(vac_dhs, vac_pred, vac_std)
-                           if vp - 1.96 * vs <= vr <= vp + 1.96 * vs]) / len(err)
-                p95 = np.round(p95, 3) * 100
-
-                mae = np.mean(abs(err))  # Calculate MAE
-                mae = np.round(mae, 3)
-
-                av = np.mean(vac_dhs)  # Mean of true DHS values
-                bias = np.mean(err)  # Calculate bias
-                bias = np.round(bias, 4)
-
-                ratio = np.nan
-
-                if av > 0 : #np.mean(vac_pred) > 0:
-                    ratio = np.mean(vac_pred) / av #/ np.mean(vac_pred)  # Calculate ratio of mean values
-                    ratio = np.round(ratio, 3)
-
-            # Append metrics to respective lists
-            COUNTRY.append(country)
-            TOT_CLUST.append(tot_clust)
-            NUM_CLUST.append(num_clust)
-            BIAS.append(bias)
-            MAE.append(mae)
-            RMSE.append(rmse)
-            P95.append(p95)
-            RATIO.append(ratio)
+        # Metrics of the leave-one-out predictions
+        frame = network_validation_frame(country, year, indicator_name)
+        metrics = error_metrics(frame['OBS'], frame['PRED'], frame['STD']) if frame is not None else \
+            error_metrics([], [])
 
         # Create a DataFrame to store the results
         res = pd.DataFrame()
-        res['COUNTRY'] = COUNTRY
-        res['TOT_CLUST'] = TOT_CLUST
-        res['NUM_CLUST'] = NUM_CLUST
-        res['BIAS'] = BIAS
-        res['RATIO'] = RATIO
-        res['MAE'] = MAE
-        res['RMSE'] = RMSE
-        res['P95'] = P95
+        res['COUNTRY'] = [country]
+        res['TOT_CLUST'] = [tot_clust]
+        res['NUM_CLUST'] = [metrics['N']]
+        res['BIAS'] = [np.round(metrics['BIAS'], 4)]
+        res['RATIO'] = [np.round(metrics['RATIO'], 3)]
+        res['MAE'] = [np.round(metrics['MAE'], 3)]
+        res['RMSE'] = [np.round(metrics['RMSE'], 3)]
+        res['P95'] = [np.round(metrics['P95'], 1)]
 
         # Define the output path for the summary CSV file
         output_path = result_root + country + '/' + year + '/' + CODE + '_VAL2_UTAZI'
@@ -4301,42 +7883,14 @@ def local_inverse_distance_weighting_interpolation_10(x):
 
         country_shape = gpd.read_file(path_to_shapefile)
 
-        locations = dhs_cluster_locations(df)
-
-        regions = voronoi_regions(locations, country_shape)
+        # Build the LIDW operator of the retained clusters (not cached: every subsample is different)
+        operator = lidw_operator(country, year, df, country_shape, use_cache=False)
 
-        net = dhs_clusters_network(regions, self_loop=True)
+        grid = apply_lidw_operator(operator, indicator_percentages)
 
         path_to_population_raster = population_raster(country, year)
 
         raster = rasterio.open(path_to_population_raster)
-        band = raster.read(1)
-
-        height = raster.height
-        width = raster.width
-        nodata = raster.nodata
-
-        known_pixels = [raster.index(x, y) for x, y in locations]
-
-        grid = np.full((height, width), -9999.0, dtype=float)
-
-        for e, p in zip(known_pixels, indicator_percentages):
-            grid[e[0], e[1]] = p
-
-        for i in range(height):
-            for j in range(width):
-                if grid[i, j] < 0.0 and band[i, j] > 0.0:
-                    loc = raster.xy(i, j)
-                    point = Point(loc)
-
-                    for k in range(len(regions)):
-                        polygon = regions[k][0]
-                        if point.within(polygon):
-                            weight = [1.0 / distance(loc, regions[a][1]) for a in net[k]]
-                            predict = [indicator_percentages[regions[a][2]] * w / sum(weight)
-                                       for a, w in zip(net[k], weight)]
-                            grid[i, j] = sum(predict)
-                            break
 
         # subfolder = result_root + country + '/' + year + '/tiff/kfold_valid/'
         subfolder = f"{result_root}{country}/{year}/tiff/kfold_valid/"
@@ -4348,18 +7902,7 @@ def local_inverse_distance_weighting_interpolation_10(x):
         # output_path = subfolder + code + '_' + year + '_idw_' + indicator[4:]+ '_'+str(number) + '.tif'
         output_path = f"{subfolder}{code}_{year}_idw_{indicator[4:]}_{number}.tif"
 
-        with rasterio.open(
-            output_path, 'w',
-            driver='GTiff',
-            dtype=rasterio.float32,
-            count=1,
-            width=width,
-            height=height,
-            nodata=-9999,
-            crs='+proj=latlong',
-            transform=raster.transform
-        ) as dst:
-            dst.write(grid, indexes=1)
+        write_geotiff(output_path, grid, raster.transform)
 
         print(x,'  end')
 
@@ -5145,11 +8688,10 @@ def validation1_for_prediction_by_settlements_network(y):
                                                    sum([page_rank[r] for r in regs])
 
             # Compute metrics
-            rmsd[idx] = np.sqrt(np.mean([(settlement_estimation[key] - dhs_estimation_dict[key])**2 for key in settlement_estimation]))
-            mad[idx] = np.mean([abs(settlement_estimation[key] - dhs_estimation_dict[key]) for key in settlement_estimation])
-            bias[idx] = np.mean([settlement_estimation[key] - dhs_estimation_dict[key] for key in settlement_estimation])
-            ratio[idx] = np.mean([settlement_estimation[key] for key in settlement_estimation]) / \
-                         np.mean([dhs_estimation_dict[key] for key in settlement_estimation])
+            metrics = error_metrics([dhs_estimation_dict[key] for key in settlement_estimation],
+                                    [settlement_estimation[key] for key in settlement_estimation])
+            rmsd[idx], mad[idx], bias[idx], ratio[idx] = metrics['RMSE'], metrics['MAE'], metrics['BIAS'], \
+                metrics['RATIO']
 
     # Store results in a dataframe
     res['INDICATOR'] = name
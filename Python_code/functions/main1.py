@@ -31,11 +31,26 @@ def main():
 
     inputs = []
 
+    # One job per country-year: all indicators are interpolated in a single pass
     for country, year in country_year:
-        inputs += [(country, year, indicator) for indicator in indicators]
+        inputs.append((country, year, indicators))
+
+    # Tiles of at most 1024 x 1024 pixels keep the memory per worker bounded
+    tile_budget = 1024 * 1024
+
+    # Rasters of a few tiles gain little from splitting into row bands, so they run side by side with one
+    # country-year per core; larger rasters run one after another with their row bands split over all cores,
+    # so that a large country is not left as a single serial straggler
+    small, large = [], []
+    for x in inputs:
+        with rasterio.open(population_raster(x[0], x[1])) as raster:
+            (small if raster.width * raster.height <= 4 * tile_budget else large).append(x)
 
     with multiprocessing.Pool(processes=os.cpu_count()) as pool:
-        outputs = pool.map(local_inverse_distance_weighting_interpolation, inputs)
+        outputs = pool.map(partial(local_inverse_distance_weighting_interpolation, tile_budget=tile_budget), small)
+
+    for x in large:
+        local_inverse_distance_weighting_interpolation(x, tile_budget=tile_budget, processes=os.cpu_count())
 
 
 if __name__ == "__main__":
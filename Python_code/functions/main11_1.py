@@ -0,0 +1,40 @@
+"""
+# Project: This code is part of the manuscript "SEEDNet: A covariate-free multi-country settlement-level database of epidemiological estimates for network analysis"
+# Manuscript authors: Amir Hossein Darooneh, Jean-Luc Kortenaar, Celine Goulart, Katie McLaughlin, Sean Cornelius, and Diego G. Bassani
+# Suggested citation: Darooneh, A.H., et al. SEEDNet: A covariate-free multi-country settlement-level database of epidemiological estimates for network analysis. (2024)
+# Program: Python functions for estimation, validation and results
+# Author: Darooneh, A.H., The Hospital for Sick Children
+# Date Created: 2024-06-19
+# Last Updated:  2024-07-29
+# Description: Functions for settlement identification, LIDW estimation and validation of estimates
+# ###################
+# Attributions:
+# List any attributions
+# ###################
+"""
+
+import warnings
+warnings.filterwarnings('ignore')
+
+from lidw_functions import *
+
+
+###################################################################################################
+###################################################################################################
+
+def main():
+
+    # Metrics and bootstrap confidence intervals of every validation output (network, settlement, ADM1, ADM2,
+    # settlement LOOCV, k-fold and spatial blocks) of all country-years, in one pass. The per-level tables of
+    # main4.py, main6.py, main8.py and main10.py are still written by those scripts, with the same metrics.
+    metrics = validation_summary_tables(num_samples=1000, seed=0)
+
+    print(f"{len(metrics)} validation summaries written to {result_root}VALIDATION_METRICS.csv")
+
+
+if __name__ == "__main__":
+    main()
+
+
+
+
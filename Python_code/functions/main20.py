@@ -25,19 +25,14 @@ from lidw_functions import *
 ###################################################################################################
 
 def main():
-    indicators = read_list_of_indicators()
+    # Progress of the runs (settlements per second and remaining time), also set up in every worker
+    configure_progress_logging()
 
     country_year = read_list_of_country_years()
 
-    inputs = []
-
-    for indicator in indicators:
-
-        for country, year in country_year:
-            inputs.append((country, year, indicator))
-
-    with multiprocessing.Pool(processes=os.cpu_count()) as pool:
-        outputs = pool.map(loocv_settlements, inputs)
+    # One job per country-year, validating all the indicators of the survey at once
+    with multiprocessing.Pool(processes=os.cpu_count(), initializer=configure_progress_logging) as pool:
+        outputs = pool.map(loocv_settlements_indicators, country_year)
 
 
 if __name__ == "__main__":
@@ -21,8 +21,9 @@ from lidw_functions import *
 
 def main():
     country_year = read_list_of_country_years()
+    # The settlement table comes directly from the cached LIDW operators, without reading the indicator rasters
     for x in country_year:
-        settlements_indicators_to_csv(x)
+        settlement_lidw_indicators_to_csv(x)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,31 @@
+"""
+# Project: This code is part of the manuscript "SEEDNet: A covariate-free multi-country settlement-level database of epidemiological estimates for network analysis"
+# Manuscript authors: Amir Hossein Darooneh, Jean-Luc Kortenaar, Celine Goulart, Katie McLaughlin, Sean Cornelius, and Diego G. Bassani
+# Suggested citation: Darooneh, A.H., et al. SEEDNet: A covariate-free multi-country settlement-level database of epidemiological estimates for network analysis. (2024)
+# Program: Python functions for estimation, validation and results
+# Author: Darooneh, A.H., The Hospital for Sick Children
+# Date Created: 2024-06-19
+# Last Updated:  2024-07-29
+# Description: Functions for settlement identification, LIDW estimation and validation of estimates
+# ###################
+# Attributions:
+# List any attributions
+# ###################
+"""
+import os
+from lidw_functions import *
+
+###################################################################################################
+###################################################################################################
+
+
+def main():
+    country_year = read_list_of_country_years()
+    # Settlement table with 95% bootstrap intervals of the estimates, resampling the DHS clusters within
+    # their urban/rural stratum, from the cached settlements x clusters weights
+    for x in country_year:
+        settlement_lidw_indicators_to_csv(x, num_bootstrap=1000, stratify=True, seed=0)
+
+
+if __name__ == "__main__":
+    main()
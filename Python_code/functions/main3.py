@@ -30,19 +30,11 @@ from lidw_functions import *
 
 def main():
 
-    indicators=read_list_of_indicators()
-
     country_year = read_list_of_country_years()
 
-    inputs = []
-
-    for indicator in indicators :
-
-        inputs += [(country,year,indicator) for country,year in country_year ]
-
-
+    # One job per country-year, validating all the indicators of the survey at once
     with multiprocessing.Pool(processes=os.cpu_count()) as pool:
-        outputs=pool.map(validation_network_level, inputs)
+        outputs=pool.map(validation_network_level_indicators, country_year)
 
 
 
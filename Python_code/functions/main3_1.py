@@ -25,13 +25,16 @@ from lidw_functions import *
 ###################################################################################################
 
 def main():
+    # Progress of the runs (clusters per second and remaining time), also set up in every worker
+    configure_progress_logging()
+
     inputs = [('Cambodia', '2014', 'cov_ch_meas_either_u5'),
 
               ('Mozambique', '2011', 'cov_ch_meas_either_u5'),
 
               ('Nigeria', '2013', 'cov_ch_meas_either_u5')]
 
-    with multiprocessing.Pool(processes=os.cpu_count()) as pool:
+    with multiprocessing.Pool(processes=os.cpu_count(), initializer=configure_progress_logging) as pool:
         outputs = pool.map(validation_network_level, inputs)
 
 
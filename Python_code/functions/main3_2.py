@@ -0,0 +1,43 @@
+"""
+# Project: This code is part of the manuscript "SEEDNet: A covariate-free multi-country settlement-level database of epidemiological estimates for network analysis"
+# Manuscript authors: Amir Hossein Darooneh, Jean-Luc Kortenaar, Celine Goulart, Katie McLaughlin, Sean Cornelius, and Diego G. Bassani
+# Suggested citation: Darooneh, A.H., et al. SEEDNet: A covariate-free multi-country settlement-level database of epidemiological estimates for network analysis. (2024)
+# Program: Python functions for estimation, validation and results
+# Author: Darooneh, A.H., The Hospital for Sick Children
+# Date Created: 2024-06-19
+# Last Updated:  2024-07-29
+# Description: Functions for settlement identification, LIDW estimation and validation of estimates
+# ###################
+# Attributions:
+# List any attributions
+# ###################
+"""
+
+import multiprocessing
+
+import warnings
+warnings.filterwarnings('ignore')
+
+from lidw_functions import *
+
+
+###################################################################################################
+###################################################################################################
+
+def main():
+    # Progress of the sweeps (indicators per second and remaining time), also set up in every worker
+    configure_progress_logging()
+
+    country_year = read_list_of_country_years()
+
+    # Compare the interpolation kernels and neighbourhood orders with the network-level LOOCV, one job per country-year
+    with multiprocessing.Pool(processes=os.cpu_count(), initializer=configure_progress_logging) as pool:
+        outputs = pool.map(lidw_kernel_sweep, country_year)
+
+    # Gather the errors of all country-years in one table
+    result = pd.concat(outputs, ignore_index=True)
+    result.to_csv(f"{result_root}kernel_sweep.csv", index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+# Project: This code is part of the manuscript "SEEDNet: A covariate-free multi-country settlement-level database of epidemiological estimates for network analysis"
+# Manuscript authors: Amir Hossein Darooneh, Jean-Luc Kortenaar, Celine Goulart, Katie McLaughlin, Sean Cornelius, and Diego G. Bassani
+# Suggested citation: Darooneh, A.H., et al. SEEDNet: A covariate-free multi-country settlement-level database of epidemiological estimates for network analysis. (2024)
+# Program: Python functions for estimation, validation and results
+# Author: Darooneh, A.H., The Hospital for Sick Children
+# Date Created: 2024-06-19
+# Last Updated:  2024-07-29
+# Description: Functions for settlement identification, LIDW estimation and validation of estimates
+# ###################
+# Attributions:
+# List any attributions
+# ###################
+"""
+
+import multiprocessing
+
+import warnings
+warnings.filterwarnings('ignore')
+
+from lidw_functions import *
+
+
+###################################################################################################
+###################################################################################################
+
+def main():
+
+    country_year = read_list_of_country_years()
+
+    dic_indic = dictionary_of_indicators()
+
+    # Spatially blocked cross-validation, holding out the GADM level-1 regions (for grid blocks of N km use
+    # partial(spatial_block_validation, block_km=N)), one job per country-year
+    with multiprocessing.Pool(processes=os.cpu_count()) as pool:
+        outputs = pool.map(spatial_block_validation, country_year)
+
+    # Gather the held-out clusters and settlements of all country-years in one table
+    result = pd.concat(outputs, ignore_index=True)
+    result.to_csv(f"{result_root}block_validation.csv", index=False)
+
+    # Errors of the predictions against the DHS values, at the cluster and the settlement levels
+    keys = ['COUNTRY', 'YEAR', 'INDICATOR', 'LEVEL']
+    summary = validation_metrics(result.rename(columns={'DHS_VAL': 'OBS', 'PRED_VAL': 'PRED'}).assign(STD=np.nan),
+                                 by=keys)
+    summary['INDICATOR'] = summary['INDICATOR'].map(dic_indic)
+
+    summary[keys + ['N', 'BIAS', 'RMSE', 'MAE', 'AE95']].to_csv(f"{result_root}block_validation_summary.csv",
+                                                                index=False)
+
+
+if __name__ == "__main__":
+    main()
+
+
+
+